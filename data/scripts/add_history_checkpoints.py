@@ -0,0 +1,15 @@
+# -*- coding: utf-8 -*-
+"""
+Build full text checkpoints for existing text history, so that text_at_revision() doesn't walk back from the current text.
+New checkpoints are added as text is saved.  Optionally takes a title, to limit the backfill to that text.
+"""
+import sys
+
+from sefaria.model.history import add_history_checkpoints
+
+
+if len(sys.argv) > 1:
+    count = add_history_checkpoints({"ref": {"$regex": u"^{}".format(sys.argv[1])}})
+else:
+    count = add_history_checkpoints()
+print "Wrote {} checkpoints".format(count)
@@ -0,0 +1,9 @@
+# -*- coding: utf-8 -*-
+"""
+Adds the section ref and url fragments to text history records logged before they were stored,
+so that the activity feed can collapse and link them without parsing refs.
+"""
+from sefaria.model.history import add_history_ref_fields, ensure_activity_indexes
+
+ensure_activity_indexes()
+print "Updated {} history records".format(add_history_ref_fields())
@@ -0,0 +1,15 @@
+# -*- coding: utf-8 -*-
+"""
+Set the indexable refAddresses field on links, and make sure it is indexed.
+Links saved through Link.save() maintain this field themselves.  Run once over existing links.
+"""
+import sys
+
+from sefaria.model.link import add_ref_addresses_to_links
+
+
+if len(sys.argv) > 1:
+    count = add_ref_addresses_to_links({"refs": {"$regex": u"^{}".format(sys.argv[1])}})
+else:
+    count = add_ref_addresses_to_links()
+print "Updated {} links".format(count)
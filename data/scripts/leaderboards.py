@@ -1,83 +1,46 @@
 # -*- coding: utf-8 -*-
+"""
+Brings leaderboards up to date: rolls the 1/7/30 day windows forward, and sets points for public source sheets.
+History points are added to leaderboards as history is saved (see sefaria/model/leaderboard.py).
+Run with --rebuild to recalculate them from the whole history collection.
+"""
+import sys
 from datetime import datetime, timedelta
 from collections import defaultdict
 
-from sefaria.history import make_leaderboard
+from sefaria.model.leaderboard import WINDOWS, rebuild_leaderboards, current_windows, set_sheet_points, ensure_leaderboard_indexes
 from sefaria.system.database import db
 
 # BANDAID for import issues from sheets.py
 LISTED_SHEETS = (3,4,7)
 
 
-def update_top_contributors(days=None):
+def update_sheet_points(collection, days=None):
     """
-    Calculate leaderboard scores for the past n 'days', or all time if 'days' is None.
-    Store in a collection named for the length of time.
-    Remove old scores.
+    Tally points for Public Source Sheets of the past n 'days', or all time if 'days' is None,
+    into the leaderboard 'collection'.
     """
-
+    query = {"status": {"$in": LISTED_SHEETS} }
     if days:
         cutoff = datetime.now() - timedelta(days)
-        #condition = { "date": { "$gt": cutoff }, "method": {"$ne": "API"} }
-        condition = { "date": { "$gt": cutoff } }
-        collection = "leaders_%d" % days
-    else:
-        cutoff = None
-        #condition = { "method": {"$ne": "API"} }
-        condition = {}
-        collection = "leaders_alltime"
-
-    leaders = make_leaderboard(condition)
-
-    oldtime = datetime.now()
-
-    # Tally points for Public Source Sheets
-    query = {"status": {"$in": LISTED_SHEETS} }
-    if cutoff:
         query["$or"] = [
             {"dateCreated": {"$gt": cutoff.isoformat()}},
             {"datePublished": {"$gt": cutoff.isoformat()}},
         ]
-    sheets = db.sheets.find(query)
+    sheets = db.sheets.find(query, {"owner": 1, "sources": 1})
     sheet_points = defaultdict(int)
     sheet_counts = defaultdict(int)
     for sheet in sheets:
         sheet_points[sheet["owner"]] += len(sheet["sources"]) * 50
         sheet_counts[sheet["owner"]] += 1
+    set_sheet_points(collection, dict(sheet_points), sheet_counts)
 
-    for l in leaders:
-        points = l["count"] + sheet_points[l["user"]]
-        del sheet_points[l["user"]]
-        if points:
-            doc = {
-                "_id":            l["user"],
-                "count":          points,
-                "translateCount": int(l["translateCount"]),
-                "editCount":      int(l["editCount"]),
-                "addCount":       int(l["addCount"]),
-                "noteCount":      int(l["noteCount"]),
-                "linkCount":      int(l["linkCount"]),
-                "reviewCount":    int(l["reviewCount"]),
-                "sheetCount":     sheet_counts[l["user"]],
-                "texts":          sorted(l["texts"], key=lambda key: -l["texts"][key]),
-                "date":           datetime.now()
-                }
-            db[collection].save(doc)
-    
-    # Add points for those who only have sheet points
-    for s in sheet_points.items():
-        if s[1]:
-            doc = {
-                "_id": s[0], 
-                "count": s[1],
-                "sheetCount": sheet_counts[s[0]], 
-                "date": datetime.now()}
-            db[collection].save(doc)
 
-    if cutoff:    
-        db[collection].remove({"date": {"$lt": oldtime }})
+ensure_leaderboard_indexes()
+if "--rebuild" in sys.argv or not db.leader_windows.count():
+    rebuild_leaderboards()
 
-update_top_contributors()
-update_top_contributors(1)
-update_top_contributors(7)
-update_top_contributors(30)
\ No newline at end of file
+current_windows()
+update_sheet_points("leaders_alltime")
+for days in WINDOWS:
+    update_sheet_points("leaders_%d" % days, days)
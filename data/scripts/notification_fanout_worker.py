@@ -0,0 +1,16 @@
+# -*- coding: utf-8 -*-
+"""
+Worker that writes queued notification fan-outs, such as notifying followers of a published sheet.
+Runs until stopped.  Run with --once to write the fan-outs queued now and exit.
+Any number of workers may run.  A fan-out left by a stopped worker is resumed by another.
+"""
+import sys
+
+from sefaria.model.notification import run_fanout_worker, process_fanouts, ensure_fanout_indexes
+
+
+if "--once" in sys.argv:
+    ensure_fanout_indexes()
+    print "Ran {} fan-outs".format(process_fanouts())
+else:
+    run_fanout_worker()
@@ -0,0 +1,16 @@
+# -*- coding: utf-8 -*-
+"""
+Collect the contributors of every segment of text from history, into the history_contributors collection.
+Text saves and reviews keep them current after this.  Optionally takes a title, to limit the rebuild to that text.
+"""
+import sys
+
+from sefaria.model.history import rebuild_contributors, ensure_contributor_indexes
+
+
+ensure_contributor_indexes()
+if len(sys.argv) > 1:
+    count = rebuild_contributors({"ref": {"$regex": u"^{}".format(sys.argv[1])}})
+else:
+    count = rebuild_contributors()
+print "Collected contributors of {} refs".format(count)
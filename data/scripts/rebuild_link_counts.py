@@ -0,0 +1,10 @@
+# -*- coding: utf-8 -*-
+"""
+Count the links between every pair of books, and store the counts in the link_counts collection.
+Link saves and deletes keep the counts current after this.  Run once, or to repair the counts.
+"""
+from sefaria.model.link import rebuild_link_counts
+
+
+count = rebuild_link_counts()
+print "Counted links for {} book pairs".format(count)
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+"""
+Build the merged sections of every text, in each language, into the merged_sections collection.
+Sections are otherwise built as they are first read, and rebuilt as Versions change.
+Optionally takes a title, to limit the rebuild to that text.
+"""
+import sys
+
+from sefaria.model import *
+from sefaria.model.text import rebuild_merged_sections, ensure_merged_sections_index
+from sefaria.system.database import db
+
+
+ensure_merged_sections_index()
+titles = [sys.argv[1]] if len(sys.argv) > 1 else db.texts.distinct("title")
+for i, title in enumerate(titles):
+    for lang in ["en", "he"]:
+        rebuild_merged_sections(title, lang)
+    print u"[{}/{}] {}".format(i + 1, len(titles), title)
@@ -0,0 +1,14 @@
+# -*- coding: utf-8 -*-
+"""
+Refresh the VersionState of every text, in parallel, then rebuild the summaries.
+Usage: refresh_all_states.py [--resume] [processes]
+With --resume, titles that were refreshed by the previous, interrupted run are skipped.
+"""
+import sys
+
+from sefaria.model.version_state import refresh_all_states
+from sefaria.settings import VSTATE_REFRESH_PROCESSES
+
+args = [a for a in sys.argv[1:] if a != "--resume"]
+processes = int(args[0]) if args else VSTATE_REFRESH_PROCESSES
+refresh_all_states(processes=processes, resume="--resume" in sys.argv)
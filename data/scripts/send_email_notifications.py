@@ -2,6 +2,7 @@
 """
 Send unread notifcations for users with a particular notificationg setting
 (daily, weekly, or all)
+Add --resume to continue a run that stopped, after the last batch of emails it sent.
 """
 import sys
 
@@ -11,4 +12,5 @@ if len(sys.argv) < 2 or sys.argv[1] not in ("all", "daily", "weekly"):
 	print "Please specify a timeframe for which notifications should be emailed."
 	print "Options are: 'all', 'daily', 'weekly'"
 else:
-	email_unread_notifications(sys.argv[1])
+	sent = email_unread_notifications(sys.argv[1], resume="--resume" in sys.argv)
+	print "Sent %d emails" % sent
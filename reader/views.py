@@ -1,6 +1,5 @@
 # noinspection PyUnresolvedReferences
 from datetime import datetime, timedelta
-from sets import Set
 from random import choice
 import json
 
@@ -17,14 +16,16 @@ from sefaria.client.wrapper import format_object_for_client, format_note_object_
 from sefaria.system.exceptions import InputError
 # noinspection PyUnresolvedReferences
 from sefaria.client.util import jsonResponse
-from sefaria.history import text_history, get_maximal_collapsed_activity, top_contributors, make_leaderboard, make_leaderboard_condition, text_at_revision
+from sefaria.history import text_history, get_maximal_collapsed_activity, top_contributors, make_leaderboard, make_leaderboard_condition, text_at_revision, activity_cursor, parse_activity_cursor
 from sefaria.system.decorators import catch_error_as_json, catch_error_as_http
 from sefaria.workflows import *
 from sefaria.reviews import *
 from sefaria.summaries import get_toc, flatten_toc, get_or_make_summary_node
 from sefaria.model import *
+from sefaria.model.history import get_contributors
+from sefaria.model.leaderboard import leader_texts
 from sefaria.sheets import LISTED_SHEETS, get_sheets_for_ref
-from sefaria.utils.users import user_link, user_started_text
+from sefaria.utils.users import user_link, user_started_text, user_details
 from sefaria.utils.util import list_depth
 from sefaria.utils.hebrew import hebrew_plural, hebrew_term
 from sefaria.utils.talmud import section_to_daf, daf_to_section
@@ -348,7 +349,7 @@ def search(request):
 def count_and_index(c_oref, c_lang, vtitle, to_count=1, to_index=1):
     # count available segments of text
     if to_count:
-        summaries.update_summaries_on_change(c_oref.book)
+        summaries.update_summaries_on_change(c_oref.book, changed_ref=c_oref)
 
     from sefaria.settings import SEARCH_INDEX_ON_SAVE
     if SEARCH_INDEX_ON_SAVE and to_index:
@@ -373,7 +374,7 @@ def texts_api(request, tref, lang=None, version=None):
         layer_name = request.GET.get("layer", None)
 
         #text = get_text(tref, version=version, lang=lang, commentary=commentary, context=context, pad=pad)
-        text = TextFamily(oref, version=version, lang=lang, commentary=commentary, context=context, pad=pad).contents()
+        text = TextFamily(oref, version=version, lang=lang, commentary=commentary, context=context, pad=pad, batched=commentary).contents()
 
         # Use a padded ref for calculating next and prev
         # TODO: what if pad is false and the ref is of an entire book?
@@ -921,50 +922,16 @@ def texts_history_api(request, tref, lang=None, version=None):
     if request.method != "GET":
         return jsonResponse({"error": "Unsuported HTTP method."})
 
-    tref = model.Ref(tref).normal()
-    refRe = '^%s$|^%s:' % (tref, tref)
-    if lang and version:
-        query = {"ref": {"$regex": refRe }, "language": lang, "version": version.replace("_", " ")}
-    else:
-        query = {"ref": {"$regex": refRe }}
-    history = db.history.find(query)
-
-    summary = {"copiers": Set(), "translators": Set(), "editors": Set(), "reviewers": Set() }
-    updated = history[0]["date"].isoformat() if history.count() else "Unknown"
-
-    for act in history:
-        if act["rev_type"].startswith("edit"):
-            summary["editors"].update([act["user"]])
-        elif act["rev_type"] == "review":
-            summary["reviewers"].update([act["user"]])
-        elif act["version"] == "Sefaria Community Translation":
-            summary["translators"].update([act["user"]])
-        else:
-            summary["copiers"].update([act["user"]])
-
-    # Don't list copiers and translators as editors as well
-    summary["editors"].difference_update(summary["copiers"])
-    summary["editors"].difference_update(summary["translators"])
+    oref = model.Ref(tref)
+    contributors = get_contributors(oref, lang, version.replace("_", " ") if version else None)
+    updated = contributors.pop("lastUpdated")
+    details = user_details(set().union(*contributors.values()))
 
-    for group in summary:
-        uids = list(summary[group])
-        names = []
-        for uid in uids:
-            try:
-                user = User.objects.get(id=uid)
-                name = "%s %s" % (user.first_name, user.last_name)
-                link = user_link(uid)
-            except User.DoesNotExist:
-                name = "Someone"
-                link = user_link(-1)
-            u = {
-                'name': name,
-                'link': link
-            }
-            names.append(u)
-        summary[group] = names
+    summary = {}
+    for group, uids in contributors.items():
+        summary[group] = [details.get(uid, {"name": "Someone", "link": user_link(-1)}) for uid in uids]
 
-    summary["lastUpdated"] = updated
+    summary["lastUpdated"] = updated.isoformat() if updated else "Unknown"
 
     return jsonResponse(summary)
 
@@ -1032,11 +999,11 @@ def global_activity(request, page=1):
         q = {"method": {"$ne": "API"}}
 
     filter_type = request.GET.get("type", None)
-    activity, page = get_maximal_collapsed_activity(query=q, page_size=page_size, page=page, filter_type=filter_type)
+    before = parse_activity_cursor(request.GET.get("before"))
+    activity, next_page, before = get_maximal_collapsed_activity(query=q, page_size=page_size, page=page, filter_type=filter_type, before=before)
 
-    next_page = page + 1 if page else None
-    next_page = "/activity/%d" % next_page if next_page else None
-    next_page = "%s?type=%s" % (next_page, filter_type) if next_page and filter_type else next_page
+    next_page = "/activity/%d?before=%s" % (next_page, activity_cursor(before)) if next_page else None
+    next_page = "%s&type=%s" % (next_page, filter_type) if next_page and filter_type else next_page
 
     email = request.user.email if request.user.is_authenticated() else False
     return render_to_response('activity.html',
@@ -1120,17 +1087,17 @@ def user_profile(request, username, page=1):
     page           = int(page) if page else 1
     query          = {"user": profile.id}
     filter_type    = request.GET["type"] if "type" in request.GET else None
-    activity, apage= get_maximal_collapsed_activity(query=query, page_size=page_size, page=page, filter_type=filter_type)
-    notes, npage   = get_maximal_collapsed_activity(query=query, page_size=page_size, page=page, filter_type="add_note")
+    before         = parse_activity_cursor(request.GET.get("before"))
+    activity, apage, abefore = get_maximal_collapsed_activity(query=query, page_size=page_size, page=page, filter_type=filter_type, before=before)
+    notes, npage, nbefore    = get_maximal_collapsed_activity(query=query, page_size=page_size, page=page, filter_type="add_note")
 
     contributed    = activity[0]["date"] if activity else None
     scores         = db.leaders_alltime.find_one({"_id": profile.id})
     score          = int(scores["count"]) if scores else 0
-    user_texts     = scores.get("texts", None) if scores else None
+    user_texts     = leader_texts(scores) if scores else None
     sheets         = db.sheets.find({"owner": profile.id, "status": {"$in": LISTED_SHEETS }}, {"id": 1, "datePublished": 1}).sort([["datePublished", -1]])
 
-    next_page      = apage + 1 if apage else None
-    next_page      = "/profile/%s/%d" % (username, next_page) if next_page else None
+    next_page      = "/profile/%s/%d?before=%s" % (username, apage, activity_cursor(abefore)) if apage else None
 
     return render_to_response("profile.html",
                              {
@@ -1233,7 +1200,7 @@ def splash(request):
     daf_tomorrow       = sefaria.utils.calendars.daf_yomi(datetime.now() + timedelta(1))
     parasha            = sefaria.utils.calendars.this_weeks_parasha(datetime.now())
     metrics            = db.metrics.find().sort("timestamp", -1).limit(1)[0]
-    activity, page     = get_maximal_collapsed_activity(query={}, page_size=5, page=1)
+    activity, page, before = get_maximal_collapsed_activity(query={}, page_size=5, page=1)
 
     return render_to_response('static/splash.html',
                              {
@@ -1,8 +1,7 @@
-import re
-
 from sefaria.model import *
+from sefaria.model.link import address_in_ref, link_addresses
 from sefaria.system.exceptions import InputError
-from sefaria.utils.users import user_link
+from sefaria.utils.users import user_link, user_directory
 
 
 def format_link_object_for_client(link, with_text, ref, pos=None):
@@ -109,6 +108,8 @@ def get_notes(oref, public=True, uid=None, context=1):
     notes = []
 
     noteset = oref.padded_ref().context_ref(context).noteset(public, uid)
+    # Look up the owners of all notes at once, so that formatting each note finds its owner cached
+    user_directory.get_many([note.owner for note in noteset])
 
     for note in noteset:
         com = format_note_object_for_client(note)
@@ -122,45 +123,68 @@ def get_links(tref, with_text=True):
     Return a list of links tied to 'ref' in client format.
     If with_text, retrieve texts for each link.
     """
-    links = []
-    oref = Ref(tref)
-    nRef = oref.normal()
-    reRef = oref.regex()
+    return get_links_for_refs([tref], with_text)[0]
+
+
+def get_links_for_refs(trefs, with_text=True):
+    """
+    Batch form of get_links().  Fetches the links for all of 'trefs' with a single query.
+    :return list: a list of links in client format for each of trefs, in the same order
+    """
+    orefs = [Ref(tref) for tref in trefs]
 
     # for storing all the section level texts that need to be looked up
     texts = {}
 
-    linkset = LinkSet({"refs": {"$regex": reRef}})
-    # For all links that mention ref (in any position)
+    results = [[] for _ in orefs]
+    linkset = LinkSet(orefs)
+    # For all links that mention any of the refs (in any position)
     for link in linkset:
-        # each link contins 2 refs in a list
-        # find the position (0 or 1) of "anchor", the one we're getting links for
-        pos = 0 if re.match(reRef, link.refs[0]) else 1
-        try:
-            com = format_link_object_for_client(link, False, nRef, pos)
-        except InputError:
-            # logger.warning("Bad link: {} - {}".format(link.refs[0], link.refs[1]))
-            continue
-
-        # Rather than getting text with each link, walk through all links here,
-        # caching text so that redudant DB calls can be minimized
-        if with_text:
-            com_oref = Ref(com["ref"])
-            top_oref = com_oref.top_section_ref()
-            top_nref = top_oref.normal()
-
-            # Lookup and save top level text, only if we haven't already
-            if top_nref not in texts:
-                #texts[top_nref] = get_text(top_nref, context=0, commentary=False, pad=False)
-                texts[top_nref] = TextFamily(top_oref, context=0, commentary=False, pad=False).contents()
-
-            sections, toSections = com_oref.sections[1:], com_oref.toSections[1:]
-            com["text"] = grab_section_from_text(sections, texts[top_nref]["text"], toSections)
-            com["he"]   = grab_section_from_text(sections, texts[top_nref]["he"],   toSections)
-
-        links.append(com)
-
-    return links
+        for i, oref in enumerate(orefs):
+            # each link contins 2 refs in a list
+            # find the position (0 or 1) of "anchor", the one we're getting links for
+            pos = _anchor_position(link, oref)
+            if pos is None:
+                continue
+            try:
+                com = format_link_object_for_client(link, False, oref.normal(), pos)
+            except InputError:
+                # logger.warning("Bad link: {} - {}".format(link.refs[0], link.refs[1]))
+                continue
+
+            # Rather than getting text with each link, walk through all links here,
+            # caching text so that redudant DB calls can be minimized
+            if with_text:
+                com_oref = Ref(com["ref"])
+                top_oref = com_oref.top_section_ref()
+                top_nref = top_oref.normal()
+
+                # Lookup and save top level text, only if we haven't already
+                if top_nref not in texts:
+                    #texts[top_nref] = get_text(top_nref, context=0, commentary=False, pad=False)
+                    texts[top_nref] = TextFamily(top_oref, context=0, commentary=False, pad=False).contents()
+
+                sections, toSections = com_oref.sections[1:], com_oref.toSections[1:]
+                com["text"] = grab_section_from_text(sections, texts[top_nref]["text"], toSections)
+                com["he"]   = grab_section_from_text(sections, texts[top_nref]["he"],   toSections)
+
+            results[i].append(com)
+
+    return results
+
+
+def _anchor_position(link, oref):
+    """
+    :return: The position (0 or 1) in link.refs of the ref that is within oref, or None if neither is.
+    """
+    try:
+        addresses = link_addresses(link)
+    except InputError:
+        return None
+    for pos in [0, 1]:
+        if address_in_ref(addresses[pos], oref):
+            return pos
+    return None
 
 
 # This uses the same logic as TextChunk.trim_text().  Should be able to reuse that, or JaggedArray.subarray().
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+import re
+import pickle
+
+from sefaria.datatype.title_automaton import TitleAutomaton, CommentaryTitleAutomaton
+
+
+def setup_module(module):
+    global titles, automaton, commentary_automaton, title_re
+    titles = [u"Genesis", u"Gen", u"Song of Songs", u"Song", u"Job", u"Shabbat", u"שמות", u"Mishnah Shabbat"]
+    automaton = TitleAutomaton(titles)
+    commentary_automaton = CommentaryTitleAutomaton([u"Rashi", u"Ramban", u"Ra"], automaton)
+    title_re = re.compile(u"(?P<title>" + u"|".join(sorted(map(re.escape, titles), key=len, reverse=True)) + u")($|[:., ]+)", re.UNICODE)
+
+
+class Test_Title_Automaton(object):
+
+    def test_match(self):
+        assert automaton.match(u"Genesis 1:2").group("title") == u"Genesis"
+        assert automaton.match(u"Gen. 1:2").group("title") == u"Gen"
+        assert automaton.match(u"Song of Songs 2").group("title") == u"Song of Songs"
+        assert automaton.match(u"Genesis").group("title") == u"Genesis"
+        assert automaton.match(u"שמות כא, ד").group("title") == u"שמות"
+
+    def test_boundary(self):
+        assert automaton.match(u"Genesisx 1") is None
+        assert automaton.match(u"Jobs 1") is None
+        assert automaton.match(u"Song of Songsx").group("title") == u"Song"
+        assert automaton.match(u" Genesis 1") is None
+
+    def test_match_end(self):
+        m = automaton.match(u"Genesis :. 3")
+        assert m.end() == 11
+        assert m.group() == u"Genesis :. "
+
+    def test_finditer(self):
+        s = u"Here is Genesis 3:5 and Mishnah Shabbat 2:1, and then Job."
+        matches = list(automaton.finditer(s))
+        assert [m.group("title") for m in matches] == [u"Genesis", u"Mishnah Shabbat", u"Job"]
+        assert [m.start() for m in matches] == [8, 24, 54]
+
+    def test_same_as_regex(self):
+        strings = [
+            u"Genesis Gen Genesis: Song of Songs, Song of Job.",
+            u"GenesisGenesis Gen.Gen..Job",
+            u"Mishnah Shabbat Shabbat Mishnah Shabbatx Shabbat",
+            u"(שמות כא, ד) שמות",
+            u"",
+            u"no titles here 1 2 3",
+        ]
+        for s in strings:
+            expected = [(m.group("title"), m.start(), m.end()) for m in title_re.finditer(s)]
+            actual = [(m.group("title"), m.start(), m.end()) for m in automaton.finditer(s)]
+            assert expected == actual, s
+            rm, am = title_re.match(s), automaton.match(s)
+            assert (rm and rm.group("title")) == (am and am.group("title"))
+
+    def test_pickle(self):
+        loaded = pickle.loads(pickle.dumps(automaton, pickle.HIGHEST_PROTOCOL))
+        assert len(loaded) == len(titles)
+        assert loaded.match(u"Song of Songs 3").group("title") == u"Song of Songs"
+
+
+class Test_Commentary_Title_Automaton(object):
+
+    def test_match(self):
+        m = commentary_automaton.match(u"Rashi on Genesis 1:1")
+        assert m.group("title") == u"Rashi on Genesis"
+        assert m.group("commentor") == u"Rashi"
+        assert m.group("commentee") == u"Genesis"
+        assert commentary_automaton.match(u"Ramban on Song of Songs 2").group("commentee") == u"Song of Songs"
+
+    def test_no_match(self):
+        assert commentary_automaton.match(u"Rashi on Exodus 1:1") is None
+        assert commentary_automaton.match(u"Genesis 1:1") is None
+        assert commentary_automaton.match(u"Rashi onGenesis") is None
+
+    def test_finditer(self):
+        s = u"See Rashi on Genesis 1:1 and Ramban on Job 3."
+        assert [m.group("title") for m in commentary_automaton.finditer(s)] == [u"Rashi on Genesis", u"Ramban on Job"]
@@ -0,0 +1,234 @@
+"""
+title_automaton.py: multi-pattern matching of titles in strings
+
+An Aho-Corasick automaton over a fixed list of titles.
+http://en.wikipedia.org/wiki/Aho%E2%80%93Corasick_string_matching_algorithm
+
+It is a drop in replacement for a regular expression of the form:
+    (?P<title>A|B|C...)($|[:., ]+)
+with the alternatives sorted by length, longest first.  That is:
+  - A title only matches if it is followed by the end of the string or by one of the boundary characters.
+  - At any position, the longest title that matches wins.
+  - When scanning, matches are leftmost, and do not overlap.  Boundary characters following a title are consumed.
+
+Automata are plain python data, and can be pickled, so they can be stored in a shared cache and loaded by other processes.
+"""
+
+
+class TitleMatch(object):
+    """
+    The result of a match with a TitleAutomaton.
+    Supports the parts of the regex match interface used with title regexes: group(), groupdict(), start(), end()
+    """
+    def __init__(self, string, start, title_end, end, groups=None):
+        self.string = string
+        self._start = start
+        self._title_end = title_end
+        self._end = end
+        self._groups = groups or {}
+
+    def group(self, name=0):
+        if name == 0:
+            return self.string[self._start:self._end]
+        if name == "title":
+            return self.string[self._start:self._title_end]
+        return self._groups.get(name)
+
+    def groupdict(self):
+        d = {"title": self.group("title")}
+        d.update(self._groups)
+        return d
+
+    def start(self):
+        return self._start
+
+    def end(self):
+        return self._end
+
+    def title_end(self):
+        return self._title_end
+
+    def span(self):
+        return self._start, self._end
+
+
+class TitleAutomaton(object):
+    """
+    Aho-Corasick automaton over a list of titles.
+    States are integers.  State 0 is the root.
+    """
+    boundary_chars = u":., "
+
+    def __init__(self, titles=None, boundary=True):
+        """
+        :param titles: list of strings to match
+        :param boundary: If True, a title only matches when followed by the end of the string or by one of boundary_chars
+        """
+        self.boundary = boundary
+        self._goto = {}          # (state, char) -> state
+        self._fail = [0]         # state -> failure state
+        self._terminal = [False] # state -> Is there a title ending at this state?
+        self._depth = [0]        # state -> length of the prefix that this state represents
+        self._out = [()]         # state -> lengths of all titles that end at this state, longest first
+        self.size = 0
+        if titles:
+            self._build(titles)
+
+    def _build(self, titles):
+        children = [[]]
+        for title in titles:
+            if not title:
+                continue
+            state = 0
+            for ch in title:
+                nxt = self._goto.get((state, ch))
+                if nxt is None:
+                    nxt = len(self._fail)
+                    self._goto[(state, ch)] = nxt
+                    self._fail.append(0)
+                    self._terminal.append(False)
+                    self._depth.append(self._depth[state] + 1)
+                    self._out.append(())
+                    children.append([])
+                    children[state].append((ch, nxt))
+                state = nxt
+            if not self._terminal[state]:
+                self._terminal[state] = True
+                self.size += 1
+
+        # Breadth first, so that the failure state of a state is always complete before the state itself
+        queue = [0]
+        for state in queue:
+            for ch, child in children[state]:
+                if state == 0:
+                    self._fail[child] = 0
+                else:
+                    f = self._fail[state]
+                    while f and (f, ch) not in self._goto:
+                        f = self._fail[f]
+                    self._fail[child] = self._goto.get((f, ch), 0)
+                own = (self._depth[child],) if self._terminal[child] else ()
+                self._out[child] = own + self._out[self._fail[child]]
+                queue.append(child)
+
+    def __len__(self):
+        return self.size
+
+    def _is_boundary(self, s, end):
+        return not self.boundary or end == len(s) or s[end] in self.boundary_chars
+
+    def _consume_boundary(self, s, end):
+        if not self.boundary:
+            return end
+        while end < len(s) and s[end] in self.boundary_chars:
+            end += 1
+        return end
+
+    def prefix_ends(self, s, pos=0):
+        """
+        :return list: The end positions of all titles that begin at s[pos] and satisfy the boundary rule, longest first
+        """
+        ends = []
+        state = 0
+        for i in xrange(pos, len(s)):
+            state = self._goto.get((state, s[i]))
+            if state is None:
+                break
+            if self._terminal[state] and self._is_boundary(s, i + 1):
+                ends.append(i + 1)
+        ends.reverse()
+        return ends
+
+    def match_at(self, s, pos=0):
+        """
+        :return TitleMatch: The longest title that begins at s[pos], or None
+        """
+        ends = self.prefix_ends(s, pos)
+        if not ends:
+            return None
+        return TitleMatch(s, pos, ends[0], self._consume_boundary(s, ends[0]))
+
+    def match(self, s):
+        """
+        Equivalent of regex.match() - matches at the beginning of the string only.
+        :return TitleMatch: or None
+        """
+        return self.match_at(s, 0)
+
+    def candidates(self, s):
+        """
+        Scans s once.
+        :return list: (start, title_end) pairs for every title occurrence in s that satisfies the boundary rule,
+            ordered by start, longest first.  Occurrences may overlap.
+        """
+        found = []
+        state = 0
+        for i, ch in enumerate(s):
+            while state and (state, ch) not in self._goto:
+                state = self._fail[state]
+            state = self._goto.get((state, ch), 0)
+            if self._out[state] and self._is_boundary(s, i + 1):
+                for length in self._out[state]:
+                    found.append((i + 1 - length, i + 1))
+        found.sort(key=lambda c: (c[0], -c[1]))
+        return found
+
+    def finditer(self, s):
+        """
+        Equivalent of regex.finditer() - yields leftmost, longest, non-overlapping matches
+        :return: generator of TitleMatch
+        """
+        pos = 0
+        for start, title_end in self.candidates(s):
+            if start < pos:
+                continue
+            end = self._consume_boundary(s, title_end)
+            yield TitleMatch(s, start, title_end, end)
+            pos = end
+
+
+class CommentaryTitleAutomaton(object):
+    """
+    Matches titles of the form "<commentator> on <book>".
+    Drop in replacement for a regular expression of the form:
+        (?P<title>(?P<commentor>A|B...) on (?P<commentee>X|Y|Z...))($|[:., ]+)
+    The longest commentator title that leads to a complete match wins.
+    """
+    separator = u" on "
+
+    def __init__(self, commentator_titles, book_automaton):
+        """
+        :param commentator_titles: list of commentator titles
+        :param book_automaton: TitleAutomaton of the titles that can be commented on
+        :type book_automaton: TitleAutomaton
+        """
+        self._commentators = TitleAutomaton(commentator_titles, boundary=False)
+        self._books = book_automaton
+
+    def match_at(self, s, pos=0):
+        for commentator_end in self._commentators.prefix_ends(s, pos):
+            if not s.startswith(self.separator, commentator_end):
+                continue
+            book_start = commentator_end + len(self.separator)
+            ends = self._books.prefix_ends(s, book_start)
+            if ends:
+                return TitleMatch(s, pos, ends[0], self._books._consume_boundary(s, ends[0]), {
+                    "commentor": s[pos:commentator_end],
+                    "commentee": s[book_start:ends[0]]
+                })
+        return None
+
+    def match(self, s):
+        return self.match_at(s, 0)
+
+    def finditer(self, s):
+        pos = 0
+        tried = set()
+        for start, _ in self._commentators.candidates(s):
+            if start < pos or start in tried:
+                continue
+            tried.add(start)
+            m = self.match_at(s, start)
+            if m:
+                yield m
+                pos = m.end()
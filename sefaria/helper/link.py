@@ -112,28 +112,40 @@ def add_links_from_text(ref, lang, text, text_id, user, **kwargs):
         return []
     elif isinstance(text, list):
         links = []
+        if all(isinstance(subtext, basestring) for subtext in text):
+            # A list of segments - scan them all in one batch
+            for i, refs in enumerate(library.get_refs_in_strings(text, lang)):
+                links += _add_links_to_refs("%s:%d" % (ref, i + 1), refs, text_id, user, **kwargs)
+            return links
         for i in range(len(text)):
             subtext = text[i]
             single = add_links_from_text("%s:%d" % (ref, i + 1), lang, subtext, text_id, user, **kwargs)
             links += single
         return links
     elif isinstance(text, basestring):
-        links = []
         refs = library.get_refs_in_string(text, lang)
-        for oref in refs:
-            link = {
-                "refs": [ref, oref.normal()],
-                "type": "",
-                "auto": True,
-                "generated_by": "add_links_from_text",
-                "source_text_oid": text_id
-            }
-            try:
-                tracker.add(user, Link, link, **kwargs)
-                links += [link]
-            except InputError as e:
-                pass
-        return links
+        return _add_links_to_refs(ref, refs, text_id, user, **kwargs)
+
+
+def _add_links_to_refs(ref, refs, text_id, user, **kwargs):
+    """
+    Add citation links between ref and each of the Refs in refs.
+    """
+    links = []
+    for oref in refs:
+        link = {
+            "refs": [ref, oref.normal()],
+            "type": "",
+            "auto": True,
+            "generated_by": "add_links_from_text",
+            "source_text_oid": text_id
+        }
+        try:
+            tracker.add(user, Link, link, **kwargs)
+            links += [link]
+        except InputError as e:
+            pass
+    return links
 
 
 def rebuild_links_from_text(title, user):
@@ -142,9 +154,9 @@ def rebuild_links_from_text(title, user):
     then rebuilds them. 
     """
     title = Ref(title).normal()
-    versions = VersionSet({"title": title})
+    versions = VersionSet({"title": title}, proj={"chapter": 0})
     links = LinkSet({"title": title, "generated_by": "add_links_from_text"})
     links.delete()
 
-    for version in versions:
-        add_links_from_text(title, version.language, version.chapter, version._id, user)
+    for version, section_ref, section in versions.iter_sections():
+        add_links_from_text(section_ref.normal(), version.language, section, version._id, user)
@@ -4,6 +4,7 @@ import sefaria.summaries as summaries
 from sefaria.system import cache as scache
 from sefaria.system.database import db
 from sefaria.datatype.jagged_array import JaggedTextArray
+from sefaria.model.text import rebuild_merged_sections
 
 
 def rename_category(old, new):
@@ -70,6 +71,11 @@ def resize_text(title, new_structure, upsize_in_place=False):
     summaries.update_summaries_on_change(title)
     scache.reset_texts_cache()
 
+    # Texts were saved directly, without the Version notifications that rebuild merged sections and clear cached ones
+    for lang in db.texts.find({"title": title}).distinct("language"):
+        rebuild_merged_sections(title, lang)
+    text_chunk_cache.clear(title)
+
     return True
 
 
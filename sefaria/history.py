@@ -5,10 +5,13 @@ Write to MongoDB collection: history
 """
 
 from datetime import datetime
+from itertools import islice
+from bson.errors import InvalidId
+from bson.objectid import ObjectId
 from diff_match_patch import diff_match_patch
-from bson.code import Code
 
 from sefaria.model import *
+from sefaria.model.leaderboard import aggregate_history, HISTORY_FIELDS
 #from sefaria.utils.util import *
 from sefaria.system.database import db
 
@@ -23,16 +26,31 @@ def get_activity(query={}, page_size=100, page=1, filter_type=None):
     query.update(filter_type_to_query(filter_type))
     activity = list(db.history.find(query).sort([["date", -1]]).skip((page - 1) * page_size).limit(page_size))
 
-    for i in range(len(activity)):
-        a = activity[i]
-        if a["rev_type"].endswith("text") or a["rev_type"] == "review":
-            try:
-                a["history_url"] = "/activity/%s/%s/%s" % (Ref(a["ref"]).url(), a["language"], a["version"].replace(" ", "_"))
-            except:
-                a["history_url"] = "#"
+    for a in activity:
+        set_history_url(a)
     return activity
 
 
+def set_history_url(a):
+    """
+    Sets the history_url of text and review activity items, from the url stored with the item when it was logged.
+    Items logged before urls were stored have their ref parsed.
+    """
+    if a["rev_type"].endswith("text") or a["rev_type"] == "review":
+        a["history_url"] = _history_url(a)
+
+
+def _history_url(a, section=False):
+    url = a.get("section_url" if section else "url")
+    try:
+        if not url:
+            oref = Ref(a["ref"])
+            url = oref.section_ref().url() if section else oref.url()
+        return "/activity/%s/%s/%s" % (url, a["language"], a["version"].replace(" ", "_"))
+    except:
+        return "#"
+
+
 def text_history(tref, version, lang, filter_type=None):
     """
     Return a complete list of changes to a segment of text (identified by ref/version/lang)
@@ -72,104 +90,151 @@ def collapse_activity(activity):
     Returns a list of activity items in which edits / additions to consecutive segments are collapsed
     into a single entry.
     """
+    return list(_collapse_streaks(activity))
 
-    def continues_streak(a, streak):
-        """Returns True if 'a' continues the streak in 'streak'"""
-        if not len(streak):
-            return False
-        b = streak[-1]
 
-        try:
-            if a["user"] != b["user"] or \
-                a["rev_type"] not in ("edit text", "add text") or \
-                b["rev_type"] not in ("edit text", "add text") or \
-                a["version"] != b["version"] or \
-                Ref(a["ref"]).section_ref() != Ref(b["ref"]).section_ref():
+def _section_ref(a):
+    """Returns the normal form of the section of activity item 'a', from the item when it was stored with it"""
+    if a.get("section_ref"):
+        return a["section_ref"]
+    return Ref(a["ref"]).section_ref().normal()
+
+
+def _continues_streak(a, streak):
+    """Returns True if 'a' continues the streak in 'streak'"""
+    if not len(streak):
+        return False
+    b = streak[-1]
+
+    try:
+        if a["user"] != b["user"] or \
+            a["rev_type"] not in ("edit text", "add text") or \
+            b["rev_type"] not in ("edit text", "add text") or \
+            a["version"] != b["version"] or \
+            _section_ref(a) != _section_ref(b):
 
-                return False
-        except:
             return False
+    except:
+        return False
+
+    return True
 
-        return True
-
-    def collapse_streak(streak):
-        """Returns a single summary activity item that collapses 'streak'"""
-        if not len(streak):
-            return None
-        if len(streak) == 1:
-            return streak[0]
-
-        act = streak[0]
-        act.update({
-            "summary": True,
-            #"contents": streak[1:],
-            # add the update count form first item if it exists, in case that item was a sumamry itself
-            "updates_count": len(streak) + act.get("updates_count", 1) -1,
-            "history_url": "/activity/%s/%s/%s" % (Ref(act["ref"]).section_ref().url(),
-                                                   act["language"],
-                                                   act["version"].replace(" ", "_")),
-        })
-        return act
 
-    collapsed = []
+def _collapse_streak(streak):
+    """Returns a single summary activity item that collapses 'streak'"""
+    if not len(streak):
+        return None
+    if len(streak) == 1:
+        return streak[0]
+
+    act = streak[0]
+    act.update({
+        "summary": True,
+        #"contents": streak[1:],
+        # add the update count form first item if it exists, in case that item was a sumamry itself
+        "updates_count": len(streak) + act.get("updates_count", 1) -1,
+        "history_url": _history_url(act, section=True),
+        "oldest": streak[-1].get("oldest") or (streak[-1].get("date"), streak[-1].get("_id")),  # where the next page starts, if the page ends here
+    })
+    return act
+
+
+def _collapse_streaks(activity):
+    """
+    Yields the items of the iterable 'activity', with streaks collapsed.
+    A streak is yielded once the item after it has been read.
+    """
     current_streak = []
 
     for a in activity:
-        if continues_streak(a, current_streak): # The current item continues
+        if _continues_streak(a, current_streak): # The current item continues
             current_streak.append(a)
         else:
             if len(current_streak):
-                collapsed.append(collapse_streak(current_streak))
+                yield _collapse_streak(current_streak)
             current_streak = [a]
 
     if len(current_streak):
-        collapsed.append(collapse_streak(current_streak))
+        yield _collapse_streak(current_streak)
+
+
+def collapsed_activity(query={}, filter_type=None, before=None):
+    """
+    Yields collapsed activity items matching query, newest first, streaming them from a single cursor over history.
+    :param before: (datetime, ObjectId).  If given, only activity after (date, _id) in the feed order is read.
+    """
+    query = dict(query)
+    query.update(filter_type_to_query(filter_type))
+    if before:
+        date, _id = before
+        query = {"$and": [query, {"$or": [{"date": {"$lt": date}}, {"date": date, "_id": {"$lt": _id}}]}]}
 
-    return collapsed
+    def activity():
+        for a in db.history.find(query).sort([["date", -1], ["_id", -1]]):
+            set_history_url(a)
+            yield a
 
+    return _collapse_streaks(activity())
 
-def get_maximal_collapsed_activity(query={}, page_size=100, page=1, filter_type=None):
+
+def get_maximal_collapsed_activity(query={}, page_size=100, page=1, filter_type=None, before=None):
     """
-    Returns (activity, page) where
+    Returns (activity, page, before) where
     activity is the collasped set of activity items, counting multiple consecutive actions as one
-    page is the page number for the next page of queries to search, or None if there are no more results.
+    page is the page number for the next page of collapsed items, or None if there are no more results.
+    before is the (date, _id) to pass as 'before' to get the next page, or None.
 
-    Makes repeat DB calls to return more activity items so a full page_size of items cen returned.
+    Reads one cursor, up to the first item after the page, so a full page_size of items is returned.
+    With 'before', the cursor starts where the previous page ended, and 'page' only numbers the page.
+    Without it, the items of the pages before 'page' are read and skipped.
     """
-    activity = get_activity(query=query, page_size=page_size, page=page, filter_type=filter_type)
-    enough = False
-    if len(activity) < page_size:
-        enough = True
-        page = None
+    skip = 0 if before else (page - 1) * page_size
+    items = list(islice(collapsed_activity(query, filter_type, before), skip, skip + page_size + 1))
+    if len(items) <= page_size:
+        return (items, None, None)
+    last = items[page_size - 1]
+    return (items[:page_size], page + 1, last.get("oldest") or (last["date"], last["_id"]))
+
 
-    activity = collapse_activity(activity)
+ACTIVITY_CURSOR_FORMAT = "%Y-%m-%dT%H:%M:%S.%f"
 
-    if len(activity) >= page_size:
-        enough = True
 
-    while not enough:
-        page += 1
-        new_activity = get_activity(query=query, page_size=page_size, page=page, filter_type=filter_type)
-        if len(new_activity) < page_size:
-            page = None
-            enough = True
-        activity = collapse_activity(activity + new_activity)
-        enough = enough or len(activity) >= page_size # don't set enough to False if already set to True above
+def activity_cursor(before):
+    """
+    :return str: 'before' (date, _id) of get_maximal_collapsed_activity(), for a url parameter
+    """
+    date, _id = before
+    return "{}_{}".format(date.strftime(ACTIVITY_CURSOR_FORMAT), _id)
 
-    return (activity, page)
+
+def parse_activity_cursor(cursor):
+    """
+    :return tuple: The (date, _id) of a cursor from activity_cursor(), or None if it is missing or malformed
+    """
+    try:
+        date, _id = cursor.split("_")
+        return datetime.strptime(date, ACTIVITY_CURSOR_FORMAT), ObjectId(_id)
+    except (AttributeError, TypeError, ValueError, InvalidId):
+        return None
 
 
 def text_at_revision(tref, version, lang, revision):
     """
     Returns the state of a text (identified by ref/version/lang) at revision number 'revision'
+    Starts from the nearest checkpoint after revision, if there is one, and from the current text if not.
     """
-    changes = db.history.find({"ref": tref, "version": version, "language": lang}).sort([['revision', -1]])
-    current = TextChunk(Ref(tref), lang, version)
-    text = unicode(current.text)  # needed?
+    from sefaria.model.history import nearest_checkpoint
+    query = {"ref": tref, "version": version, "language": lang, "revision": {"$gt": revision}}
+    checkpoint = nearest_checkpoint(tref, version, lang, revision)
+    if checkpoint:
+        text = checkpoint["text"]
+        query["revision"]["$lte"] = checkpoint["revision"]
+    else:
+        current = TextChunk(Ref(tref), lang, version)
+        text = unicode(current.text)  # needed?
 
-    for i in range(changes.count()):
-        r = changes[i]
-        if r["revision"] == revision: break
+    changes = db.history.find(query, {"revert_patch": 1}).sort([['revision', -1]])
+    for r in changes:
         patch = dmp.patch_fromText(r["revert_patch"])
         text = dmp.patch_apply(patch, text)[0]
 
@@ -180,9 +245,8 @@ def next_revision_num():
     """
     Deprecated in favor of sefaria.model.history.next_revision_num()
     """
-    last_rev = db.history.find().sort([['revision', -1]]).limit(1)
-    revision = last_rev.next()["revision"] + 1 if last_rev.count() else 1
-    return revision
+    from sefaria.model.history import next_revision_num as model_next_revision_num
+    return model_next_revision_num()
 
 
 def record_sheet_publication(sheet_id, uid):
@@ -214,7 +278,7 @@ def top_contributors(days=None):
     """
     Returns a list of users and their activity counts, either in the previous
     'days' if present or across all time.
-    Assumes counts have been precalculated and stored in the DB.
+    Counts are kept current by sefaria.model.leaderboard as history is saved.
     """
     if days:
         collection = "leaders_%d" % days
@@ -259,103 +323,7 @@ def make_leaderboard(condition):
     matches the conditions of 'condition' - an object used to query
     the history collection.
 
-    This fucntion queries and calculates for all currently matching history.
-    """
-
-    reducer = Code("""
-                    function(obj, prev) {
-
-                        // Total Points
-                        switch(obj.rev_type) {
-                            case "add text":
-                                if (obj.language !== 'he' && obj.version === "Sefaria Community Translation") {
-                                    prev.count += Math.max(obj.revert_patch.length / 10, 10);
-                                    prev.translateCount += 1
-                                } else if(obj.language !== 'he') {
-                                    prev.count += Math.max(obj.revert_patch.length / 400, 2);
-                                    prev.addCount += 1
-                                } else {
-                                    prev.count += Math.max(obj.revert_patch.length / 800, 1);
-                                    prev.addCount += 1
-                                }
-                                break;
-                            case "edit text":
-                                prev.count += Math.max(obj.revert_patch.length / 1200, 1);
-                                prev.editCount += 1
-                                break;
-                            case "revert text":
-                                prev.count += 1;
-                                break;
-                            case "review":
-                                prev.count += 15;
-                                prev.reviewCount += 1;
-                                break;
-                            case "add index":
-                                prev.count += 5;
-                                break;
-                            case "edit index":
-                                prev.count += 1;
-                                prev.editCount += 1
-                                break;
-                            case "add link":
-                                prev.count += 2;
-                                prev.linkCount += 1;
-                                break;
-                            case "edit link":
-                                prev.editCount += 1
-                                prev.count += 1;
-                                break;
-                            case "delete link":
-                                prev.count += 1;
-                                break;
-                            case "add note":
-                                prev.count += 1;
-                                prev.noteCount += 1;
-                                break;
-                            case "edit note":
-                                prev.count += 1;
-                                break;
-                            case "delete note":
-                                prev.count += 1;
-                                break;
-                        }
-
-                        // Texts worked on
-                        var refs = []
-                        if ("ref" in obj && obj.ref) {
-                            refs.push(obj.ref);
-                        } else if ("refs" in obj && obj.refs[0] && obj.refs[1]) {
-                            refs.push(obj.refs[0]);
-                            refs.push(obj.refs[1]);
-                        }
-                        refs.forEach(function(ref) {
-                            var text = ref;
-                            var i = text.search(/\d/);
-                            var text = text.slice(0,i).trim()
-
-                            if (prev.texts[text]) {
-                                prev.texts[text] += 1;
-                            } else {
-                                prev.texts[text] = 1;
-                            }
-                        });
-                    }
-                """)
-
-    leaders = db.history.group(['user'],
-                        condition,
-                        {
-                            'count': 0,
-                            'translateCount': 0,
-                            'addCount': 0,
-                            'editCount': 0,
-                            'linkCount': 0,
-                            'noteCount': 0,
-                            'reviewCount': 0,
-
-                            'texts': {}
-                        },
-                        reducer)
-
-    return sorted(leaders, key=lambda x: -x["count"])
-
+    This fucntion queries and calculates for all currently matching history,
+    streaming it once through the point rules of sefaria.model.leaderboard.
+    """
+    return aggregate_history(db.history.find(condition, HISTORY_FIELDS))
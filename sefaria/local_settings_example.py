@@ -68,9 +68,48 @@ SEFARIA_DB_PASSWORD = 'your mongo password'
 SEARCH_HOST = "http://localhost:9200"
 SEARCH_INDEX_ON_SAVE = True # Whether to send texts and source sheet to Search Host for indexing after save
 SEARCH_INDEX_NAME = 'sefaria' # name of the ElasticSearch index to use
+# Bulk indexing.  Defaults are set in settings.py.
+# SEARCH_BULK_MAX_DOCS = 500  # documents per bulk request
+# SEARCH_BULK_MAX_BYTES = 5 * 1024 * 1024  # approximate bytes per bulk request
+# SEARCH_INDEX_PROCESSES = 4  # processes that build documents
+# SEARCH_QUEUE_BATCH_SIZE = 100  # index queue records per bulk batch
+# SEARCH_QUEUE_MAX_ATTEMPTS = 5  # failed attempts before a queue record is given up on
+# SEARCH_QUEUE_RETRY_SECONDS = 60  # delay before the first retry.  Doubles with each attempt.
 
 SEFARIA_DATA_PATH = '/path/to/you/data/dir' # used for exporting texts 
 
+# Bounds on the per-process Ref cache.  Defaults are set in settings.py.
+# REF_CACHE_MAX_SIZE = 100000  # number of cached keys
+# REF_CACHE_MAX_BYTES = 256 * 1024 * 1024  # approximate bytes
+
+# Processes used to rebuild all VersionStates.  Default is set in settings.py.
+# VSTATE_REFRESH_PROCESSES = 4
+
+# Processes used to compute history diffs of large text saves.  Defaults are set in settings.py.
+# HISTORY_DIFF_PROCESSES = 1
+# HISTORY_DIFF_POOL_MIN = 500
+# HISTORY_CHECKPOINT_INTERVAL = 50  # revisions of a segment between full text checkpoints
+
+# Seconds that user names and profile links are cached for.  Default is set in settings.py.
+# USER_DIRECTORY_CACHE_SECONDS = 600
+
+# Notification fan-out to followers.  Defaults are set in settings.py.
+# NOTIFICATION_FANOUT_CHUNK_SIZE = 1000  # notifications per bulk insert
+# NOTIFICATION_FANOUT_STALE_SECONDS = 300  # time without progress before another worker resumes a fan-out
+
+# Notification digest emails.  Defaults are set in settings.py.
+# EMAIL_DIGEST_PROCESSES = 4  # processes that render emails
+# EMAIL_DIGEST_BATCH_SIZE = 200  # users loaded, rendered and sent together
+
+# Seconds that unread notification counts are cached for.  Default is set in settings.py.
+# UNREAD_COUNT_CACHE_SECONDS = 60 * 5
+
+# Seconds that sections of texts are cached for.  Default is set in settings.py.
+# TEXT_CHUNK_CACHE_SECONDS = 60 * 60
+
+# Top level sections read in each query when streaming the content of Versions.  Default is set in settings.py.
+# VERSION_STREAM_BATCH_SIZE = 50
+
 GOOGLE_ANALYTICS_CODE = 'your google analytics code'
 
 # Integration with a NationBuilder list
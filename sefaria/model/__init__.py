@@ -19,10 +19,10 @@ and access directly as:
 import abstract
 
 # not sure why we have to do this now - it wasn't previously required
-import history, text, link, note, layer, notification, queue, lock, following, user_profile, version_state, translation_request
+import history, text, link, note, layer, notification, queue, lock, following, user_profile, version_state, translation_request, leaderboard
 
 from history import History, HistorySet, log_add, log_delete, log_update, log_text
-from text import library, build_node, get_index, TermScheme, Index, IndexSet, CommentaryIndex, Version, VersionSet, TextChunk, TextFamily, Ref, merge_texts
+from text import library, build_node, get_index, TermScheme, Index, IndexSet, CommentaryIndex, Version, VersionSet, TextChunk, TextChunkCache, text_chunk_cache, TextFamily, Ref, merge_texts
 from link import Link, LinkSet, get_link_counts, get_book_link_collection
 from note import Note, NoteSet
 from layer import Layer, LayerSet
@@ -254,13 +254,22 @@ class AbstractMongoSet(collections.Iterable):
     """
     recordClass = AbstractMongoRecord
 
-    def __init__(self, query={}, page=0, limit=0, sort=[["_id", 1]], proj=None):
+    def __init__(self, query={}, page=0, limit=0, sort=[["_id", 1]], proj=None, records=None):
+        """
+        :param records: Record dicts that were already loaded.  If given, the set holds them and doesn't query.
+        """
+        self.current = 0
+        self._local_iter = None
+        if records is not None:
+            self.raw_records = None
+            self.has_more = False
+            self.records = [self.recordClass(attrs=r) for r in records]
+            self.max = len(self.records)
+            return
         self.raw_records = getattr(db, self.recordClass.collection).find(query, proj).sort(sort).skip(page * limit).limit(limit)
         self.has_more = limit != 0 and self.raw_records.count() == limit
         self.records = None
-        self.current = 0
         self.max = None
-        self._local_iter = None
 
     def __iter__(self):
         self.__read_records()
@@ -278,7 +287,7 @@ class AbstractMongoSet(collections.Iterable):
             self.max = len(self.records)
 
     def __len__(self):
-        if self.max:
+        if self.max is not None:
             return self.max
         else:
             return self.raw_records.count()
@@ -418,7 +427,7 @@ def notify(inst, action, **kwargs):
 
     if action == "attributeChange":
         callbacks = deps.get((type(inst), action, kwargs["attr"]), None)
-        logger.debug("Notify: " + str(inst) + "." + kwargs["attr"] + ": " + kwargs["old"] + " is becoming " + kwargs["new"])
+        logger.debug(u"Notify: {}.{}: {} is becoming {}".format(inst, kwargs["attr"], kwargs["old"], kwargs["new"]))
     else:
         logger.debug("Notify: " + str(inst) + " is being " + action + "d.")
         callbacks = deps.get((type(inst), action, None), [])
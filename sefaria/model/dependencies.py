@@ -2,7 +2,7 @@
 dependencies.py -- list cross model dependencies and subscribe listeners to changes.
 """
 
-from . import abstract, link, note, history, text, layer, version_state, translation_request
+from . import abstract, link, note, history, text, layer, version_state, translation_request, leaderboard, notification
 
 from abstract import subscribe, cascade
 import sefaria.system.cache as scache
@@ -14,8 +14,10 @@ subscribe(version_state.create_version_state_on_index_creation,         text.Ind
 # Index Name Change (start with cache clearing)
 subscribe(scache.process_index_change_in_cache,                         text.Index, "attributeChange", "title")
 subscribe(link.process_index_title_change_in_links,                     text.Index, "attributeChange", "title")
+subscribe(link.process_index_title_change_in_link_counts,               text.Index, "attributeChange", "title")
 subscribe(note.process_index_title_change_in_notes,                     text.Index, "attributeChange", "title")
 subscribe(history.process_index_title_change_in_history,                text.Index, "attributeChange", "title")
+subscribe(text.process_index_title_change_in_merged_sections,           text.Index, "attributeChange", "title")
 subscribe(text.process_index_title_change_in_versions,                  text.Index, "attributeChange", "title")
 subscribe(version_state.process_index_title_change_in_version_state,    text.Index, "attributeChange", "title")
 
@@ -23,11 +25,35 @@ subscribe(version_state.process_index_title_change_in_version_state,    text.Ind
 subscribe(scache.process_index_change_in_cache,                         text.Index, "delete")
 subscribe(version_state.process_index_delete_in_version_state,          text.Index, "delete")
 subscribe(link.process_index_delete_in_links,                           text.Index, "delete")
+subscribe(link.process_index_delete_in_link_counts,                     text.Index, "delete")
 subscribe(text.process_index_delete_in_versions,                        text.Index, "delete")
 
+# Version Save / Delete
+subscribe(text.process_version_save_in_merged_sections,                 text.Version, "save")
+subscribe(text.process_version_delete_in_merged_sections,               text.Version, "delete")
+subscribe(text.process_version_save_in_text_chunk_cache,                text.Version, "save")
+subscribe(text.process_version_delete_in_text_chunk_cache,              text.Version, "delete")
+
 # Version Title Change
 subscribe(history.process_version_title_change_in_history,              text.Version, "attributeChange", "versionTitle")
 
+# Link Create / Delete / Change
+subscribe(link.process_link_creation_in_link_counts,                    link.Link, "create")
+subscribe(link.process_link_deletion_in_link_counts,                    link.Link, "delete")
+subscribe(link.process_link_refs_change_in_link_counts,                 link.Link, "attributeChange", "refs")
+
+# History Create
+subscribe(leaderboard.process_history_creation_in_leaderboards,          history.History, "create")
+
+# Notification Create / Read / Delete
+subscribe(notification.process_notification_creation_in_unread_count,    notification.Notification, "create")
+subscribe(notification.process_notification_read_change_in_unread_count, notification.Notification, "attributeChange", "read")
+subscribe(notification.process_notification_deletion_in_unread_count,    notification.Notification, "delete")
+
+# VersionState Save / Delete
+subscribe(version_state.process_version_state_change_in_navigation,      version_state.VersionState, "save")
+subscribe(version_state.process_version_state_change_in_navigation,      version_state.VersionState, "delete")
+
 # Note Delete
 subscribe(layer.process_note_deletion_in_layer,                         note.Note, "delete")
 
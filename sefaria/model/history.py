@@ -1,6 +1,7 @@
 """
 history.py
-Writes to MongoDB Collection: history
+Writes to MongoDB Collections: history, counters, history_checkpoints, history_contributors
+(and the leaderboard collections, through leaderboard.record_history)
 
 "add index"     done
 "add link"      done
@@ -20,30 +21,110 @@ Writes to MongoDB Collection: history
 
 import regex as re
 from datetime import datetime
+from multiprocessing import Pool
 from diff_match_patch import diff_match_patch
 dmp = diff_match_patch()
 
 from . import abstract as abst
 from . import text
-from sefaria.system.database import db
+from . import leaderboard
+from pymongo.errors import DuplicateKeyError
+from sefaria.system.database import db, reconnect
+from sefaria.settings import HISTORY_DIFF_PROCESSES, HISTORY_DIFF_POOL_MIN, HISTORY_CHECKPOINT_INTERVAL
+from sefaria.system.exceptions import InputError
 
 
 def log_text(user, action, oref, lang, vtitle, old_text, new_text, **kwargs):
-
-    if isinstance(new_text, list):
-        if not isinstance(old_text, list):  # is this neccesary? the TextChunk should handle it.
-            old_text = [old_text]
-        maxlength = max(len(old_text), len(new_text))
-        for i in reversed(range(maxlength)):
-            subref = oref.subref(i + 1)
-            subold = old_text[i] if i < len(old_text) else [] if isinstance(new_text[i], list) else ""
-            subnew = new_text[i] if i < len(new_text) else [] if isinstance(old_text[i], list) else ""
-            log_text(user, action, subref, lang, vtitle, subold, subnew, **kwargs)
+    """
+    Logs a History record for each segment of oref that changed, and writes them all with one bulk insert.
+    Revision numbers for all of them are reserved at once.
+    When at least HISTORY_DIFF_POOL_MIN segments changed, diffs are computed in a pool of HISTORY_DIFF_PROCESSES processes,
+    which is started on first use and kept for the life of the process.
+    """
+    changes = _text_changes(oref, old_text, new_text)
+    if not changes:
         return
+    revision = next_revision_num(len(changes))
 
-    if old_text == new_text:
-        return
+    pairs = [(subold, subnew) for subref, subold, subnew in changes]
+    if HISTORY_DIFF_PROCESSES > 1 and len(pairs) >= HISTORY_DIFF_POOL_MIN:
+        diffs = _diff_pool().map(_segment_diff, pairs, chunksize=50)
+    else:
+        diffs = map(_segment_diff, pairs)
+
+    logs = []
+    for i, ((subref, subold, subnew), (patch, diff_html)) in enumerate(zip(changes, diffs)):
+        log = history_ref_fields(subref)
+        log.update({
+            "ref": subref.normal(),
+            "version": vtitle,
+            "language": lang,
+            "diff_html": diff_html,
+            "revert_patch": patch,
+            "user": user,
+            "date": datetime.now(),
+            "revision": revision + i,
+            "message": kwargs.get("message", ""), # is this used?
+            "rev_type": "{} text".format(action),
+            "method": kwargs.get("method", "Site")
+        })
+        logs.append(log)
+
+    # The same records as History(log).save() for each log, with the leaderboard update of their creation
+    db.history.insert(logs)
+    leaderboard.record_history(logs)
+    record_contributors(logs)
+    _add_checkpoints(logs, changes)
+
+
+_pool = None
+
+
+def _diff_pool():
+    global _pool
+    if _pool is None:
+        _pool = Pool(HISTORY_DIFF_PROCESSES, reconnect)
+    return _pool
+
+
+def history_ref_fields(oref):
+    """
+    :return dict: Fields stored on history records of a text, so that the activity feed doesn't need to parse their refs -
+    the normal form of the section of the ref, and the url fragments of the ref and of its section
+    """
+    section = oref.section_ref()
+    return {"section_ref": section.normal(), "url": oref.url(), "section_url": section.url()}
+
+
+def add_history_ref_fields(query={}):
+    """
+    Adds the fields of history_ref_fields() to existing history records that have a ref but not the fields.
+    :return int: number of records updated
+    """
+    q = {"ref": {"$exists": True}, "section_ref": {"$exists": False}}
+    q.update(query)
+    updated = 0
+    for h in db.history.find(q, {"ref": 1}):
+        try:
+            fields = history_ref_fields(text.Ref(h["ref"]))
+        except InputError:
+            continue
+        db.history.update({"_id": h["_id"]}, {"$set": fields})
+        updated += 1
+    return updated
+
+
+def ensure_activity_indexes():
+    db.history.ensure_index([("date", -1), ("_id", -1)])
+    db.history.ensure_index([("user", 1), ("date", -1), ("_id", -1)])
 
+
+def _segment_diff(pair):
+    """
+    :param pair: (old string, new string)
+    :return tuple: (patch that turns the new string back into the old, html displaying the edits)
+    """
+    old_text, new_text = pair
     # create a patch that turns the new version back into the old
     backwards_diff = dmp.diff_main(new_text, old_text)
     patch = dmp.patch_toText(dmp.patch_make(backwards_diff))
@@ -51,22 +132,30 @@ def log_text(user, action, oref, lang, vtitle, old_text, new_text, **kwargs):
     forwards_diff = dmp.diff_main(old_text, new_text)
     dmp.diff_cleanupSemantic(forwards_diff)
     diff_html = dmp.diff_prettyHtml(forwards_diff)
+    return patch, diff_html
 
-    log = {
-        "ref": oref.normal(),
-        "version": vtitle,
-        "language": lang,
-        "diff_html": diff_html,
-        "revert_patch": patch,
-        "user": user,
-        "date": datetime.now(),
-        "revision": next_revision_num(),
-        "message": kwargs.get("message", ""), # is this used?
-        "rev_type": "{} text".format(action),
-        "method": kwargs.get("method", "Site")
-    }
 
-    History(log).save()
+def _text_changes(oref, old_text, new_text):
+    """
+    :return list: (Ref, old string, new string) for each segment that differs between old_text and new_text.
+    Segments are listed last to first.
+    """
+    if isinstance(new_text, list):
+        if not isinstance(old_text, list):  # is this neccesary? the TextChunk should handle it.
+            old_text = [old_text]
+        changes = []
+        maxlength = max(len(old_text), len(new_text))
+        for i in reversed(range(maxlength)):
+            subref = oref.subref(i + 1)
+            subold = old_text[i] if i < len(old_text) else [] if isinstance(new_text[i], list) else ""
+            subnew = new_text[i] if i < len(new_text) else [] if isinstance(old_text[i], list) else ""
+            changes += _text_changes(subref, subold, subnew)
+        return changes
+
+    if old_text == new_text:
+        return []
+    return [(oref, old_text, new_text)]
+
 
 def log_update(user, klass, old_dict, new_dict, **kwargs):
     kind = klass.history_noun
@@ -113,11 +202,29 @@ def _log_general(user, kind, old_dict, new_dict, rev_type, **kwargs):
     return History(log).save()
 
 
-def next_revision_num():
-    #todo: refactor to use HistorySet? May add expense for no gain.
-    last_rev = db.history.find().sort([['revision', -1]]).limit(1)
-    revision = last_rev.next()["revision"] + 1 if last_rev.count() else 1
-    return revision
+def next_revision_num(count=1):
+    """
+    Reserves count consecutive revision numbers, with one atomic increment of the revision counter.
+    Numbers are unique across concurrent writers.
+    :return int: The first reserved number
+    """
+    counter = db.counters.find_and_modify({"_id": "history_revision"}, {"$inc": {"value": count}}, new=True)
+    if counter is None:
+        _init_revision_counter()
+        counter = db.counters.find_and_modify({"_id": "history_revision"}, {"$inc": {"value": count}}, new=True)
+    return counter["value"] - count + 1
+
+
+def _init_revision_counter():
+    """
+    Creates the revision counter, starting from the highest revision in history, if it doesn't exist yet.
+    """
+    last_rev = db.history.find({}, {"revision": 1}).sort([['revision', -1]]).limit(1)
+    last = last_rev.next().get("revision", 0) if last_rev.count() else 0
+    try:
+        db.counters.update({"_id": "history_revision"}, {"$setOnInsert": {"value": last}}, upsert=True)
+    except DuplicateKeyError:
+        pass  # Created by a concurrent writer
 
 
 class History(abst.AbstractMongoRecord):
@@ -135,6 +242,9 @@ class History(abst.AbstractMongoRecord):
         "diff_html",
         "version",
         "ref",
+        "section_ref",  # normal form of the section of ref
+        "url",          # url fragment of ref
+        "section_url",  # url fragment of section_ref
         "method",
         "old",
         "new",
@@ -154,9 +264,221 @@ class HistorySet(abst.AbstractMongoSet):
     recordClass = History
 
 
+"""
+History checkpoints.
+The full text of a segment is stored in history_checkpoints after every HISTORY_CHECKPOINT_INTERVAL revisions of that segment,
+as {"ref", "version", "language", "revision", "text"}, the text as it was right after that revision.
+Revisions of segments are counted in counters, in a document for each section of a version, as {"_id", "segments": {segment key: count}}.
+Older states of the text are reconstructed by applying revert patches from the nearest later checkpoint,
+rather than from the current text.
+"""
+
+
+def ensure_checkpoint_index():
+    db.history_checkpoints.ensure_index([("ref", 1), ("version", 1), ("language", 1), ("revision", 1)])
+
+
+def _revision_count_id(section_ref, version, lang):
+    return u"segment_revisions|{}|{}|{}".format(lang, version, section_ref)
+
+
+def _segment_key(oref):
+    return u"_".join([unicode(s) for s in oref.sections]) or u"0"
+
+
+def _add_checkpoints(logs, changes):
+    """
+    Counts the revisions of each segment of logged text changes, and adds checkpoints for those that complete an interval.
+    The revisions of the segments of each section are counted in one counters document, with one atomic increment for each section changed.
+    :param logs: list of text history records, as inserted
+    :param changes: list of (Ref, old text, new text) of each record
+    """
+    sections = {}
+    for log, (subref, subold, subnew) in zip(logs, changes):
+        sections.setdefault(log["section_ref"], []).append((log, _segment_key(subref), subnew))
+
+    checkpoints = []
+    for section, items in sections.iteritems():
+        log = items[0][0]
+        fields = [u"segments." + key for l, key, t in items]
+        counter = db.counters.find_and_modify(
+            {"_id": _revision_count_id(section, log["version"], log["language"])},
+            {"$inc": {f: 1 for f in fields}},
+            upsert=True,
+            new=True,
+            fields={f: 1 for f in fields}
+        )
+        checkpoints += [
+            {"ref": l["ref"], "version": l["version"], "language": l["language"], "revision": l["revision"], "text": t}
+            for l, key, t in items
+            if counter["segments"][key] % HISTORY_CHECKPOINT_INTERVAL == 0
+        ]
+    if checkpoints:
+        db.history_checkpoints.insert(checkpoints)
+
+
+def nearest_checkpoint(tref, version, lang, revision):
+    """
+    :return dict: The earliest checkpoint of the segment at or after revision, or None
+    """
+    return db.history_checkpoints.find_one(
+        {"ref": tref, "version": version, "language": lang, "revision": {"$gte": revision}},
+        sort=[("revision", 1)]
+    )
+
+
+def add_history_checkpoints(query={}):
+    """
+    Builds checkpoints for existing text history.  Replaces any checkpoints of the segments it covers,
+    and sets their revision counts to the number of their history records.
+    Walks back from the current text of each segment through its revert patches.
+    :param query: limits the history records considered, e.g. {"ref": {"$regex": "^Genesis "}}
+    :return int: number of checkpoints written
+    """
+    from itertools import groupby
+    ensure_checkpoint_index()
+    q = {"ref": {"$exists": True}, "version": {"$exists": True}, "language": {"$exists": True}, "revert_patch": {"$exists": True}}
+    q.update(query)
+    records = db.history.find(q, {"ref": 1, "version": 1, "language": 1, "revision": 1, "revert_patch": 1}).sort(
+        [("ref", 1), ("version", 1), ("language", 1), ("revision", -1)])
+    written = 0
+    for (tref, version, lang), group in groupby(records, key=lambda r: (r["ref"], r["version"], r["language"])):
+        group = list(group)
+        try:
+            oref = text.Ref(tref)
+            txt = text.TextChunk(oref, lang, version).text
+        except InputError:
+            continue
+        if not isinstance(txt, basestring):
+            continue
+        db.history_checkpoints.remove({"ref": tref, "version": version, "language": lang})
+        db.counters.update(
+            {"_id": _revision_count_id(oref.section_ref().normal(), version, lang)},
+            {"$set": {u"segments." + _segment_key(oref): len(group)}},
+            upsert=True
+        )
+        checkpoints = []
+        for i, r in enumerate(group):
+            if (len(group) - i) % HISTORY_CHECKPOINT_INTERVAL == 0:
+                checkpoints.append({"ref": tref, "version": version, "language": lang, "revision": r["revision"], "text": txt})
+            txt = dmp.patch_apply(dmp.patch_fromText(r["revert_patch"]), txt)[0]
+        if checkpoints:
+            db.history_checkpoints.insert(checkpoints)
+            written += len(checkpoints)
+    return written
+
+
+"""
+History contributors.
+Users who have worked on each segment of a text version are kept in history_contributors,
+one record for each ref/version/language, with the user ids of its copiers, translators, editors and reviewers,
+and the date of its latest history record.  The section of the ref is stored with it, so that a section is looked up at once.
+"""
+
+CONTRIBUTOR_ROLES = ["copiers", "translators", "editors", "reviewers"]
+
+
+def contributor_role(log):
+    """
+    :return str: The role in CONTRIBUTOR_ROLES of the user of a text or review history record
+    """
+    if log["rev_type"].startswith("edit"):
+        return "editors"
+    elif log["rev_type"] == "review":
+        return "reviewers"
+    elif log.get("version") == "Sefaria Community Translation":
+        return "translators"
+    else:
+        return "copiers"
+
+
+def ensure_contributor_indexes():
+    db.history_contributors.ensure_index([("ref", 1), ("version", 1), ("language", 1)], unique=True)
+    db.history_contributors.ensure_index([("section_ref", 1), ("version", 1), ("language", 1)])
+
+
+def record_contributors(logs):
+    """
+    Adds the users of newly written text or review history records to the contributors of their refs.
+    Records are taken to be the latest of their refs.
+    """
+    for log in logs:
+        if not log.get("ref"):
+            continue
+        section = log.get("section_ref")
+        if not section:
+            try:
+                section = text.Ref(log["ref"]).section_ref().normal()
+            except InputError:
+                continue
+        db.history_contributors.update(
+            {"ref": log["ref"], "version": log.get("version"), "language": log.get("language")},
+            {
+                "$addToSet": {contributor_role(log): log["user"]},
+                "$set": {"section_ref": section, "lastUpdated": log["date"]},
+            },
+            upsert=True
+        )
+
+
+def rebuild_contributors(query={}):
+    """
+    Rebuilds the contributors of the refs of history records matching query, from all of their history.
+    :param query: limits the history records considered, e.g. {"ref": "Genesis 1:1"}
+    :return int: number of contributor records written
+    """
+    from itertools import groupby
+    q = {"ref": {"$exists": True}}
+    q.update(query)
+    records = db.history.find(q, {"ref": 1, "version": 1, "language": 1, "section_ref": 1, "rev_type": 1, "user": 1, "date": 1}).sort(
+        [("ref", 1), ("version", 1), ("language", 1), ("date", 1)])
+    written = 0
+    for (tref, version, lang), group in groupby(records, key=lambda r: (r["ref"], r.get("version"), r.get("language"))):
+        db.history_contributors.remove({"ref": tref, "version": version, "language": lang})
+        record_contributors(list(group))
+        written += 1
+    return written
+
+
+def refresh_contributors(tref, version, lang):
+    """
+    Rebuilds the contributors of one ref from its history, e.g. after a history record of it is removed.
+    """
+    db.history_contributors.remove({"ref": tref, "version": version, "language": lang})
+    record_contributors(list(db.history.find({"ref": tref, "version": version, "language": lang}).sort([("date", 1)])))
+
+
+def get_contributors(oref, lang=None, version=None):
+    """
+    :return dict: user ids of each of CONTRIBUTOR_ROLES on oref, in lang and version if given,
+    and "lastUpdated", the date of the latest history record of oref, or None.
+    Editors who also copied or translated are listed only as copiers and translators.
+    """
+    if oref.is_section_level():
+        query = {"section_ref": oref.normal()}
+    elif oref.is_segment_level():
+        query = {"ref": oref.normal()}
+    else:
+        query = {"ref": {"$regex": u"^{}$|^{}:".format(re.escape(oref.normal()), re.escape(oref.normal()))}}
+    if lang and version:
+        query.update({"language": lang, "version": version})
+
+    summary = {role: set() for role in CONTRIBUTOR_ROLES}
+    summary["lastUpdated"] = None
+    for c in db.history_contributors.find(query):
+        for role in CONTRIBUTOR_ROLES:
+            summary[role].update(c.get(role, []))
+        if c.get("lastUpdated") and (summary["lastUpdated"] is None or c["lastUpdated"] > summary["lastUpdated"]):
+            summary["lastUpdated"] = c["lastUpdated"]
+
+    # Don't list copiers and translators as editors as well
+    summary["editors"] -= summary["copiers"] | summary["translators"]
+    return summary
+
+
 def process_index_title_change_in_history(indx, **kwargs):
     """
-    Update all history entries which reference 'old' to 'new'.
+    Update all history entries which reference 'old' to 'new', and the contributors, checkpoints and revision counts kept from them.
     """
     if indx.is_commentary():
         pattern = ur'{} on '.format(re.escape(kwargs["old"]))
@@ -169,6 +491,11 @@ def process_index_title_change_in_history(indx, **kwargs):
     text_hist = HistorySet({"ref": {"$regex": pattern}})
     for h in text_hist:
         h.ref = h.ref.replace(kwargs["old"], kwargs["new"], 1)
+        if getattr(h, "section_ref", None):
+            try:
+                h.load_from_dict(history_ref_fields(text.Ref(h.ref)))
+            except InputError:
+                pass
         h.save()
 
     link_hist = HistorySet({"new.refs": {"$regex": pattern}})
@@ -181,6 +508,25 @@ def process_index_title_change_in_history(indx, **kwargs):
         h.new["ref"] = h.new["ref"].replace(kwargs["old"], kwargs["new"], 1)
         h.save()
 
+    for c in db.history_contributors.find({"ref": {"$regex": pattern}}, {"ref": 1, "section_ref": 1}):
+        db.history_contributors.update({"_id": c["_id"]}, {"$set": {
+            "ref": c["ref"].replace(kwargs["old"], kwargs["new"], 1),
+            "section_ref": c["section_ref"].replace(kwargs["old"], kwargs["new"], 1)
+        }})
+
+    for c in db.history_checkpoints.find({"ref": {"$regex": pattern}}, {"ref": 1}):
+        db.history_checkpoints.update({"_id": c["_id"]}, {"$set": {"ref": c["ref"].replace(kwargs["old"], kwargs["new"], 1)}})
+
+    section_re = re.compile(pattern)
+    for c in db.counters.find({"_id": {"$regex": ur"^segment_revisions\|"}}):
+        lang, version, section = c["_id"].split(u"|", 3)[1:]
+        if not section_re.search(section):
+            continue
+        old_id = c["_id"]
+        c["_id"] = _revision_count_id(section.replace(kwargs["old"], kwargs["new"], 1), version, lang)
+        db.counters.save(c)
+        db.counters.remove({"_id": old_id})
+
     title_hist = HistorySet({"title": {"$regex": title_pattern}})
     for h in title_hist:
         h.title = h.title.replace(kwargs["old"], kwargs["new"], 1)
@@ -189,7 +535,7 @@ def process_index_title_change_in_history(indx, **kwargs):
 
 def process_version_title_change_in_history(ver, **kwargs):
     """
-    Rename a text version title in history records
+    Rename a text version title in history records, and in the contributors, checkpoints and revision counts kept from them.
     'old' and 'new' are the version title names.
     """
     query = {
@@ -197,4 +543,13 @@ def process_version_title_change_in_history(ver, **kwargs):
         "version": kwargs["old"],
         "language": ver.language,
     }
-    db.history.update(query, {"$set": {"version": kwargs["new"]}}, upsert=False, multi=True)
\ No newline at end of file
+    db.history.update(query, {"$set": {"version": kwargs["new"]}}, upsert=False, multi=True)
+    db.history_contributors.update(query, {"$set": {"version": kwargs["new"]}}, upsert=False, multi=True)
+    db.history_checkpoints.update(query, {"$set": {"version": kwargs["new"]}}, upsert=False, multi=True)
+
+    prefix = _revision_count_id(u"", kwargs["old"], ver.language)
+    for c in db.counters.find({"_id": {"$regex": u"^{}{}(?= \d)".format(re.escape(prefix), re.escape(ver.title))}}):
+        section = c["_id"][len(prefix):]
+        c["_id"] = _revision_count_id(section, kwargs["new"], ver.language)
+        db.counters.save(c)
+        db.counters.remove({"_id": _revision_count_id(section, kwargs["old"], ver.language)})
\ No newline at end of file
@@ -0,0 +1,320 @@
+# -*- coding: utf-8 -*-
+"""
+leaderboard.py - running totals of contribution points, for leaderboards
+Writes to MongoDB Collections: leaders_alltime, leaders_1, leaders_7, leaders_30, leader_days, leader_windows
+
+Points of each history record are added to the totals of its user as the record is saved.
+leaders_{n} hold the totals of the last n days, counting today.
+leader_days holds the totals of each user for each of the last days, so that a day can be subtracted from a window when it passes out of it.
+leader_windows holds the first day of each window, as {"_id": n, "start": datetime}.
+The texts of each user are counted in textCounts.  leader_texts() lists them, most worked on first.
+"""
+import re
+from datetime import datetime, timedelta
+from collections import defaultdict
+
+from sefaria.system.database import db
+
+import logging
+logger = logging.getLogger(__name__)
+
+WINDOWS = (1, 7, 30)  # days
+
+COUNTERS = ["translateCount", "addCount", "editCount", "linkCount", "noteCount", "reviewCount"]
+
+# Fields of history records that points are calculated from
+HISTORY_FIELDS = {"user": 1, "date": 1, "rev_type": 1, "language": 1, "version": 1, "revert_patch": 1, "ref": 1, "refs": 1}
+
+# rev_type: (points, counter) for records with fixed points
+_POINTS = {
+    "revert text": (1, None),
+    "review":      (15, "reviewCount"),
+    "add index":   (5, None),
+    "edit index":  (1, "editCount"),
+    "add link":    (2, "linkCount"),
+    "edit link":   (1, "editCount"),
+    "delete link": (1, None),
+    "add note":    (1, "noteCount"),
+    "edit note":   (1, None),
+    "delete note": (1, None),
+}
+
+
+def history_points(record):
+    """
+    :param record: dict of a history record
+    :return tuple: (points for the record, name of the counter it adds to or None)
+    """
+    rev_type = record.get("rev_type")
+    if rev_type == "add text":
+        length = len(record.get("revert_patch") or "")
+        if record.get("language") != "he" and record.get("version") == "Sefaria Community Translation":
+            return max(length / 10.0, 10), "translateCount"
+        elif record.get("language") != "he":
+            return max(length / 400.0, 2), "addCount"
+        else:
+            return max(length / 800.0, 1), "addCount"
+    if rev_type == "edit text":
+        return max(len(record.get("revert_patch") or "") / 1200.0, 1), "editCount"
+    return _POINTS.get(rev_type, (0, None))
+
+
+def history_texts(record):
+    """
+    :return list: Names of the texts worked on in a history record - the part of each ref before its first digit
+    """
+    if record.get("ref"):
+        refs = [record["ref"]]
+    elif record.get("refs") and len(record["refs"]) > 1 and record["refs"][0] and record["refs"][1]:
+        refs = record["refs"][:2]
+    else:
+        refs = []
+    texts = []
+    for tref in refs:
+        m = re.search(r"\d", tref)
+        texts.append((tref[:m.start()] if m else tref).strip())
+    return texts
+
+
+def _new_totals():
+    totals = {"count": 0, "texts": defaultdict(int)}
+    totals.update({c: 0 for c in COUNTERS})
+    return totals
+
+
+def add_to_totals(totals, record):
+    points, counter = history_points(record)
+    totals["count"] += points
+    if counter:
+        totals[counter] += 1
+    for t in history_texts(record):
+        totals["texts"][t] += 1
+
+
+def _merge_totals(totals, other):
+    for key in ["count"] + COUNTERS:
+        totals[key] += other[key]
+    for t, n in other["texts"].iteritems():
+        totals["texts"][t] += n
+
+
+def aggregate_history(records):
+    """
+    Totals the points of history records for each user, in one pass over them.
+    Counts the same records as record_history() and rebuild_leaderboards().
+    :param records: iterable of history records, e.g. a cursor of db.history
+    :return list: {"user", "count", "texts", and each of COUNTERS} for each user, highest count first
+    """
+    leaders = defaultdict(_new_totals)
+    for record in records:
+        if not _counted(record):
+            continue
+        add_to_totals(leaders[record["user"]], record)
+    results = []
+    for user, totals in leaders.iteritems():
+        totals["user"] = user
+        totals["texts"] = dict(totals["texts"])
+        results.append(totals)
+    return sorted(results, key=lambda x: -x["count"])
+
+
+def _day(date):
+    return datetime(date.year, date.month, date.day)
+
+
+def _text_key(title):
+    # Mongo field names can't contain "." or start with "$"
+    return title.replace(u".", u"．").replace(u"$", u"＄")
+
+
+def _text_title(key):
+    return key.replace(u"．", u".").replace(u"＄", u"$")
+
+
+def leader_texts(leader):
+    """
+    :param leader: dict of a leaders document
+    :return list: Titles of the texts the user worked on, most worked on first
+    """
+    text_counts = leader.get("textCounts", {})
+    return [_text_title(k) for k, n in sorted(text_counts.items(), key=lambda kn: -kn[1]) if n > 0]
+
+
+def _increments(totals, sign=1):
+    """
+    :return dict: $inc of a leaders or leader_days document, for totals.  Always includes count, so that new documents have one.
+    """
+    inc = {key: sign * totals[key] for key in COUNTERS if totals[key]}
+    inc["count"] = sign * totals["count"]
+    inc.update({u"textCounts." + _text_key(t): sign * n for t, n in totals["texts"].iteritems()})
+    return inc
+
+
+def _bucket_totals(bucket):
+    totals = _new_totals()
+    for key in ["count"] + COUNTERS:
+        totals[key] = bucket.get(key, 0)
+    for k, n in bucket.get("textCounts", {}).iteritems():
+        totals["texts"][_text_title(k)] = n
+    return totals
+
+
+def _add_to_leader(collection, user, inc):
+    db[collection].update({"_id": user}, {"$inc": inc, "$set": {"date": datetime.now()}}, upsert=True)
+
+
+def _leader_doc(user, totals):
+    doc = {key: totals[key] for key in ["count"] + COUNTERS}
+    doc.update({
+        "_id":        user,
+        "textCounts": {_text_key(t): n for t, n in totals["texts"].iteritems()},
+        "date":       datetime.now()
+    })
+    return doc
+
+
+def _counted(record):
+    """
+    :return bool: True if record adds to leaderboards - if it has a user, and points or texts
+    """
+    return record.get("user") is not None and bool(history_points(record)[0] or history_texts(record))
+
+
+def record_history(records, sign=1):
+    """
+    Adds the points of newly saved history records to the totals of their users,
+    in leaders_alltime, in each window that includes the day of the record, and in leader_days.
+    Windows are rolled forward first, if a day has passed since they were last rolled.
+    :param records: list of history record dicts
+    :param sign: -1 subtracts the points of records that were removed from history
+    """
+    windows = current_windows()
+    oldest = min(start for collection, start in windows if start)
+    buckets = defaultdict(_new_totals)
+    for record in records:
+        if not _counted(record):
+            continue
+        add_to_totals(buckets[(record["user"], _day(record.get("date") or datetime.now()))], record)
+
+    for (user, day), totals in buckets.iteritems():
+        inc = _increments(totals, sign)
+        if day >= oldest:
+            db.leader_days.update({"user": user, "day": day}, {"$inc": inc}, upsert=True)
+        for collection, start in windows:
+            if start is None or day >= start:
+                _add_to_leader(collection, user, inc)
+                if sign < 0:
+                    db[collection].remove({"_id": user, "count": {"$lte": 0.001}})
+
+
+def current_windows(today=None):
+    """
+    Rolls each window forward to today, if it isn't there yet.
+    :return list: (collection, first day) of leaders_alltime, with None as its first day, and of each window
+    """
+    today = _day(today or datetime.now())
+    return [("leaders_alltime", None)] + [("leaders_%d" % days, roll_window(days, today)) for days in WINDOWS]
+
+
+def roll_window(days, today=None):
+    """
+    Moves the window of 'days' days so that it ends today, subtracting the totals of each day that leaves it.
+    A window that doesn't exist yet is built from leader_days.
+    :return datetime: the first day of the window
+    """
+    today = _day(today or datetime.now())
+    start = today - timedelta(days - 1)
+    window = db.leader_windows.find_one({"_id": days})
+    if window is None:
+        _build_window(days, start)
+        return start
+    if window["start"] >= start:
+        return window["start"]
+
+    # Claim the roll, so that with concurrent writers expired days are subtracted once
+    if db.leader_windows.find_and_modify({"_id": days, "start": window["start"]}, {"$set": {"start": start}}) is None:
+        return start
+    collection = "leaders_%d" % days
+    for bucket in db.leader_days.find({"day": {"$gte": window["start"], "$lt": start}}):
+        _add_to_leader(collection, bucket["user"], _increments(_bucket_totals(bucket), sign=-1))
+    db[collection].remove({"count": {"$lte": 0.001}})
+    db.leader_days.remove({"day": {"$lt": today - timedelta(max(WINDOWS) - 1)}})
+    return start
+
+
+def _build_window(days, start):
+    collection = "leaders_%d" % days
+    leaders = defaultdict(_new_totals)
+    for bucket in db.leader_days.find({"day": {"$gte": start}}):
+        _merge_totals(leaders[bucket["user"]], _bucket_totals(bucket))
+    db[collection].remove({})
+    if leaders:
+        db[collection].insert([_leader_doc(user, totals) for user, totals in leaders.iteritems()])
+    db.leader_windows.save({"_id": days, "start": start})
+
+
+def rebuild_leaderboards(today=None):
+    """
+    Rebuilds leaderboards, day totals and windows from the whole history collection, in one pass over it.
+    Sheet points are not included - see set_sheet_points().
+    """
+    today = _day(today or datetime.now())
+    oldest = today - timedelta(max(WINDOWS) - 1)
+    alltime = defaultdict(_new_totals)
+    daily = defaultdict(_new_totals)
+    for record in db.history.find({}, HISTORY_FIELDS):
+        if not _counted(record):
+            continue
+        add_to_totals(alltime[record["user"]], record)
+        day = _day(record["date"])
+        if day >= oldest:
+            add_to_totals(daily[(record["user"], day)], record)
+
+    db.leader_days.remove({})
+    if daily:
+        buckets = []
+        for (user, day), totals in daily.iteritems():
+            bucket = {"user": user, "day": day, "textCounts": {_text_key(t): n for t, n in totals["texts"].iteritems()}}
+            bucket.update({key: totals[key] for key in ["count"] + COUNTERS})
+            buckets.append(bucket)
+        db.leader_days.insert(buckets)
+
+    db.leaders_alltime.remove({})
+    if alltime:
+        db.leaders_alltime.insert([_leader_doc(user, totals) for user, totals in alltime.iteritems()])
+
+    for days in WINDOWS:
+        _build_window(days, today - timedelta(days - 1))
+
+
+def set_sheet_points(collection, points, counts):
+    """
+    Sets the points users have for source sheets in a leaderboard, and adjusts their totals by the change.
+    :param collection: name of a leaders collection
+    :param points: dict of user: sheet points
+    :param counts: dict of user: number of sheets
+    """
+    for doc in db[collection].find({"sheetPoints": {"$gt": 0}}, {"sheetPoints": 1}):
+        points.setdefault(doc["_id"], 0)
+    for user, p in points.iteritems():
+        old = db[collection].find_and_modify(
+            {"_id": user},
+            {"$set": {"sheetPoints": p, "sheetCount": counts.get(user, 0)}},
+            upsert=True,
+            fields={"sheetPoints": 1}
+        )
+        change = p - (old or {}).get("sheetPoints", 0)
+        if change or old is None:
+            db[collection].update({"_id": user}, {"$inc": {"count": change}})
+    db[collection].remove({"count": {"$lte": 0.001}})
+
+
+def ensure_leaderboard_indexes():
+    db.leader_days.ensure_index([("user", 1), ("day", 1)], unique=True)
+    db.leader_days.ensure_index("day")
+    for collection in ["leaders_alltime"] + ["leaders_%d" % days for days in WINDOWS]:
+        db[collection].ensure_index("count")
+
+
+def process_history_creation_in_leaderboards(hist, **kwargs):
+    record_history([hist.contents()])
@@ -21,6 +21,8 @@ class Link(abst.AbstractMongoRecord):
     """
     collection = 'links'
     history_noun = 'link'
+    track_pkeys = True
+    pkeys = ["refs"]
 
     required_attrs = [
         "type",           # string of connection type
@@ -30,7 +32,8 @@ class Link(abst.AbstractMongoRecord):
         "anchorText",     # string of dibbur hamatchil (largely depcrated) 
         "auto",           # bool whether generated by automatic process
         "generated_by",   # string in ("add_commentary_links", "add_links_from_test")
-        "source_text_oid" # oid of text from which link was generated
+        "source_text_oid", # oid of text from which link was generated
+        "refAddresses"    # list of indexable addresses of refs, derived on save.  See ref_address()
     ]
 
     def _normalize(self):
@@ -50,7 +53,14 @@ class Link(abst.AbstractMongoRecord):
 
         return True
 
+    def contents(self):
+        d = super(Link, self).contents()
+        d.pop("refAddresses", None)
+        return d
+
     def _pre_save(self):
+        self.refAddresses = [ref_address(text.Ref(tref)) for tref in self.refs]
+
         if getattr(self, "_id", None) is None:
             # Don't bother saving a connection that already exists, or that has a more precise link already
             samelink = Link().load({"refs": self.refs})
@@ -69,9 +79,7 @@ class Link(abst.AbstractMongoRecord):
                     {'$and':
                         [
                             {'refs': self.refs[0]},
-                            {'refs':
-                                {'$regex': text.Ref(self.refs[1]).regex()}
-                            }
+                            ref_address_query(text.Ref(self.refs[1]))
                         ]
                     }
                 )
@@ -88,13 +96,142 @@ class LinkSet(abst.AbstractMongoSet):
     def __init__(self, query_or_ref={}, page=0, limit=0):
         '''
         LinkSet can be initialized with a query dictionary, as any other MongoSet.
-        It can also be initialized with a :py:class: `sefaria.text.Ref` object, and will use the :py:meth: `sefaria.text.Ref.regex()` method to return the set of Links that refer to that Ref or below.
-        :param query_or_ref: A query dict, or a :py:class: `sefaria.text.Ref` object
+        It can also be initialized with a :py:class: `sefaria.text.Ref` object, or a list of them,
+        and will use :py:func: `ref_address_query` to return the set of Links that refer to those Refs or below, in one query.
+        :param query_or_ref: A query dict, a :py:class: `sefaria.text.Ref` object, or a list of Ref objects
         '''
+        if isinstance(query_or_ref, text.Ref):
+            query_or_ref = ref_address_query(query_or_ref)
+        elif isinstance(query_or_ref, list):
+            query_or_ref = {"$or": [ref_address_query(oref) for oref in query_or_ref]} if query_or_ref else {"_id": None}
+        super(LinkSet, self).__init__(query_or_ref, page, limit)
+
+
+"""
+Link addresses.
+Each Link stores, in refAddresses, an address for each of its refs:
+    book  - the book of the ref (Ref.book)
+    path  - the sections above the lowest level of the ref, joined with ":".  "" for a single level ref.  None for a bare book.
+    start - the lowest level section number of the ref.  0 for a bare book.
+    end   - the lowest level section number at the end of the ref, for simple ranges.  None if the ref spans sections.
+These are indexed, so that Links to a Ref can be looked up with range and equality queries, rather than with a regex over "refs".
+Links written without refAddresses (saved before they were maintained, or written directly to db.links by scripts)
+are still matched with a regex over "refs", restricted through the same index to links that have no addresses.
+add_ref_addresses_to_links() sets them.
+"""
+
+
+def ref_address(oref):
+    """
+    :param oref: Ref
+    :return dict: The indexable address of oref, as stored in Link.refAddresses
+    """
+    if not oref.sections:
+        return {"book": oref.book, "path": None, "start": 0, "end": 0}
+    parent = oref.sections[:-1]
+    return {
+        "book": oref.book,
+        "path": u":".join([unicode(s) for s in parent]),
+        "start": oref.sections[-1],
+        "end": oref.toSections[-1] if oref.toSections[:-1] == parent else None
+    }
+
+
+def ref_address_query(oref):
+    """
+    Returns a query that selects Links with a ref that is equal to, or more specific than, oref.
+    For non range refs, this selects the same links as {"refs": {"$regex": oref.regex()}}.
+    Ranged link refs are selected if they fall entirely within oref.
+    Links without refAddresses are matched with oref.regex().
+    :param oref: Ref
+    :return dict: Mongo query
+    """
+    refs = oref.split_spanning_ref() if oref.is_spanning() else [oref]
+    clauses = []
+    for r in refs:
+        clauses += _ref_address_clauses(r)
+    clauses.append({"refAddresses.book": None, "refs": {"$regex": oref.regex()}})
+    return {"$or": clauses}
+
+
+def _ref_address_clauses(oref):
+    if not oref.sections:
+        return [{"refAddresses.book": oref.book}]
+
+    parent = [unicode(s) for s in oref.sections[:-1]]
+    first, last = oref.sections[-1], oref.toSections[-1]
+    clauses = [{"refAddresses": {"$elemMatch": {  # Refs at the same level
+        "book": oref.book,
+        "path": u":".join(parent),
+        "start": {"$gte": first, "$lte": last},
+        "end": {"$lte": last}
+    }}}]
+    if len(oref.sections) < oref.index_node.depth:  # Refs one level down
+        paths = [u":".join(parent + [unicode(i)]) for i in range(first, last + 1)]
+        clauses.append({"refAddresses": {"$elemMatch": {"book": oref.book, "path": {"$in": paths}}}})
+        if len(oref.sections) < oref.index_node.depth - 1:  # Refs further down, with an anchored prefix match on path
+            for path in paths:
+                clauses.append({"refAddresses": {"$elemMatch": {"book": oref.book, "path": {"$regex": u"^" + path + u":"}}}})
+    return clauses
+
+
+def link_addresses(link):
+    """
+    :param link: Link
+    :return list: The addresses of the refs of link - its refAddresses, or derived from its refs if it has none
+    """
+    addresses = getattr(link, "refAddresses", None)
+    if addresses:
+        return addresses
+    return [ref_address(text.Ref(tref)) for tref in link.refs]
+
+
+def address_in_ref(address, oref):
+    """
+    Python equivalent of ref_address_query(), for a single address.
+    :param address: dict, as returned by ref_address()
+    :param oref: Ref
+    :return bool: True if address is equal to, or more specific than, oref
+    """
+    if address["book"] != oref.book:
+        return False
+    refs = oref.split_spanning_ref() if oref.is_spanning() else [oref]
+    for r in refs:
+        if not r.sections:
+            return True
+        if address["path"] is None:
+            continue
+        parent = [unicode(s) for s in r.sections[:-1]]
+        first, last = r.sections[-1], r.toSections[-1]
+        parts = address["path"].split(u":") if address["path"] else []
+        if parts == parent and first <= address["start"] <= last and address["end"] is not None and address["end"] <= last:
+            return True
+        if len(parts) >= len(r.sections) and parts[:len(parent)] == parent and first <= int(parts[len(parent)]) <= last:
+            return True
+    return False
+
+
+def ensure_link_address_index():
+    db.links.ensure_index([("refAddresses.book", 1), ("refAddresses.path", 1), ("refAddresses.start", 1)])
+
+
+def add_ref_addresses_to_links(query={}):
+    """
+    Sets refAddresses on existing links, without going through Link.save().
+    Used to backfill links saved before refAddresses were maintained.
+    :return int: the number of links updated
+    """
+    ensure_link_address_index()
+    count = 0
+    for l in db.links.find(query, {"refs": 1}):
         try:
-            super(LinkSet, self).__init__({"refs": {"$regex": query_or_ref.regex()}}, page, limit)
-        except AttributeError:
-            super(LinkSet, self).__init__(query_or_ref, page, limit)
+            addresses = [ref_address(text.Ref(tref)) for tref in l["refs"]]
+        except (InputError, TypeError, IndexError):
+            logger.warning(u"Can not set addresses on link {}: {}".format(l["_id"], l.get("refs")))
+            continue
+        db.links.update({"_id": l["_id"]}, {"$set": {"refAddresses": addresses}})
+        count += 1
+    return count
 
 
 def process_index_title_change_in_links(indx, **kwargs):
@@ -123,65 +260,184 @@ def process_index_delete_in_links(indx, **kwargs):
     LinkSet({"refs": {"$regex": pattern}}).delete()
 
 
+"""
+Link counts.
+The link_counts collection holds the number of links between every pair of books, as {"book1", "book2", "count"}.
+Pairs of different books are stored in both orders, so that either book can be looked up in book1.
+It is built once with rebuild_link_counts(), and kept current by the Link notifications below.
+"""
+
+
+def _books_of_link(link):
+    """
+    :return list: The books of the two refs of link, or None if they can't be determined
+    """
+    addresses = getattr(link, "refAddresses", None)
+    if addresses:
+        return [a["book"] for a in addresses]
+    return _books_of_refs(link.refs)
+
+
+def _books_of_refs(refs):
+    """
+    :return list: The books of a pair of refs, or None if refs isn't a pair of refs that parse
+    """
+    if not isinstance(refs, list) or len(refs) != 2 or not all(isinstance(tref, basestring) for tref in refs):
+        return None
+    try:
+        return [text.Ref(tref).book for tref in refs]
+    except Exception:
+        return None
+
+
+def _link_count_pairs(books):
+    b1, b2 = books
+    return [(b1, b2)] if b1 == b2 else [(b1, b2), (b2, b1)]
+
+
+def ensure_link_count_index():
+    db.link_counts.ensure_index([("book1", 1), ("book2", 1)], unique=True)
+
+
+def update_link_counts(books, delta):
+    """
+    Adds delta to the count of links between the two books
+    :param books: list of two book titles
+    :param delta: int
+    """
+    for b1, b2 in _link_count_pairs(books):
+        db.link_counts.update({"book1": b1, "book2": b2}, {"$inc": {"count": delta}}, upsert=True)
+
+
+def rebuild_link_counts():
+    """
+    Recounts all links, in one pass over the links collection, and replaces the contents of link_counts.
+    :return int: The number of book pairs counted
+    """
+    counts = {}
+    for l in db.links.find({}, {"refs": 1, "refAddresses.book": 1}):
+        if l.get("refAddresses"):
+            books = [a["book"] for a in l["refAddresses"]]
+        else:
+            books = _books_of_refs(l["refs"])
+            if not books:
+                logger.warning(u"Can not count link {}: {}".format(l["_id"], l.get("refs")))
+                continue
+        for pair in _link_count_pairs(books):
+            counts[pair] = counts.get(pair, 0) + 1
+
+    db.link_counts.remove({})
+    ensure_link_count_index()
+    docs = [{"book1": b1, "book2": b2, "count": count} for (b1, b2), count in counts.iteritems()]
+    for i in range(0, len(docs), 1000):
+        db.link_counts.insert(docs[i:i + 1000])
+    return len(docs)
+
+
+def process_link_creation_in_link_counts(link, **kwargs):
+    books = _books_of_link(link)
+    if books:
+        update_link_counts(books, 1)
+
+
+def process_link_deletion_in_link_counts(link, **kwargs):
+    books = _books_of_link(link)
+    if books:
+        update_link_counts(books, -1)
+    else:
+        logger.warning(u"Can not uncount deleted link: {}".format(link.refs))
+
+
+def process_link_refs_change_in_link_counts(link, **kwargs):
+    old_books = _books_of_refs(kwargs["old"])
+    new_books = _books_of_link(link)
+    if old_books == new_books:
+        return
+    # When a book is renamed, the old refs no longer parse.  The old book's counts are removed with process_index_title_change_in_link_counts()
+    if old_books:
+        update_link_counts(old_books, -1)
+    if new_books:
+        update_link_counts(new_books, 1)
+
+
+def _index_books_pattern(indx, title):
+    if indx.is_commentary():
+        return ur'^{} on '.format(re.escape(title))
+    commentators = text.IndexSet({"categories.0": "Commentary"}).distinct("title")
+    return ur"(^{}$)|(^({}) on {}$)".format(re.escape(title), "|".join(commentators), re.escape(title))
+
+
+def _remove_book_link_counts(pattern):
+    db.link_counts.remove({"$or": [{"book1": {"$regex": pattern}}, {"book2": {"$regex": pattern}}]})
+
+
+def process_index_title_change_in_link_counts(indx, **kwargs):
+    """
+    Runs after the links themselves have been renamed, and counted under the new title.
+    """
+    _remove_book_link_counts(_index_books_pattern(indx, kwargs["old"]))
+
+
+def process_index_delete_in_link_counts(indx, **kwargs):
+    _remove_book_link_counts(_index_books_pattern(indx, indx.title))
+
+
+def _category_query(cat):
+    if cat == "Tanach" or cat == "Torah" or cat == "Prophets" or cat == "Writings":
+        return {"$and": [{"categories": cat}, {"categories": {"$ne": "Commentary"}}, {"categories": {"$ne": "Targum"}}]}
+    return {"categories": cat}
+
+
 #get_link_counts() and get_book_link_collection() are used in Link Explorer.
 #They have some client formatting code in them; it may make sense to move them up to sefaria.client or sefaria.helper
-link_counts = {}
 def get_link_counts(cat1, cat2):
-    global link_counts
-    key = cat1 + "-" + cat2
-    if link_counts.get(key):
-        return link_counts[key]
-
-    queries = []
-    for c in [cat1, cat2]:
-        if c == "Tanach" or c == "Torah" or c == "Prophets" or c == "Writings":
-            queries.append({"$and": [{"categories": c}, {"categories": {"$ne": "Commentary"}}, {"categories": {"$ne": "Targum"}}]})
-        else:
-            queries.append({"categories": c})
-
     titles = []
-    for q in queries:
+    for q in [_category_query(cat1), _category_query(cat2)]:
         ts = db.index.find(q).distinct("title")
         if len(ts) == 0:
             return {"error": "No results for {}".format(q)}
         titles.append(ts)
 
+    counts = {
+        (c["book1"], c["book2"]): c["count"]
+        for c in db.link_counts.find({"book1": {"$in": titles[0]}, "book2": {"$in": titles[1]}, "count": {"$gt": 0}})
+    }
+
     result = []
     for title1 in titles[0]:
         for title2 in titles[1]:
-            re1 = r"^{} \d".format(title1)
-            re2 = r"^{} \d".format(title2)
-            links = LinkSet({"$and": [{"refs": {"$regex": re1}}, {"refs": {"$regex": re2}}]})  # db.links.find({"$and": [{"refs": {"$regex": re1}}, {"refs": {"$regex": re2}}]})
-            if links.count():
-                result.append({"book1": title1.replace(" ","-"), "book2": title2.replace(" ", "-"), "count": links.count()})
-
-    link_counts[key] = result
+            if counts.get((title1, title2)):
+                result.append({"book1": title1.replace(" ","-"), "book2": title2.replace(" ", "-"), "count": counts[(title1, title2)]})
     return result
 
 
 def get_book_link_collection(book, cat):
 
-    if cat == "Tanach" or cat == "Torah" or cat == "Prophets" or cat == "Writings":
-        query = {"$and": [{"categories": cat}, {"categories": {"$ne": "Commentary"}}, {"categories": {"$ne": "Targum"}}]}
-    else:
-        query = {"categories": cat}
-
+    query = _category_query(cat)
     titles = text.IndexSet(query).distinct("title")
     if len(titles) == 0:
         return {"error": "No results for {}".format(query)}
 
-    book_re = r'^{} \d'.format(book)
-    cat_re = r'^({}) \d'.format('|'.join(titles))
+    # Look for links with addresses only to the books that the link counts say have any.
+    # Links without addresses are matched on their refs, as in ref_address_query().
+    counted = db.link_counts.find({"book1": book, "book2": {"$in": titles}, "count": {"$gt": 0}}).distinct("book2")
+    book_re = ur'^{} \d'.format(re.escape(book))
+    cat_re = ur'^({}) \d'.format(u'|'.join([re.escape(t) for t in titles]))
+    clauses = [{"refAddresses.book": None, "$and": [{"refs": {"$regex": book_re}}, {"refs": {"$regex": cat_re}}]}]
+    if counted:
+        clauses.append({"$and": [{"refAddresses.book": book}, {"refAddresses.book": {"$in": counted}}]})
 
     link_re = r'^(?P<title>.+) (?P<loc>\d.*)$'
     ret = []
 
-    links = LinkSet({"$and": [{"refs": {"$regex": book_re}}, {"refs": {"$regex": cat_re}}]})
+    links = LinkSet({"$or": clauses})
     for link in links:
         l1 = re.match(link_re, link.refs[0])
         l2 = re.match(link_re, link.refs[1])
+        if not l1 or not l2:
+            continue
         ret.append({
             "r1": {"title": l1.group("title").replace(" ", "-"), "loc": l1.group("loc")},
             "r2": {"title": l2.group("title").replace(" ", "-"), "loc": l2.group("loc")}
         })
-    return ret
\ No newline at end of file
+    return ret
@@ -1,26 +1,34 @@
 """
 notifications.py - handle user event notifications
 
-Writes to MongoDB Collection: notifications
+Writes to MongoDB Collections: notifications, notification_fanouts
 """
 import copy
 import os
 import sys
-from datetime import datetime
+import time
+from datetime import datetime, timedelta
 
 import json
 from bson.objectid import ObjectId
 
+from django.core.cache import cache
 from django.template.loader import render_to_string
 
+import logging
+logger = logging.getLogger(__name__)
+
 from . import abstract as abst
 from sefaria.system.database import db
-from sefaria.utils.users import user_name
+from sefaria.settings import NOTIFICATION_FANOUT_CHUNK_SIZE, NOTIFICATION_FANOUT_STALE_SECONDS, UNREAD_COUNT_CACHE_SECONDS
+from sefaria.utils.users import user_name, user_directory
 
 
 class Notification(abst.AbstractMongoRecord):
     collection   = 'notifications'
     history_noun = 'notification'
+    track_pkeys  = True
+    pkeys        = ["read"]
 
     required_attrs = [
         "type",
@@ -109,8 +117,8 @@ class Notification(abst.AbstractMongoRecord):
 class NotificationSet(abst.AbstractMongoSet):
     recordClass = Notification
 
-    def __init__(self, query=None, page=0, limit=0, sort=[["date", -1]]):
-		super(NotificationSet, self).__init__(query=query, page=page, limit=limit, sort=sort)
+    def __init__(self, query=None, page=0, limit=0, sort=[["date", -1]], records=None):
+        super(NotificationSet, self).__init__(query=query, page=page, limit=limit, sort=sort, records=records)
 
     def unread_for_user(self, uid):
         """
@@ -143,7 +151,9 @@ class NotificationSet(abst.AbstractMongoSet):
         """
         Returns a nicely formatted string listing the people who acted in this notifcation set
         """
-        actors = [user_name(id) for id in self.actors_list()]
+        ids    = self.actors_list()
+        users  = user_directory.get_many(ids)
+        actors = [users[id]["name"] if id in users else user_name(id) for id in ids]
         top, more = actors[:3], actors[3:]
         if len(more) == 1:
             top[2] = "2 others"
@@ -164,3 +174,176 @@ class NotificationSet(abst.AbstractMongoSet):
 
 
 
+
+
+"""
+Unread counts.
+The number of unread notifications of each user is cached in the Django cache for UNREAD_COUNT_CACHE_SECONDS.
+Creating, reading and deleting notifications (see dependencies.py), and bulk writes to notifications, invalidate the
+counts of their users, which are counted again when next read.  Counts are not incremented in place, since the cache
+backend may not do that atomically.  A count read while a notification is written may be stale until it expires.
+"""
+
+
+def _unread_count_key(uid):
+    return "notifications.unread.%d" % uid
+
+
+def unread_count_for_user(uid):
+    """Returns the number of unread notifcations belonging to user uid"""
+    count = cache.get(_unread_count_key(uid))
+    if count is None:
+        count = db.notifications.find({"uid": uid, "read": False}).count()
+        cache.set(_unread_count_key(uid), count, UNREAD_COUNT_CACHE_SECONDS)
+    return count
+
+
+def invalidate_unread_counts(uids):
+    cache.delete_many([_unread_count_key(uid) for uid in uids])
+
+
+def process_notification_creation_in_unread_count(notification, **kwargs):
+    if not notification.read:
+        invalidate_unread_counts([notification.uid])
+
+
+def process_notification_read_change_in_unread_count(notification, **kwargs):
+    invalidate_unread_counts([notification.uid])
+
+
+def process_notification_deletion_in_unread_count(notification, **kwargs):
+    if not notification.read:
+        invalidate_unread_counts([notification.uid])
+
+
+"""
+Notification fan-out.
+Notifying every follower of a user is queued as one record in notification_fanouts, and written by a worker process
+(see run_fanout_worker), in chunks of NOTIFICATION_FANOUT_CHUNK_SIZE followers with one bulk insert each.
+Followers are notified in order of uid.  The record keeps the last uid notified, so that a fan-out whose worker
+stopped is resumed from there by another worker, once its claim is NOTIFICATION_FANOUT_STALE_SECONDS old.
+"""
+
+
+def queue_sheet_publish_fanout(publisher_id, sheet_id):
+    """
+    Queues notifications of the publication of sheet_id to the followers of publisher_id.
+    """
+    db.notification_fanouts.insert({
+        "type":     "sheet publish",
+        "actor":    publisher_id,
+        "content":  {"publisher": publisher_id, "sheet_id": sheet_id},
+        "date":     datetime.now(),
+        "last_uid": None,   # last follower notified
+        "notified": 0,      # number of followers notified
+        "claimed":  None,   # time a worker last claimed or made progress on this fan-out
+    })
+
+
+def cancel_sheet_publish_fanouts(publisher_id, sheet_id):
+    """
+    Removes queued fan-outs of the publication of sheet_id.  A worker that is running one stops after its current chunk.
+    """
+    db.notification_fanouts.remove({"type": "sheet publish", "content.publisher": publisher_id, "content.sheet_id": sheet_id})
+
+
+def ensure_fanout_indexes():
+    db.notification_fanouts.ensure_index([("claimed", 1), ("date", 1)])
+    db.following.ensure_index([("followee", 1), ("follower", 1)])
+    db.notifications.ensure_index([("uid", 1), ("read", 1)])
+
+
+def claim_fanout():
+    """
+    Claims the oldest fan-out that isn't claimed, or whose claim is stale.
+    :return dict: the fan-out record, or None
+    """
+    now = datetime.now()
+    stale = now - timedelta(seconds=NOTIFICATION_FANOUT_STALE_SECONDS)
+    return db.notification_fanouts.find_and_modify(
+        {"$or": [{"claimed": None}, {"claimed": {"$lt": stale}}]},
+        {"$set": {"claimed": now}},
+        sort=[("date", 1)],
+        new=True
+    )
+
+
+def _fanout_notifications_query(fanout, uids=None):
+    query = {"type": fanout["type"]}
+    query.update({"content." + key: value for key, value in fanout["content"].items()})
+    if uids is not None:
+        query["uid"] = {"$in": uids}
+    elif fanout["last_uid"] is not None:
+        query["uid"] = {"$gt": fanout["last_uid"]}
+    return query
+
+
+def fan_out(fanout, chunk_size=None):
+    """
+    Writes the notifications of a claimed fan-out, from the follower after its last_uid, and removes the fan-out when done.
+    :return int: number of notifications written
+    """
+    chunk_size = chunk_size or NOTIFICATION_FANOUT_CHUNK_SIZE
+    # Notifications after last_uid may have been written by a worker that stopped before recording its progress
+    partial = db.notifications.find(_fanout_notifications_query(fanout)).distinct("uid")
+    if partial:
+        db.notifications.remove(_fanout_notifications_query(fanout))
+        invalidate_unread_counts(partial)
+
+    written = 0
+    while True:
+        query = {"followee": fanout["actor"]}
+        if fanout["last_uid"] is not None:
+            query["follower"] = {"$gt": fanout["last_uid"]}
+        follows = db.following.find(query, {"follower": 1}).sort([("follower", 1)]).limit(chunk_size)
+        uids = sorted(set(f["follower"] for f in follows))
+        if not uids:
+            break
+
+        db.notifications.insert([
+            Notification({"uid": uid, "type": fanout["type"], "content": dict(fanout["content"]), "date": fanout["date"]}).contents()
+            for uid in uids
+        ])
+        invalidate_unread_counts(uids)
+        result = db.notification_fanouts.update(
+            {"_id": fanout["_id"]},
+            {"$set": {"last_uid": uids[-1], "claimed": datetime.now()}, "$inc": {"notified": len(uids)}}
+        )
+        if not result.get("n"):
+            # Cancelled while this chunk was written
+            db.notifications.remove(_fanout_notifications_query(fanout, uids))
+            invalidate_unread_counts(uids)
+            return written
+        fanout["last_uid"] = uids[-1]
+        written += len(uids)
+
+    db.notification_fanouts.remove({"_id": fanout["_id"]})
+    return written
+
+
+def process_fanouts(chunk_size=None):
+    """
+    Runs queued fan-outs until none are left.
+    :return int: number of fan-outs run
+    """
+    count = 0
+    fanout = claim_fanout()
+    while fanout:
+        try:
+            fan_out(fanout, chunk_size)
+        except Exception, e:
+            # The claim goes stale, and the fan-out is resumed later
+            logger.exception(u"Notification fan-out {} failed: {}".format(fanout["_id"], e))
+        count += 1
+        fanout = claim_fanout()
+    return count
+
+
+def run_fanout_worker(poll_seconds=5, chunk_size=None):
+    """
+    Runs fan-outs as they are queued.  Does not return.
+    """
+    ensure_fanout_indexes()
+    while True:
+        if not process_fanouts(chunk_size):
+            time.sleep(poll_seconds)
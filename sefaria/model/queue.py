@@ -1,16 +1,22 @@
 """
 queue.py
-Writes to MongoDB Collection: index_queue
+Writes to MongoDB Collection: index_queue, index_queue_dead_letter
 """
+from datetime import datetime
 
 import logging
 logger = logging.getLogger(__name__)
 
 from . import abstract as abst
+from . import text
+from sefaria.system.database import db
+from sefaria.system.exceptions import InputError
 
 
 class IndexQueue(abst.AbstractMongoRecord):
     """
+    A text waiting to be indexed for search.
+    There is at most one record for each ref/version/lang.  Saving again updates the time of the existing record.
     """
     collection = 'index_queue'
 
@@ -21,19 +27,45 @@ class IndexQueue(abst.AbstractMongoRecord):
         "ref"
     ]
     optional_attrs = [
-
+        "lastModified",  # datetime of the latest save of this record
+        "attempts",      # number of failed attempts to index
+        "nextAttempt",   # datetime before which a failed record is not retried
+        "error"          # message of the latest failure
     ]
 
-    #todo: This is written generically.  Do we want elsewhere?
+    def _normalize(self):
+        # Segments, and ranges within a section, are indexed with their section
+        if self.type != "ref":
+            return
+        try:
+            oref = text.Ref(self.ref)
+        except InputError:
+            return
+        if not oref.is_spanning() and len(oref.sections) >= oref.index_node.depth > 1:
+            oref = oref.section_ref()
+        self.ref = oref.normal()
+
     def save(self):
-        duplicate_query = {}
-        for attr in self.required_attrs:
-            duplicate_query[attr] = getattr(self, attr, None)
-        if self.__class__().load(duplicate_query):
-            logger.warning(u"Aborting save of {}.  Duplicate found: {}".format(self.__class__.__name__, vars(self)))
-        else:
-            super(self.__class__, self).save()
+        """
+        Upserts on (ref, version, lang, type), so that repeated saves of a text leave one record, with the time of the latest.
+        """
+        self._normalize()
+        self.lastModified = datetime.now()
+        key = {attr: getattr(self, attr, None) for attr in self.required_attrs}
+        rec = getattr(db, self.collection).find_and_modify(
+            key,
+            {"$set": {"lastModified": self.lastModified}, "$setOnInsert": {"attempts": 0}},
+            upsert=True,
+            new=True
+        )
+        self.load_from_dict(rec)
+        return self
 
 
 class IndexQueueSet(abst.AbstractMongoSet):
-    recordClass = IndexQueue
\ No newline at end of file
+    recordClass = IndexQueue
+
+
+def ensure_index_queue_index():
+    db.index_queue.ensure_index([("ref", 1), ("version", 1), ("lang", 1), ("type", 1)])
+    db.index_queue.ensure_index("nextAttempt")
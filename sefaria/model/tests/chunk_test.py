@@ -1,6 +1,9 @@
 import pytest
+from pymongo.collection import Collection
+from pymongo.cursor import Cursor
 
 from sefaria.model import *
+from sefaria.model.text import merge_section, get_merged_section, rebuild_merged_sections, _flatten
 from sefaria.system.exceptions import InputError
 from sefaria.utils.util import list_depth
 
@@ -140,6 +143,91 @@ def test_chapter_result_merge():
         assert key in c
 
 
+def test_cached_chunks():
+    # Entries cached by earlier runs would make every lookup a hit
+    for title in ["Genesis", "Shabbat", "Rashi on Exodus"]:
+        text_chunk_cache.clear(title)
+    text_chunk_cache.reset_stats()
+    for tref in ["Genesis 1", "Genesis 1:3", "Genesis 1:3-6", "Shabbat 7a:12", "Rashi on Exodus 3:2"]:
+        oref = Ref(tref)
+        for lang in ["en", "he"]:
+            vset = VersionSet(oref.condition_query(lang), proj=oref.part_projection())
+            first = TextChunk(oref, lang)
+            second = TextChunk(oref, lang)
+            assert first.text == second.text
+            assert first.is_merged == second.is_merged == (len(set(vset.merge(oref.storage_address())[1])) > 1)
+            if vset.count():
+                vtitle = vset[0].versionTitle
+                assert TextChunk(oref, lang, vtitle).text == first.trim_text(getattr(vset[0], oref.storage_address()))
+
+    stats = text_chunk_cache.stats()
+    assert stats["Genesis"]["hits"] >= 4
+    assert 0 < stats["Genesis"]["hitRate"] < 1
+    assert not TextChunk(Ref("Genesis 1"), "en", "Nonexistent Version").version()
+
+
+def test_merged_sections():
+    for tref in ["Mishnah Yoma 1", "Genesis 1", "Rashi on Exodus 3"]:
+        oref = Ref(tref)
+        for lang in ["en", "he"]:
+            vset = VersionSet(oref.condition_query(lang), proj=oref.part_projection())
+            rebuild_merged_sections(oref.book, lang)
+            merged = get_merged_section(oref, lang)
+            assert [v["versionTitle"] for v in merged["versions"]] == [v.versionTitle for v in vset]
+            if vset.count() > 1:
+                text, sources = vset.merge(oref.storage_address())
+                assert merged["text"] == text[0]
+                assert _flatten(merged["sources"]) == sources
+                assert TextChunk(oref, lang).sources == (sources if len(set(sources)) > 1 else [])
+
+
+def test_merge_section():
+    assert merge_section([["a", "", ""], ["", "b", "c", "d"]], ["v1", "v2"]) == (["a", "b", "c", "d"], ["v1", "v2", "v2", "v2"])
+    assert merge_section([[["a"], []], [["x", "y"], ["z"]]], ["v1", "v2"]) == ([["a", "y"], ["z"]], [["v1", "v2"], ["v2"]])
+    assert merge_section([["", ""], [""]], ["v1", "v2"]) == ([0, 0], ["v1", "v1"])
+    assert merge_section([["a", ""]], ["v1"]) == (["a", ""], ["v1", "v1"])
+
+
+def _count_text_queries(monkeypatch):
+    """
+    Records the name of the collection of each query of texts and merged_sections
+    """
+    queries = []
+
+    def counted(original, collection_name):
+        def method(self, *args, **kwargs):
+            if collection_name(self) in ["texts", "merged_sections"]:
+                queries.append(collection_name(self))
+            return original(self, *args, **kwargs)
+        return method
+
+    for name in ["find", "find_one"]:
+        monkeypatch.setattr(Collection, name, counted(getattr(Collection, name), lambda c: c.name))
+    monkeypatch.setattr(Cursor, "count", counted(Cursor.count, lambda c: c.collection.name))
+    return queries
+
+
+def test_batched_family(monkeypatch):
+    cases = [
+        (Ref("Genesis 1:3"), {}),
+        (Ref("Mishnah Yoma 1"), {}),
+        (Ref("Rashi on Exodus 3:2"), {}),
+        (Ref("Shabbat 7a"), {"lang": "en", "version": "Sefaria Community Translation"}),
+        (Ref("Daniel 2"), {"lang": "he", "version": "Tanach with Nikkud"}),
+        (Ref("Hadran"), {"context": 0}),
+    ]
+    for oref, kwargs in cases:
+        for commentary in [False, True]:
+            expected = TextFamily(oref, commentary=commentary, **kwargs).contents()
+            queries = _count_text_queries(monkeypatch)
+            family = TextFamily(oref, commentary=commentary, batched=True, **kwargs)
+            monkeypatch.undo()
+            assert family.contents() == expected
+            if not kwargs.get("version"):
+                # Cached sections were read by the unbatched family, so only the version list is queried, if anything
+                assert len(queries) <= 1
+
+
 def test_validate():
     passing_refs = [
         Ref("Exodus"),
@@ -257,6 +345,17 @@ def test_save():
     c.text = "Text for 1:5"
     c.save()
 
+    # a cached section is invalidated when written
+    assert TextChunk(Ref("Pirkei Avot 2"), "en", "Pirkei Avot Test").text == ["", "", "Text for 2:3"]
+    c = TextChunk(Ref("Pirkei Avot 2:4"), "en", "Pirkei Avot Test")
+    c.text = "Text for 2:4"
+    c.save()
+    assert TextChunk(Ref("Pirkei Avot 2"), "en", "Pirkei Avot Test").text == ["", "", "Text for 2:3", "Text for 2:4"]
+    merged = get_merged_section(Ref("Pirkei Avot 2"), "en")
+    assert "Pirkei Avot Test" in [v["versionTitle"] for v in merged["versions"]]
+    c.text = ""
+    c.save()
+
     # Rewrite
     c = TextChunk(Ref("Pirkei Avot 4:2"), "en", "Pirkei Avot Test")
     c.text = "New Text for 4:2"
@@ -0,0 +1,111 @@
+from sefaria.model import *
+from sefaria.model.history import next_revision_num, _text_changes
+
+
+def test_revision_blocks():
+    first = next_revision_num(5)
+    second = next_revision_num()
+    assert second == first + 5
+    assert next_revision_num(3) == second + 1
+
+
+def test_text_changes():
+    changes = _text_changes(Ref("Genesis 1"), ["a", "b", "c"], ["a", "x", "c", "d"])
+    assert [(r.normal(), old, new) for r, old, new in changes] == [("Genesis 1:4", "", "d"), ("Genesis 1:2", "b", "x")]
+
+
+def test_log_text_bulk():
+    from sefaria.system.database import db
+    oref = Ref("Genesis 1")
+    log_text(0, "edit", oref, "en", "Test History Version", ["a", "b", "c"], ["a", "x", "c", "d"])
+    logs = list(db.history.find({"version": "Test History Version"}).sort("revision", 1))
+    assert [l["ref"] for l in logs] == ["Genesis 1:4", "Genesis 1:2"]
+    assert logs[1]["revision"] == logs[0]["revision"] + 1
+    assert logs[1]["rev_type"] == "edit text"
+    db.history.remove({"version": "Test History Version"})
+
+
+def test_checkpoints(monkeypatch):
+    import sefaria.model.history as history
+    from sefaria.history import text_at_revision
+    from sefaria.system.database import db
+    monkeypatch.setattr(history, "HISTORY_CHECKPOINT_INTERVAL", 2)
+    query = {"ref": "Genesis 1:1", "version": "Test Checkpoint Version", "language": "en"}
+    counter = {"_id": history._revision_count_id("Genesis 1", "Test Checkpoint Version", "en")}
+    db.history.remove(query)
+    db.history_checkpoints.remove(query)
+    db.counters.remove(counter)
+
+    texts = ["", "one", "one two", "one two three"]
+    for old, new in zip(texts, texts[1:]):
+        log_text(0, "edit", Ref("Genesis 1:1"), "en", "Test Checkpoint Version", old, new)
+    revisions = [h["revision"] for h in db.history.find(query).sort("revision", 1)]
+    checkpoints = list(db.history_checkpoints.find(query))
+    assert [(c["revision"], c["text"]) for c in checkpoints] == [(revisions[1], "one two")]
+    assert text_at_revision("Genesis 1:1", "Test Checkpoint Version", "en", revisions[0]) == "one"
+    assert text_at_revision("Genesis 1:1", "Test Checkpoint Version", "en", revisions[1]) == "one two"
+    assert db.counters.find_one(counter)["segments"] == {"1_1": 3}
+
+    db.history.remove(query)
+    db.history_checkpoints.remove(query)
+    db.counters.remove(counter)
+
+
+def test_contributors():
+    from sefaria.system.database import db
+    from sefaria.model.history import get_contributors
+    query = {"version": "Test Contributors Version", "language": "en"}
+    db.history.remove(query)
+    db.history_contributors.remove(query)
+
+    log_text(1, "add", Ref("Genesis 1"), "en", "Test Contributors Version", ["", ""], ["a", "b"])
+    log_text(2, "edit", Ref("Genesis 1:2"), "en", "Test Contributors Version", "b", "c")
+    log_text(1, "edit", Ref("Genesis 1:2"), "en", "Test Contributors Version", "c", "d")
+    section = get_contributors(Ref("Genesis 1"), "en", "Test Contributors Version")
+    assert section["copiers"] == {1}
+    assert section["editors"] == {2}
+    assert section["lastUpdated"] is not None
+    assert get_contributors(Ref("Genesis 1:1"), "en", "Test Contributors Version")["editors"] == set()
+
+    db.history.remove(query)
+    db.history_contributors.remove(query)
+
+
+def test_version_title_change():
+    from sefaria.system.database import db
+    from sefaria.model.history import get_contributors, process_version_title_change_in_history
+    old, new = "Test Rename Version", "Test Renamed Version"
+    for vtitle in (old, new):
+        db.history.remove({"version": vtitle, "language": "en"})
+        db.history_contributors.remove({"version": vtitle, "language": "en"})
+
+    log_text(1, "add", Ref("Genesis 1:1"), "en", old, "", "a")
+    process_version_title_change_in_history(Version({"title": "Genesis", "language": "en", "versionTitle": new}), old=old, new=new)
+    assert get_contributors(Ref("Genesis 1"), "en", new)["copiers"] == {1}
+    assert get_contributors(Ref("Genesis 1"), "en", old)["copiers"] == set()
+
+    for vtitle in (old, new):
+        db.history.remove({"version": vtitle, "language": "en"})
+        db.history_contributors.remove({"version": vtitle, "language": "en"})
+
+
+def test_index_title_change():
+    from sefaria.system.database import db
+    from sefaria.model.history import process_index_title_change_in_history, _revision_count_id
+    old, new = "Test Rename Book", "Test Renamed Book"
+    old_id = _revision_count_id(old + " 1", "Test Version", "en")
+    new_id = _revision_count_id(new + " 1", "Test Version", "en")
+    for title in (old, new):
+        db.history_checkpoints.remove({"ref": title + " 1:1"})
+    db.counters.remove({"_id": {"$in": [old_id, new_id]}})
+
+    db.history_checkpoints.insert({"ref": old + " 1:1", "version": "Test Version", "language": "en", "revision": 1, "text": "a"})
+    db.counters.insert({"_id": old_id, "segments": {"1_1": 2}})
+    process_index_title_change_in_history(Index({"title": new, "categories": ["Other"]}), old=old, new=new)
+    assert db.history_checkpoints.find_one({"ref": old + " 1:1"}) is None
+    assert db.history_checkpoints.find_one({"ref": new + " 1:1"})["text"] == "a"
+    assert db.counters.find_one({"_id": old_id}) is None
+    assert db.counters.find_one({"_id": new_id})["segments"] == {"1_1": 2}
+
+    db.history_checkpoints.remove({"ref": new + " 1:1"})
+    db.counters.remove({"_id": new_id})
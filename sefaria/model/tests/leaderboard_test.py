@@ -0,0 +1,67 @@
+from datetime import datetime, timedelta
+
+from sefaria.model.leaderboard import history_points, history_texts, aggregate_history, record_history, roll_window, leader_texts
+from sefaria.system.database import db
+
+
+def test_history_points():
+    assert history_points({"rev_type": "add text", "language": "en", "version": "Sefaria Community Translation", "revert_patch": "x" * 500}) == (50, "translateCount")
+    assert history_points({"rev_type": "add text", "language": "en", "version": "Other", "revert_patch": "x" * 400}) == (2, "addCount")
+    assert history_points({"rev_type": "add text", "language": "he", "version": "Other", "revert_patch": "x" * 1600}) == (2, "addCount")
+    assert history_points({"rev_type": "edit text", "revert_patch": ""}) == (1, "editCount")
+    assert history_points({"rev_type": "review"}) == (15, "reviewCount")
+    assert history_points({"rev_type": "publish sheet"}) == (0, None)
+
+
+def test_history_texts():
+    assert history_texts({"ref": "Mishnah Berakhot 1:1"}) == ["Mishnah Berakhot"]
+    assert history_texts({"refs": ["Genesis 1:1", "Rashi on Genesis 1:1:1"]}) == ["Genesis", "Rashi on Genesis"]
+    assert history_texts({"rev_type": "add index"}) == []
+
+
+def test_aggregate_history():
+    records = [
+        {"user": 1, "rev_type": "add link", "refs": ["Genesis 1:1", "Exodus 2:2"]},
+        {"user": 1, "rev_type": "edit text", "ref": "Genesis 1:2", "revert_patch": ""},
+        {"user": 2, "rev_type": "review", "ref": "Exodus 1:1"},
+    ]
+    leaders = aggregate_history(records)
+    assert [(l["user"], l["count"]) for l in leaders] == [(2, 15), (1, 3)]
+    assert leaders[1]["linkCount"] == 1 and leaders[1]["editCount"] == 1
+    assert leaders[1]["texts"] == {"Genesis": 2, "Exodus": 1}
+
+    # Records without points count their texts, as they do in record_history()
+    leaders = aggregate_history(records + [{"user": 3, "rev_type": "publish sheet", "ref": "Exodus 1:1"}, {"user": 3, "rev_type": "publish sheet"}])
+    assert leaders[2]["user"] == 3 and leaders[2]["count"] == 0 and leaders[2]["texts"] == {"Exodus": 1}
+
+
+def test_record_and_roll():
+    user = -314
+    now = datetime.now()
+    collections = ["leaders_alltime", "leaders_1", "leaders_7", "leaders_30"]
+    for c in collections:
+        db[c].remove({"_id": user})
+    db.leader_days.remove({"user": user})
+
+    record_history([
+        {"user": user, "rev_type": "review", "ref": "Genesis 1:1", "date": now},
+        {"user": user, "rev_type": "add link", "refs": ["Genesis 1:1", "Exodus 2:2"], "date": now - timedelta(3)},
+    ])
+    assert db.leaders_alltime.find_one({"_id": user})["count"] == 17
+    assert leader_texts(db.leaders_7.find_one({"_id": user})) == ["Genesis", "Exodus"]
+    assert db.leaders_1.find_one({"_id": user})["count"] == 15
+
+    # Removed records are subtracted
+    record_history([{"user": user, "rev_type": "review", "ref": "Genesis 1:1", "date": now}], sign=-1)
+    assert db.leaders_alltime.find_one({"_id": user})["count"] == 2
+    assert set(leader_texts(db.leaders_alltime.find_one({"_id": user}))) == {"Genesis", "Exodus"}
+    assert db.leaders_1.find_one({"_id": user}) is None
+    record_history([{"user": user, "rev_type": "review", "ref": "Genesis 1:1", "date": now}])
+
+    roll_window(7, now + timedelta(5))
+    assert db.leaders_7.find_one({"_id": user})["count"] == 15
+    db.leader_windows.remove({"_id": 7})
+
+    for c in collections:
+        db[c].remove({"_id": user})
+    db.leader_days.remove({"user": user})
@@ -48,6 +48,26 @@ class Test_get_refs_in_text(object):
         assert {Ref('Brachot 7b'), Ref('Isaiah 12:13')} == set(library.get_refs_in_string(texts['2ref']))
 
 
+class Test_get_ref_matches_in_text(object):
+
+    def test_offsets(self):
+        matches = library.get_ref_matches_in_string(texts['2ref'])
+        assert [(Ref('Brachot 7b'), 20, 30), (Ref('Isaiah 12:13'), 46, 58)] == matches
+        for oref, start, end in matches:
+            assert Ref(texts['2ref'][start:end]) == oref
+
+    def test_he_offsets(self):
+        matches = library.get_ref_matches_in_string(texts['he_2ref'])
+        assert 2 == len(matches)
+        assert (Ref(u'הושע ט ג'), 38, 46) == matches[1]
+
+    def test_batch(self):
+        segments = [texts['bible_mid'], texts['barenum'], texts['2ref'], texts['he_bible_end']]
+        results = library.get_refs_in_strings(segments)
+        assert [library.get_refs_in_string(s) for s in segments] == results
+        assert [1, 0, 2, 1] == [len(r) for r in results]
+
+
 class Test_he_get_refs_in_text(object):
     def test_positions(self):
         for a in ['he_bible_mid', 'he_bible_begin', 'he_bible_end']:
@@ -0,0 +1,79 @@
+from sefaria.model.notification import queue_sheet_publish_fanout, claim_fanout, fan_out, process_fanouts
+from sefaria.system.database import db
+
+PUBLISHER = -271
+SHEET = -1
+
+
+def setup_module(module):
+    teardown_module(module)
+    db.following.insert([{"follower": -1000 - i, "followee": PUBLISHER} for i in range(7)])
+
+
+def teardown_module(module):
+    db.following.remove({"followee": PUBLISHER})
+    db.notifications.remove({"content.publisher": PUBLISHER})
+    db.notification_fanouts.remove({"actor": PUBLISHER})
+
+
+def test_fan_out():
+    queue_sheet_publish_fanout(PUBLISHER, SHEET)
+    assert db.notifications.find({"content.publisher": PUBLISHER}).count() == 0
+    process_fanouts(chunk_size=3)
+    notified = sorted(n["uid"] for n in db.notifications.find({"content.publisher": PUBLISHER, "content.sheet_id": SHEET}))
+    assert notified == sorted(-1000 - i for i in range(7))
+    assert db.notification_fanouts.find({"actor": PUBLISHER}).count() == 0
+    db.notifications.remove({"content.publisher": PUBLISHER})
+
+
+def test_resume():
+    queue_sheet_publish_fanout(PUBLISHER, SHEET)
+    fanout = claim_fanout()
+    # A worker that notified the first 3 followers and wrote one more before it stopped
+    fanout["last_uid"] = -1004
+    db.notifications.insert({"uid": -1003, "type": "sheet publish", "content": fanout["content"], "date": fanout["date"], "read": False})
+    assert fan_out(fanout, chunk_size=3) == 4
+    assert db.notifications.find({"content.publisher": PUBLISHER}).count() == 4
+    db.notifications.remove({"content.publisher": PUBLISHER})
+
+
+def test_email_digest():
+    from django.core.mail import get_connection
+    from django.contrib.auth.models import User
+    from sefaria.model.notification import Notification
+    from sefaria.model.user_profile import email_unread_notifications
+    from sefaria.system.local_smtp import LocalSMTPServer
+
+    users = [User.objects.create_user("digest_test_%d" % i, "digest_test_%d@example.com" % i, "password") for i in range(3)]
+    uids = [u.id for u in users]
+    db.email_digest_checkpoints.remove({"_id": "all"})
+    for uid in uids:
+        Notification({"uid": uid}).make_follow(follower_id=PUBLISHER).save()
+    try:
+        with LocalSMTPServer() as server:
+            sent = email_unread_notifications("all", processes=1, batch_size=2,
+                                              connection=get_connection(host=server.host, port=server.port))
+        received = set(m["to"][0] for m in server.messages)
+        assert set("digest_test_%d@example.com" % i for i in range(3)) <= received
+        assert sent == len(server.messages)
+        assert server.connections == 1
+        assert db.notifications.find({"uid": {"$in": uids}, "read": False}).count() == 0
+        assert db.email_digest_checkpoints.find_one({"_id": "all"}) is None
+    finally:
+        db.notifications.remove({"uid": {"$in": uids}})
+        for u in users:
+            u.delete()
+
+
+def test_unread_count():
+    from sefaria.model.notification import Notification, NotificationSet, unread_count_for_user
+    uid = -2000
+    db.notifications.remove({"uid": uid})
+    assert unread_count_for_user(uid) == 0
+    n = Notification({"uid": uid}).make_follow(follower_id=PUBLISHER).save()
+    Notification({"uid": uid}).make_follow(follower_id=PUBLISHER).save()
+    assert unread_count_for_user(uid) == 2
+    Notification().load_by_id(n._id).mark_read().save()
+    assert unread_count_for_user(uid) == 1
+    NotificationSet({"uid": uid}).delete()
+    assert unread_count_for_user(uid) == 0
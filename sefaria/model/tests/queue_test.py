@@ -0,0 +1,16 @@
+import sefaria.model as model
+from sefaria.system.database import db
+
+
+def test_queue_coalesces():
+    query = {"ref": "Mishnah Oktzin 1", "lang": "en", "version": "Test Queue Version", "type": "ref"}
+    db.index_queue.remove(query)
+
+    first = model.IndexQueue({"ref": "Mishnah Oktzin 1:3", "lang": "en", "version": "Test Queue Version", "type": "ref"}).save()
+    assert first.ref == "Mishnah Oktzin 1"
+    second = model.IndexQueue({"ref": "Mishnah Oktzin 1:4", "lang": "en", "version": "Test Queue Version", "type": "ref"}).save()
+    assert second._id == first._id
+    assert second.lastModified >= first.lastModified
+    assert db.index_queue.find(query).count() == 1
+
+    db.index_queue.remove(query)
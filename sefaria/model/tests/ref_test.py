@@ -204,6 +204,21 @@ class Test_Cache(object):
         r2 = Ref("Ramban on Genesis 1")
         assert r1 is not r2
 
+    def test_cache_bounds(self):
+        stats = Ref.cache_stats()
+        try:
+            Ref.clear_cache()
+            Ref.configure_cache(max_size=4)
+            for i in range(1, 6):
+                Ref("Genesis {}".format(i))
+            stats_after = Ref.cache_stats()
+            assert Ref.cache_size() == 4
+            assert stats_after["evictions"] > stats["evictions"]
+            assert Ref("Genesis 5") is Ref("Genesis 5")
+            assert Ref.cache_stats()["hits"] > stats_after["hits"]
+        finally:
+            Ref.configure_cache(stats["max_size"], stats["max_bytes"])
+
 
 class Test_normal_forms(object):
     def test_normal(self):
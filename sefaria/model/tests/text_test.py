@@ -129,6 +129,31 @@ def test_index_name_change():
             assert cnt == 0
 
 
+def test_version_iter_segments():
+    for title in ["Ruth", "Shabbat", "Rashi on Exodus", "Hadran"]:
+        version = model.Version().load({"title": title, "language": "he"})
+        root = model.Ref(title)
+        expected = []
+        for indexes, segment in model.text._jagged_items(version.chapter, root.index_node.depth):
+            if segment and isinstance(segment, basestring):
+                expected.append((root.subref([i + 1 for i in indexes]).normal(), segment))
+
+        without_content = model.Version().load({"_id": version._id}, {"chapter": 0})
+        assert [(r.normal(), s) for r, s in without_content.iter_segments(batch_size=3)] == expected
+
+        sections = list(without_content.iter_sections(batch_size=3))
+        assert [s for r, section in sections for s in section if s] == [s for r, s in expected]
+        assert all(r.is_section_level() or r.index_node.depth == 1 for r, section in sections)
+
+
+def test_iter_node_content_batches():
+    version = model.Version().load({"title": "Genesis", "language": "he"}, {"chapter": 0})
+    batches = list(version.iter_node_content(model.Ref("Genesis").index_node, batch_size=7))
+    assert [start for start, sections in batches] == range(0, 50, 7)
+    assert all(len(sections) <= 7 for start, sections in batches)
+    assert sum(len(sections) for start, sections in batches) == 50
+
+
 def dep_counts(name):
     commentators = model.IndexSet({"categories.0": "Commentary"}).distinct("title")
     ref_patterns = {
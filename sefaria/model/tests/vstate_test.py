@@ -13,6 +13,47 @@ class Test_VState(object):
             assert getattr(vs, "title")
             assert getattr(vs, "content")
 
+    def test_refresh_section(self):
+        for title, tref in [("Exodus", "Exodus 3:4"), ("Shabbat", "Shabbat 7b"), ("Rashi on Exodus", "Rashi on Exodus 2:3")]:
+            vs = VersionState(title)
+            vs.refresh()
+            full = vs.content
+            vs = VersionState(title)
+            vs.refresh_section(Ref(tref))
+            assert vs.content == full
+
+    def test_available_sections(self):
+        for title in ["Genesis", "Shabbat", "Rashi on Exodus"]:
+            ref = Ref(title)
+            sections = version_state.available_sections(ref.book, ref.index_node)
+            ja = ref.get_state_node().ja("all", "availableTexts")
+            assert sections == [tuple(s) for s in ja.non_empty_sections()]
+            assert sections == sorted(sections)
+
+    def test_next_prev_section(self):
+        # Against a walk of the counts obj
+        for tref in ["Genesis 1", "Genesis 50", "Shabbat 2a", "Shabbat 157b", "Rashi on Exodus 3"]:
+            oref = Ref(tref)
+            c = oref.get_state_node().ja("all", "availableTexts")
+            start = [s - 1 for s in oref.sections]
+            for forward, step in [(True, c.next_index), (False, c.prev_index)]:
+                points = start[:]
+                points[-1] += 1 if forward else -1
+                expected = step(points)
+                result = oref._iter_text_section(forward)
+                if expected:
+                    assert result.sections == [s + 1 for s in expected[:-1]]
+                else:
+                    assert result is None
+
+    def test_navigation_invalidated_on_save(self):
+        ref = Ref("Genesis")
+        sections = version_state.available_sections(ref.book, ref.index_node)
+        vs = VersionState("Genesis")
+        vs.save()
+        assert "Genesis" not in version_state._navigation_cache
+        assert version_state.available_sections(ref.book, ref.index_node) == sections
+
 
 class Test_VSNode(object):
     def test_section_counts(self):
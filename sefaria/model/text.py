@@ -6,6 +6,10 @@ text.py
 import logging
 logger = logging.getLogger(__name__)
 
+import sys
+import bisect
+import hashlib
+import itertools
 import regex
 import copy
 import bleach
@@ -18,14 +22,20 @@ except ImportError:
     logging.warning("Failed to load 're2'.  Falling back to 're' for regular expression parsing. See https://github.com/blockspeiser/Sefaria-Project/wiki/Regular-Expression-Engines")
     import re
 
+from datetime import datetime
+
 from . import abstract as abst
+from pymongo.errors import DuplicateKeyError
 
 import sefaria.system.cache as scache
+from sefaria.system.database import db
+from sefaria.settings import REF_CACHE_MAX_SIZE, REF_CACHE_MAX_BYTES, TEXT_CHUNK_CACHE_SECONDS, VERSION_STREAM_BATCH_SIZE
 from sefaria.system.exceptions import InputError, BookNameError, IndexSchemaError
 from sefaria.utils.talmud import section_to_daf, daf_to_section
 from sefaria.utils.hebrew import is_hebrew, decode_hebrew_numeral, encode_hebrew_numeral, hebrew_term
 from sefaria.utils.util import list_depth
 import sefaria.datatype.jagged_array as ja
+from sefaria.datatype.title_automaton import TitleAutomaton, CommentaryTitleAutomaton
 
 
 """
@@ -571,7 +581,7 @@ class SchemaStructureNode(SchemaNode):
     def get_content_nodes(self):
         nodes = []
         for node in self.children:
-            nodes += node.get_content_nodes
+            nodes += node.get_content_nodes()
         return nodes
 
 
@@ -1526,12 +1536,97 @@ class Version(abst.AbstractMongoRecord, AbstractTextRecord, AbstractSchemaConten
     def _normalize(self):
         pass
 
+    def iter_node_content(self, snode, batch_size=VERSION_STREAM_BATCH_SIZE):
+        """
+        Reads the content of a node of this Version from the DB in projected slices of 'batch_size' top level sections,
+        so that memory use is bounded whatever the size of the text.
+        This Version may be loaded without its content, e.g. with proj={"chapter": 0}.
+        :param snode: a content node of the Version's Index
+        :return: generator of (index of the first top level section of the slice, list of top level sections)
+        """
+        address = ".".join([self.content_attr] + snode.version_address())
+        start = 0
+        while True:
+            doc = getattr(db, self.collection).find_one({"_id": self._id}, {"title": 1, address: {"$slice": [start, batch_size]}})
+            sections = reduce(lambda d, k: d.get(k) if isinstance(d, dict) else None, [self.content_attr] + snode.version_address(), doc)
+            if not isinstance(sections, list) or not sections:
+                return
+            yield start, sections
+            if len(sections) < batch_size:
+                return
+            start += batch_size
+
+    def iter_sections(self, batch_size=VERSION_STREAM_BATCH_SIZE):
+        """
+        Yields (Ref, list of segments) for each section of this Version with text, in order, reading its content
+        as iter_node_content() does.  A text of depth 1 is a single section, the whole node.
+        """
+        for node_ref in self._node_refs():
+            depth = node_ref.index_node.depth
+            if depth == 1:
+                segments = [s for start, sections in self.iter_node_content(node_ref.index_node, batch_size) for s in sections]
+                if not ja.JaggedTextArray(segments).is_empty():
+                    yield node_ref, segments
+                continue
+            for start, sections in self.iter_node_content(node_ref.index_node, batch_size):
+                for indexes, section in _jagged_items(sections, depth - 1):
+                    if not isinstance(section, list) or ja.JaggedTextArray(section).is_empty():
+                        continue
+                    yield node_ref.subref(_sections_at(start, indexes)), section
+
+    def iter_segments(self, batch_size=VERSION_STREAM_BATCH_SIZE):
+        """
+        Yields (Ref, segment text) for each segment of this Version with text, in order, reading its content
+        as iter_node_content() does.
+        """
+        for node_ref in self._node_refs():
+            depth = node_ref.index_node.depth
+            for start, sections in self.iter_node_content(node_ref.index_node, batch_size):
+                for indexes, segment in _jagged_items(sections, depth):
+                    if segment and isinstance(segment, basestring):
+                        yield node_ref.subref(_sections_at(start, indexes)), segment
+
+    def _node_refs(self):
+        """
+        :return list: a Ref of each content node of this Version's Index
+        """
+        index = get_index(self.title)
+        return [Ref(_obj={
+            "index": index,
+            "book": index.nodes.full_title("en"),
+            "type": index.categories[0],
+            "index_node": node,
+            "sections": [],
+            "toSections": []
+        }) for node in index.nodes.get_content_nodes()]
+
+
+def _sections_at(start, indexes):
+    # 1 based sections of the item at 0 based 'indexes' in a slice of top level sections beginning at 'start'
+    return [start + indexes[0] + 1] + [i + 1 for i in indexes[1:]]
+
+
+def _jagged_items(ja, depth, _indexes=None):
+    """
+    Yields (indexes, item) for each item at the given depth of a jagged array.  Indexes are 0 based.
+    Skips values that are not lists where lists are expected.
+    """
+    _indexes = _indexes or []
+    if depth == 0:
+        yield _indexes, ja
+        return
+    if not isinstance(ja, list):
+        return
+    for i, sub in enumerate(ja):
+        for item in _jagged_items(sub, depth - 1, _indexes + [i]):
+            yield item
+
 
 class VersionSet(abst.AbstractMongoSet):
     recordClass = Version
 
-    def __init__(self, query={}, page=0, limit=0, sort=[["priority", -1], ["_id", 1]], proj=None):
-        super(VersionSet, self).__init__(query, page, limit, sort, proj)
+    def __init__(self, query={}, page=0, limit=0, sort=[["priority", -1], ["_id", 1]], proj=None, records=None):
+        super(VersionSet, self).__init__(query, page, limit, sort, proj, records)
 
     def word_count(self):
         return sum([v.word_count() for v in self])
@@ -1542,6 +1637,27 @@ class VersionSet(abst.AbstractMongoSet):
     def verse_count(self):
         return sum([v.verse_count() for v in self])
 
+    def iter_sections(self, batch_size=VERSION_STREAM_BATCH_SIZE):
+        """
+        Yields (Version, Ref, list of segments) for each section with text of each Version in this set.
+        See Version.iter_sections().  Load the set without content, to keep memory bounded:
+
+        >>> titles = [i.title for i in IndexSet({"categories": "Mishnah"})]
+        >>> for version, oref, section in VersionSet({"title": {"$in": titles}}, proj={"chapter": 0}).iter_sections():
+        """
+        for version in self:
+            for oref, section in version.iter_sections(batch_size):
+                yield version, oref, section
+
+    def iter_segments(self, batch_size=VERSION_STREAM_BATCH_SIZE):
+        """
+        Yields (Version, Ref, segment text) for each segment with text of each Version in this set.
+        See Version.iter_segments() and iter_sections().
+        """
+        for version in self:
+            for oref, segment in version.iter_segments(batch_size):
+                yield version, oref, segment
+
     def merge(self, attr="chapter"):
         """
         Returns merged result, but does not change underlying data
@@ -1602,15 +1718,312 @@ def merge_texts(text, sources):
     return [text, text_sources]
 
 
+def merge_section(contents, vtitles):
+    """
+    Merges the content of one section in several versions as merge_texts() does - each segment is taken from the first
+    version that has it, and is 0 if none does - but keeps the versionTitle of each segment in a list with the same
+    shape as the text, rather than flattening them.  The content of a single version is returned as it is.
+    :param contents: The content of the section in each version, highest priority first
+    :param vtitles: The versionTitle of each version
+    :return: (text, sources)
+    """
+    if len(contents) == 1:
+        return contents[0], _fill_sources(contents[0], vtitles[0])
+    if any(isinstance(c, list) for c in contents):
+        lists = [c if isinstance(c, list) else [] for c in contents]
+        merged = [merge_section(list(segment), vtitles) for segment in itertools.izip_longest(*lists)]
+        return [m[0] for m in merged], [m[1] for m in merged]
+    for content, vtitle in zip(contents, vtitles):
+        if content:
+            return content, vtitle
+    return 0, vtitles[0]
+
+
+def _fill_sources(content, vtitle):
+    if isinstance(content, list):
+        return [_fill_sources(c, vtitle) for c in content]
+    return vtitle
+
+
+def _flatten(content):
+    if isinstance(content, list):
+        return [x for c in content for x in _flatten(c)]
+    return [content]
+
+
+"""
+Merged sections
+The merge of the Versions of a text in a language, materialized for each top level section of each content node of
+depth > 1 in the merged_sections collection, so that reading merged text is one indexed fetch:
+{
+    "title", "language",
+    "address":  storage address of the node (see Ref.storage_address()),
+    "section":  number of the top level section,
+    "text":     the merged content of the section,
+    "sources":  versionTitle of each segment of "text", in a list with the same shape,
+    "versions": metadata of each version with content in the section, highest priority first,
+    "built":    datetime
+}
+A section is built when it is first read.  It is rebuilt when a TextChunk in it is saved,
+and the sections of a book are rebuilt when any other change is made to one of its Versions.
+Code that writes to db.texts directly, rather than through Version.save(), calls rebuild_merged_sections() itself
+(see resize_text() in sefaria/helper/text.py).
+"""
+
+
+def _merged_section_key(title, lang, address, section):
+    return {"title": title, "language": lang, "address": address, "section": section}
+
+
+def _merged_section_doc(title, lang, address, section, versions):
+    """
+    :param versions: list of (version metadata dict, content of the section)
+    """
+    doc = _merged_section_key(title, lang, address, section)
+    if versions:
+        text, sources = merge_section([c for d, c in versions], [d.get("versionTitle") for d, c in versions])
+    else:
+        text, sources = [], []
+    doc.update({"text": text, "sources": sources, "versions": [d for d, c in versions], "built": datetime.now()})
+    return doc
+
+
+def _version_metadata(v):
+    d = v._saveable_attrs()
+    d.pop("_id", None)
+    d.pop("chapter", None)
+    return d
+
+
+def _section_versions(section_ref, lang):
+    """
+    :return list: (version metadata dict, content of the section) of each Version in 'lang' with content in section_ref
+    """
+    vset = VersionSet(section_ref.condition_query(lang), proj=section_ref.part_projection())
+    return [(_version_metadata(v), _section_content(v, section_ref.index_node)) for v in vset]
+
+
+def build_merged_section(oref, lang, overwrite=True):
+    """
+    Builds the merged section of the top level section of 'oref', from the Versions in 'lang'.
+    :param overwrite: If False, an existing merged section is kept.  Used when building on read, so that a section
+    built on read never replaces one that was rebuilt after a change.
+    :return dict: the merged section
+    """
+    section_ref = oref.top_section_ref()
+    doc = _merged_section_doc(section_ref.book, lang, section_ref.storage_address(), section_ref.sections[0],
+                              _section_versions(section_ref, lang))
+    key = _merged_section_key(doc["title"], lang, doc["address"], doc["section"])
+    if overwrite:
+        _upsert_merged_section(key, doc)
+    else:
+        _upsert_merged_section(key, {"$setOnInsert": {k: v for k, v in doc.items() if k not in key}})
+    return doc
+
+
+def _upsert_merged_section(key, update):
+    ensure_merged_sections_index()
+    try:
+        db.merged_sections.update(key, update, upsert=True)
+    except DuplicateKeyError:
+        # Inserted by a concurrent build after this update looked for it
+        db.merged_sections.update(key, update)
+
+
+def get_merged_section(oref, lang):
+    """
+    :param oref: A Ref within one top level section of a node of depth > 1
+    :return dict: The merged section of the top level section of 'oref' in 'lang', built if it doesn't exist yet
+    """
+    ensure_merged_sections_index()
+    key = _merged_section_key(oref.book, lang, oref.storage_address(), oref.sections[0])
+    doc = db.merged_sections.find_one(key, {"_id": 0})
+    return doc or build_merged_section(oref, lang, overwrite=False)
+
+
+def _section_content(version, node):
+    # The content of a Version loaded with the part_projection() of one top level section is that section
+    content = _node_content(version, node)
+    return content[0] if content else []
+
+
+def _node_content(version, node):
+    try:
+        content = version.sub_content(node.version_address())
+    except (KeyError, TypeError, AttributeError):
+        return []
+    return content if isinstance(content, list) else []
+
+
+def rebuild_merged_sections(title, lang):
+    """
+    Rebuilds the merged sections of every node of 'title' in 'lang', from one load of its Versions.
+    Merged sections of sections or nodes that no longer exist are removed.
+    """
+    start = datetime.now()
+    try:
+        nodes = [n for n in get_index(title).nodes.get_content_nodes() if getattr(n, "depth", 0) > 1]
+    except BookNameError:
+        nodes = []
+    versions = [v for v in VersionSet({"title": title, "language": lang})]
+    for node in nodes:
+        address = ".".join(["chapter"] + node.address()[1:])
+        contents = [(v, _node_content(v, node)) for v in versions]
+        for i in range(max([len(c) for v, c in contents] or [0])):
+            section_versions = []
+            for v, content in contents:
+                if i < len(content) and isinstance(content[i], list) and any(x not in ["", [], 0] for x in content[i]):
+                    section_versions.append((_version_metadata(v), content[i]))
+            doc = _merged_section_doc(title, lang, address, i + 1, section_versions)
+            _upsert_merged_section(_merged_section_key(title, lang, address, i + 1), doc)
+    db.merged_sections.remove({"title": title, "language": lang, "built": {"$lt": start}})
+
+
+_merged_sections_indexed = False
+
+
+def ensure_merged_sections_index():
+    """
+    Creates the unique index of merged_sections, once in each process, before merged sections are first read or written.
+    Lookups are indexed, and concurrent builds of a section can't insert it twice.
+    """
+    global _merged_sections_indexed
+    if not _merged_sections_indexed:
+        db.merged_sections.ensure_index([("title", 1), ("language", 1), ("address", 1), ("section", 1)], unique=True)
+        _merged_sections_indexed = True
+
+
+def process_version_save_in_merged_sections(v, **kwargs):
+    # TextChunk.save() rebuilds the section it changed
+    if not getattr(v, "_saved_by_text_chunk", False):
+        rebuild_merged_sections(v.title, v.language)
+
+
+def process_version_delete_in_merged_sections(v, **kwargs):
+    rebuild_merged_sections(v.title, v.language)
+
+
+def process_index_title_change_in_merged_sections(indx, **kwargs):
+    db.merged_sections.update({"title": kwargs["old"]}, {"$set": {"title": kwargs["new"]}}, multi=True)
+
+
+class TextChunkCache(object):
+    """
+    Read-through cache of the Version records that TextChunks are built from, one entry for each top level section
+    of a content node, shared by all processes through the Django cache.
+    An entry holds either the one Version of a versionTitle, or, for "merged", each Version in the language with content
+    in the section, in priority order.  Records are kept as loaded with Ref.part_projection() - the content of the section and
+    the version metadata - and are trimmed to a Ref as TextChunks are built.
+
+    Refs within one top level section of a node of depth > 1 are cached.  Other Refs are loaded from the DB.
+    TextChunk.save() invalidates the entries of the sections it wrote.  Other saves and deletions of Versions
+    invalidate all entries of their book, by moving it to a new generation of keys.
+    """
+    def __init__(self, timeout=TEXT_CHUNK_CACHE_SECONDS, prefix="text_chunk"):
+        self.timeout = timeout
+        self.prefix = prefix
+        self._stats = {}  # node title: [hits, misses], for this process
+
+    @staticmethod
+    def cacheable(oref):
+        return oref.index_node.depth > 1 and bool(oref.sections) and not oref.is_spanning()
+
+    def get_version(self, oref, lang, vtitle):
+        """
+        :return Version: The version 'vtitle' in 'lang', with the top level section of 'oref', or None if there is no such version
+        """
+        key = self._key(oref, lang, vtitle, oref.sections[0])
+        entry = self._get(oref, key)
+        if entry is None:
+            v = Version().load({"title": oref.book, "language": lang, "versionTitle": vtitle}, oref.part_projection())
+            entry = {"versions": [v._saveable_attrs()] if v else []}
+            scache.set_cache_elem(key, entry, self.timeout)
+        return Version(entry["versions"][0]) if entry["versions"] else None
+
+    def get_merged(self, oref, lang):
+        """
+        :return dict: The merged section of 'oref' in 'lang' - see get_merged_section()
+        """
+        key = self._key(oref, lang, None, oref.sections[0])
+        entry = self._get(oref, key)
+        if entry is None:
+            entry = get_merged_section(oref, lang)
+            scache.set_cache_elem(key, entry, self.timeout)
+        return entry
+
+    def invalidate(self, oref, lang, vtitle, sections=None):
+        """
+        Invalidates the entries of version 'vtitle' and of merged text, for the top level sections of a node.
+        :param oref: A Ref in the node
+        :param sections: List of top level section numbers.  Defaults to the section of oref.
+        """
+        sections = sections if sections is not None else oref.sections[:1]
+        generation = self._generation(oref.book)
+        scache.cache.delete_many([self._key(oref, lang, t, s, generation) for s in sections for t in [vtitle, None]])
+
+    def clear(self, title=None):
+        """
+        Invalidates all entries of the book 'title', or of all books, by moving to a new generation of keys.
+        """
+        key = self._generation_key(title)
+        scache.set_cache_elem(key, (scache.get_cache_elem(key) or 0) + 1, 60 * 60 * 24 * 30)
+
+    def stats(self):
+        """
+        :return dict: node title: {"hits", "misses", "hitRate"} of lookups in this process
+        """
+        return {node: {"hits": h, "misses": m, "hitRate": float(h) / (h + m)} for node, (h, m) in self._stats.items()}
+
+    def reset_stats(self):
+        self._stats = {}
+
+    def _get(self, oref, key):
+        entry = scache.get_cache_elem(key)
+        counts = self._stats.setdefault(oref.index_node.full_title(), [0, 0])
+        counts[0 if entry is not None else 1] += 1
+        return entry
+
+    def _generation_key(self, title=None):
+        if title is None:
+            return self.prefix + ".generation"
+        return "{}.generation.{}".format(self.prefix, hashlib.md5(title.encode("utf-8")).hexdigest())
+
+    def _generation(self, title):
+        keys = [self._generation_key(), self._generation_key(title)]
+        generations = scache.cache.get_many(keys)
+        return "{}.{}".format(generations.get(keys[0], 0), generations.get(keys[1], 0))
+
+    def _key(self, oref, lang, vtitle, section, generation=None):
+        generation = generation if generation is not None else self._generation(oref.book)
+        parts = [oref.book, lang, vtitle or u"merged", oref.storage_address(), unicode(section)]
+        return "{}.{}.{}".format(self.prefix, hashlib.md5(u"|".join(parts).encode("utf-8")).hexdigest(), generation)
+
+
+text_chunk_cache = TextChunkCache()
+
+
+def process_version_save_in_text_chunk_cache(v, **kwargs):
+    # TextChunk.save() invalidates the sections it changed
+    if not getattr(v, "_saved_by_text_chunk", False):
+        text_chunk_cache.clear(v.title)
+
+
+def process_version_delete_in_text_chunk_cache(v, **kwargs):
+    text_chunk_cache.clear(v.title)
+
+
 class TextChunk(AbstractTextRecord):
     text_attr = "text"
 
-    def __init__(self, oref, lang="en", vtitle=None):
+    def __init__(self, oref, lang="en", vtitle=None, versions=None):
         """
         :param oref:
         :type oref: Ref
         :param lang: "he" or "en"
         :param vtitle:
+        :param versions: Versions in 'lang' that were already loaded, with oref.part_projection() and TextChunk.version_query(oref) -
+        the version 'vtitle', if given.  If present, the chunk is built from them without querying.
+        Merged text of Refs cached by section is always read through text_chunk_cache.
         :return:
         """
         self._oref = oref
@@ -1627,14 +2040,27 @@ class TextChunk(AbstractTextRecord):
         self.full_version = None
         self.versionSource = None  # handling of source is hacky
 
+        cached = text_chunk_cache.cacheable(oref)
         if lang and vtitle:
             self._saveable = True
-            v = Version().load({"title": oref.book, "language": lang, "versionTitle": vtitle}, oref.part_projection())
+            if versions is not None:
+                v = versions[0] if versions else None
+            elif cached:
+                v = text_chunk_cache.get_version(oref, lang, vtitle)
+            else:
+                v = Version().load({"title": oref.book, "language": lang, "versionTitle": vtitle}, oref.part_projection())
             if v:
                 self._versions += [v]
                 self.text = self._original_text = self.trim_text(getattr(v, oref.storage_address(), None))
         elif lang:
-            vset = VersionSet(oref.condition_query(lang), proj=oref.part_projection())
+            if cached:
+                self._load_merged(text_chunk_cache.get_merged(oref, lang))
+                return
+
+            if versions is not None:
+                vset = VersionSet(records=[v._saveable_attrs() for v in versions])
+            else:
+                vset = VersionSet(oref.condition_query(lang), proj=oref.part_projection())
 
             if vset.count() == 0:
                 return
@@ -1658,6 +2084,31 @@ class TextChunk(AbstractTextRecord):
         else:
             raise Exception("TextChunk requires a language.")
 
+    @staticmethod
+    def version_query(oref, lang=None):
+        """
+        :return dict: Query of the Versions that a TextChunk of 'oref' is built from - those with content in oref,
+        or in its top level section, for Refs that are cached by section (see TextChunkCache)
+        """
+        if text_chunk_cache.cacheable(oref):
+            return oref.top_section_ref().condition_query(lang)
+        return oref.condition_query(lang)
+
+    def _load_merged(self, merged):
+        """
+        Sets the text of this chunk from a merged section (see get_merged_section())
+        """
+        text = self.trim_text([merged["text"]])
+        if not any(_flatten(text)):
+            return
+        sources = _flatten(self.trim_text([merged["sources"]]))
+        vtitles = set(sources)
+        self._versions = [Version(d) for d in merged["versions"] if d["versionTitle"] in vtitles]
+        self.text = text
+        if len(vtitles) > 1:
+            self.sources = sources
+            self.is_merged = True
+
     def is_empty(self):
         return bool(self.text)
 
@@ -1694,7 +2145,19 @@ class TextChunk(AbstractTextRecord):
         self._pad(content)
         self.full_version.sub_content(self._oref.index_node.version_address(), [i - 1 for i in self._oref.sections], self.text)
 
+        # When only content changed, the merged section and cache entries of the sections written are updated below.
+        # Otherwise, saving the Version updates its whole book.
+        self.full_version._saved_by_text_chunk = not self.full_version.is_new() and not self.versionSource
         self.full_version.save()
+        if self._oref.sections:
+            if text_chunk_cache.cacheable(self._oref):
+                build_merged_section(self._oref, self.lang)
+            text_chunk_cache.invalidate(self._oref, self.lang, self.vtitle)
+        else:
+            if self.full_version._saved_by_text_chunk and self._oref.index_node.depth > 1:
+                rebuild_merged_sections(self._oref.book, self.lang)
+            sections = range(1, max(len(self.text), len(self._original_text)) + 1)
+            text_chunk_cache.invalidate(self._oref, self.lang, self.vtitle, sections)
         self._oref.recalibrate_next_prev_refs(len(self.text))
         return self
 
@@ -1896,7 +2359,13 @@ class TextFamily(object):
     }
 
 
-    def __init__(self, oref, context=1, commentary=True, version=None, lang=None, pad=True):
+    def __init__(self, oref, context=1, commentary=True, version=None, lang=None, pad=True, batched=False):
+        """
+        :param batched: If True, the list of available versions is loaded with one query of version titles,
+        rather than with the whole Versions.  For Refs that aren't cached by section (see TextChunkCache), the Versions of
+        both languages are loaded in the same query, rather than a query for each language.
+        Refs cached by section read their text through text_chunk_cache, as without batched.  The contents are the same.
+        """
         if pad:
             oref = oref.padded_ref()
         self.ref = oref.normal()
@@ -1913,11 +2382,18 @@ class TextFamily(object):
             oref = oref.context_ref()
         self._context_oref = oref
 
+        batch = batched and not text_chunk_cache.cacheable(oref)
+        if batch:
+            versions = VersionSet(TextChunk.version_query(oref), proj=oref.part_projection()).array()
+
         for language, attr in self.text_attr_map.items():
-            if language == lang:
-                c = TextChunk(oref, language, version)
+            vtitle = version if language == lang else None
+            if batch:
+                lang_versions = [v for v in versions if v.language == language and (not vtitle or v.versionTitle == vtitle)]
+                # A requested version without content here isn't in the batch.  It's loaded on its own.
+                c = TextChunk(oref, language, vtitle, versions=lang_versions if lang_versions or not vtitle else None)
             else:
-                c = TextChunk(oref, language)
+                c = TextChunk(oref, language, vtitle)
             self._chunks[language] = c
             setattr(self, self.text_attr_map[language], c.text)
 
@@ -1925,16 +2401,22 @@ class TextFamily(object):
             self.spanning = True
 
         if commentary:
-            from sefaria.client.wrapper import get_links
+            from sefaria.client.wrapper import get_links, get_links_for_refs
             if not oref.is_spanning():
                 links = get_links(oref.normal())  #todo - have this function accept an object
             else:
-                links = [get_links(r.normal()) for r in oref.split_spanning_ref()]
+                links = get_links_for_refs([r.normal() for r in oref.split_spanning_ref()])
             self.commentary = links if "error" not in links else []
 
             # get list of available versions of this text
             # but only if you care enough to get commentary also (hack)
-            self.versions = oref.version_list()
+            if batch:
+                self.versions = [{"versionTitle": v.versionTitle, "language": v.language} for v in versions]
+            elif batched:
+                vset = VersionSet(oref.condition_query(), proj={"versionTitle": 1, "language": 1})
+                self.versions = [{"versionTitle": v.versionTitle, "language": v.language} for v in vset]
+            else:
+                self.versions = oref.version_list()
 
     def contents(self):
         """ Ramaining:
@@ -2024,20 +2506,44 @@ def process_index_delete_in_versions(indx, **kwargs):
 """
 
 
+def _ref_cache_entry_size(key, oref):
+    """
+    Approximate size, in bytes, of one entry in the Ref cache.
+    Shared objects like the Index and its nodes are not counted.
+    """
+    return sys.getsizeof(key) + sys.getsizeof(oref) + sys.getsizeof(vars(oref)) \
+        + sys.getsizeof(oref.sections) + sys.getsizeof(oref.toSections)
+
+
 class RefCachingType(type):
     """
     Metaclass for Ref class.
-    Caches all Ref isntances according to the string they were instanciated with and their normal form.
+    Caches Ref isntances according to the string they were instanciated with and their normal form.
     Returns cached instance on instanciation if either instanciation string or normal form are matched.
+    The cache is a least recently used cache, bounded by the REF_CACHE_MAX_SIZE and REF_CACHE_MAX_BYTES settings.
     """
 
     def __init__(cls, name, parents, dct):
         super(RefCachingType, cls).__init__(name, parents, dct)
-        cls.__cache = {}
+        cls.__cache = scache.LRUCache(REF_CACHE_MAX_SIZE, REF_CACHE_MAX_BYTES, sizeof=_ref_cache_entry_size)
 
     def cache_size(cls):
         return len(cls.__cache)
 
+    def cache_stats(cls):
+        """
+        :return dict: size, approximate bytes, limits, and hit, miss and eviction counts for the Ref cache
+        """
+        return cls.__cache.stats()
+
+    def configure_cache(cls, max_size=None, max_bytes=None):
+        """
+        Change the bounds of the Ref cache for this process.  Evicts immediately if the cache is over the new bounds.
+        :param max_size: Maximum number of cached keys.  None or 0 for no limit.
+        :param max_bytes: Maximum approximate size of the cache in bytes.  None or 0 for no limit.
+        """
+        cls.__cache.resize(max_size, max_bytes)
+
     def cache_dump(cls):
         return [(a, repr(b)) for (a, b) in cls.__cache.iteritems()]
 
@@ -2045,7 +2551,7 @@ class RefCachingType(type):
         return cls.__cache
 
     def clear_cache(cls):
-        cls.__cache = {}
+        cls.__cache.clear()
 
     def __call__(cls, *args, **kwargs):
         if len(args) == 1:
@@ -2056,23 +2562,25 @@ class RefCachingType(type):
         obj_arg = kwargs.get("_obj")
 
         if tref:
-            if tref in cls.__cache:
-                return cls.__cache[tref]
-            else:
-                result = super(RefCachingType, cls).__call__(*args, **kwargs)
-                if result.normal() in cls.__cache:
-                    #del result  #  Do we need this to keep memory clean?
-                    cls.__cache[tref] = cls.__cache[result.normal()]
-                    return cls.__cache[result.normal()]
-                cls.__cache[result.normal()] = result
-                cls.__cache[tref] = result
-                return result
+            cached = cls.__cache.get(tref)
+            if cached is not None:
+                return cached
+            result = super(RefCachingType, cls).__call__(*args, **kwargs)
+            cached = cls.__cache.get(result.normal())
+            if cached is not None:
+                #del result  #  Do we need this to keep memory clean?
+                cls.__cache.set(tref, cached)
+                return cached
+            cls.__cache.set(result.normal(), result)
+            cls.__cache.set(tref, result)
+            return result
         elif obj_arg:
             result = super(RefCachingType, cls).__call__(*args, **kwargs)
-            if result.normal() in cls.__cache:
+            cached = cls.__cache.get(result.normal())
+            if cached is not None:
                 #del result  #  Do we need this to keep memory clean?
-                return cls.__cache[result.normal()]
-            cls.__cache[result.normal()] = result
+                return cached
+            cls.__cache.set(result.normal(), result)
             return result
         else:  # Default.  Shouldn't be used.
             return super(RefCachingType, cls).__call__(*args, **kwargs)
@@ -2170,7 +2678,7 @@ class Ref(object):
         base = parts[0]
         title = None
 
-        match = library.all_titles_regex(self._lang).match(base)
+        match = library.all_titles_automaton(self._lang).match(base)
         if match:
             title = match.group('title')
             self.index_node = library.get_schema_node(title, self._lang)
@@ -2187,9 +2695,8 @@ class Ref(object):
             if getattr(self.index_node, "checkFirst", None) and self.index_node.checkFirst.get(self._lang):
                 try:
                     check_node = library.get_schema_node(self.index_node.checkFirst[self._lang], self._lang)
-                    re_string = '^' + regex.escape(title) + check_node.delimiter_re + check_node.regex(self._lang, strict=True)
-                    reg = regex.compile(re_string, regex.VERBOSE)
-                    self.sections = self.__get_sections(reg, base)
+                    reg = library.address_regex(check_node, self._lang, strict=True)
+                    self.sections = self.__get_sections(reg, base, len(title))
                 except InputError: # Regex doesn't work
                     pass
                 except AttributeError: # Can't find node for check_node
@@ -2201,7 +2708,7 @@ class Ref(object):
             self.book = self.index_node.full_title("en")
 
         elif self._lang == "en":  # Check for a Commentator
-            match = library.all_titles_regex(self._lang, commentary=True).match(base)
+            match = library.all_titles_automaton(self._lang, commentary=True).match(base)
             if match:
                 title = match.group('title')
                 self.index = get_index(title)
@@ -2225,10 +2732,9 @@ class Ref(object):
                 self.book = self.index_node.full_title("en")
             return
 
-        re_string = '^' + regex.escape(title) + self.index_node.delimiter_re + self.index_node.regex(self._lang)
-        reg = regex.compile(re_string, regex.VERBOSE)
+        reg = library.address_regex(self.index_node, self._lang)
 
-        self.sections = self.__get_sections(reg, base)
+        self.sections = self.__get_sections(reg, base, len(title))
         self.type = self.index_node.index.categories[0]
 
         self.toSections = self.sections[:]
@@ -2245,18 +2751,16 @@ class Ref(object):
                     except ValueError:
                         raise InputError(u"Couldn't understand text sections: '{}'.".format(self.tref))
 
-    def __get_sections(self, reg, tref):
-        sections = []
-        ref_match = reg.match(tref)
+    def __get_sections(self, reg, tref, pos):
+        """
+        :param reg: address regex, from Library.address_regex()
+        :param tref: the reference string
+        :param pos: the position in tref where the title ends
+        """
+        ref_match = reg.match(tref, pos)
         if not ref_match:
             raise InputError(u"Can not parse ref: {}".format(tref))
-
-        gs = ref_match.groupdict()
-        for i in range(0, self.index_node.depth):
-            gname = u"a{}".format(i)
-            if gs.get(gname) is not None:
-                sections.append(self.index_node._addressTypes[i].toIndex(self._lang, gs.get(gname)))
-        return sections
+        return library.sections_from_match(self.index_node, ref_match, self._lang)
 
     def __parse_talmud_range(self, range_part):
         #todo: make sure to-daf isn't out of range
@@ -2441,9 +2945,24 @@ class Ref(object):
         if len(starting_points) > 0:
             starting_points[-1] += 1 if forward else -1
 
-        #let the counts obj calculate the correct place to go.
-        c = self.get_state_node().ja("all", "availableTexts")
-        new_section = c.next_index(starting_points) if forward else c.prev_index(starting_points)
+        if depth_up == 1:
+            # binary search of the sections that have text, from the navigation index
+            from . import version_state
+            sections = version_state.available_sections(self.book, self.index_node)
+            if forward:
+                i = bisect.bisect_left(sections, tuple(starting_points))
+                new_section = list(sections[i]) if i < len(sections) else None
+            else:
+                # the last section that starts with starting_points, or comes before it
+                i = bisect.bisect_right(sections, tuple(starting_points) + (float("inf"),))
+                new_section = list(sections[i - 1]) if i > 0 else None
+            if new_section is not None:
+                new_section.append(0)  # address of a segment in the section, like the counts obj gives
+
+        else:
+            #let the counts obj calculate the correct place to go.
+            c = self.get_state_node().ja("all", "availableTexts")
+            new_section = c.next_index(starting_points) if forward else c.prev_index(starting_points)
 
         # we are also scaling back the sections to the level ABOVE the lowest section type (eg, for bible we want chapter, not verse)
         if new_section:
@@ -2454,12 +2973,16 @@ class Ref(object):
             return None
 
     def subref(self, subsection):
-        assert self.index_node.depth > len(self.sections), u"Tried to get subref of bottom level ref: {}".format(self.normal())
+        """
+        :param subsection: Number of a section within this ref, or a list of numbers of sections of successive levels
+        """
+        subsections = subsection if isinstance(subsection, list) else [subsection]
+        assert self.index_node.depth >= len(self.sections) + len(subsections), u"Tried to get subref of bottom level ref: {}".format(self.normal())
         assert not self.is_range(), u"Tried to get subref of ranged ref".format(self.normal())
 
         d = self._core_dict()
-        d["sections"] += [subsection]
-        d["toSections"] += [subsection]
+        d["sections"] += subsections
+        d["toSections"] += subsections
         return Ref(_obj=d)
 
     def context_ref(self, level=1):
@@ -2810,39 +3333,42 @@ class Library(object):
 
     local_cache = {}
 
-    #WARNING: Do NOT put the compiled re2 object into redis.  It gets corrupted.
-    def all_titles_regex(self, lang="en", commentary=False):
+    def all_titles_automaton(self, lang="en", commentary=False):
         """
-        A regular expression that will match any known title in the library in the provided language
-        Uses re2 if available.  See https://github.com/blockspeiser/Sefaria-Project/wiki/Regular-Expression-Engines
+        A multi-pattern matcher that will match any known title in the library in the provided language.
+        Matches the longest title followed by the end of the string or by one of ":., ".
+        The result supports the parts of the regex interface used with titles: match() and finditer(),
+        returning match objects with group('title') (and group('commentor'), group('commentee') for commentary), start() and end().
+        The title automata are kept in the local cache, and in the shared cache, so that other processes don't need to rebuild them.
         :param lang: "en" or "he"
         :param commentary bool: Default False.  If True, matches commentary records only.  If False matches simple records only.
-        :return: regex object
+        :return: TitleAutomaton or CommentaryTitleAutomaton
         :raise InputError: if lang == "he" and commentary == True
         """
-        key = "all_titles_regex_" + lang
+        key = "all_titles_automaton_" + lang
         key += "_commentary" if commentary else ""
-        reg = self.local_cache.get(key)
-        if not reg:
-            simple_books = map(re.escape, self.full_title_list(lang, with_commentators=False))
-            simple_book_part = u'|'.join(sorted(simple_books, key=len, reverse=True))  # Match longer titles first
-
-            reg = u'(?P<title>'
-            if not commentary:
-                reg += simple_book_part
-            else:
-                if lang == "he":
-                    raise InputError("No support for Hebrew Commentatory Ref Objects")
-                first_part = u'|'.join(map(re.escape, self.get_commentator_titles(with_variants=True)))
-                reg += u"(?P<commentor>" + first_part + u") on (?P<commentee>" + simple_book_part + u")"
-            reg += u')'
-            reg += ur'($|[:., ]+)'
-            try:
-                reg = re.compile(reg, max_mem= 256 * 1024 * 1024)
-            except TypeError:
-                reg = re.compile(reg)
-            self.local_cache[key] = reg
-        return reg
+        automaton = self.local_cache.get(key)
+        if automaton:
+            return automaton
+        if not commentary:
+            automaton = scache.get_cache_elem(key)
+            if not automaton:
+                automaton = TitleAutomaton(self.full_title_list(lang, with_commentators=False))
+                scache.set_cache_elem(key, automaton)
+        else:
+            # Commentator titles are few, so this is built locally around the shared book automaton
+            if lang == "he":
+                raise InputError("No support for Hebrew Commentatory Ref Objects")
+            automaton = CommentaryTitleAutomaton(self.get_commentator_titles(with_variants=True), self.all_titles_automaton(lang))
+        self.local_cache[key] = automaton
+        return automaton
+
+    #todo: deprecate.  Kept for callers that used the compiled title regex.
+    def all_titles_regex(self, lang="en", commentary=False):
+        """
+        :return: The title automaton.  See all_titles_automaton()
+        """
+        return self.all_titles_automaton(lang, commentary)
 
     def full_title_list(self, lang="en", with_commentators=True, with_commentary=False):
         """ Returns a list of strings of all possible titles, including maps
@@ -2946,7 +3472,7 @@ class Library(object):
 
     #todo: This wants some thought...
     def get_commentary_schema_node(self, title, lang="en"): #only supports "en"
-        match = self.all_titles_regex(lang, commentary=True).match(title)
+        match = self.all_titles_automaton(lang, commentary=True).match(title)
         if match:
             title = match.group('title')
             index = get_index(title)
@@ -3018,10 +3544,39 @@ class Library(object):
         if not lang:
             lang = "he" if is_hebrew(s) else "en"
         if lang=="en":
-            #todo: combine into one regex
-            return [m.group('title') for m in self.all_titles_regex(lang, commentary=True).finditer(s)] + [m.group('title') for m in self.all_titles_regex(lang, commentary=False).finditer(s)]
+            return [m.group('title') for m in self.all_titles_automaton(lang, commentary=True).finditer(s)] + [m.group('title') for m in self.all_titles_automaton(lang, commentary=False).finditer(s)]
         elif lang=="he":
-            return [m.group('title') for m in self.all_titles_regex(lang, commentary=False).finditer(s)]
+            return [m.group('title') for m in self.all_titles_automaton(lang, commentary=False).finditer(s)]
+
+    def address_regex(self, node, lang, strict=False):
+        """
+        A compiled regular expression that matches the address part of a reference to node, beginning with the delimiter after the title.
+        Use as reg.match(st, pos), with pos the position where the title ends.
+        Cached per language and address scheme, so nodes with the same address types share one compiled regex.
+        :param node: JaggedArrayNode
+        :param lang: "en" or "he"
+        :param strict: If True, section names are required to match
+        :return: compiled regex
+        """
+        key = ("address_regex", node.delimiter_re, node.depth, tuple(type(a).__name__ for a in node._addressTypes), lang, strict)
+        reg = self.local_cache.get(key)
+        if not reg:
+            reg = regex.compile(node.delimiter_re + node.regex(lang, strict=strict), regex.VERBOSE)
+            self.local_cache[key] = reg
+        return reg
+
+    @staticmethod
+    def sections_from_match(node, ref_match, lang):
+        """
+        :return list: the section numbers captured by a match of Library.address_regex(node, lang)
+        """
+        sections = []
+        gs = ref_match.groupdict()
+        for i in range(0, node.depth):
+            gname = u"a{}".format(i)
+            if gs.get(gname) is not None:
+                sections.append(node._addressTypes[i].toIndex(lang, gs.get(gname)))
+        return sections
 
     def get_refs_in_string(self, st, lang=None):
         """
@@ -3029,92 +3584,57 @@ class Library(object):
         :param st:
         :return:
         """
-        refs = []
-        if lang is None:
-            lang = "he" if is_hebrew(st) else "en"
-        if lang == "he":
-            unique_titles = {title: 1 for title in self.get_titles_in_string(st, lang)}
-            for title in unique_titles.iterkeys():
-                res = self._build_all_refs_from_string(title, st)
-                refs += res
-        else:  # lang == "en"
-            for match in self.all_titles_regex(lang, commentary=False).finditer(st):
-                title = match.group('title')
-                res = self._build_ref_from_string(title, st[match.start():])  # Slice string from title start
-                refs += res
-        return refs
+        return [oref for oref, start, end in self.get_ref_matches_in_string(st, lang)]
 
-    #todo: handle ranges in inline refs
-    def _build_ref_from_string(self, title=None, st=None, lang="en"):
-        """
-        Build a Ref object given a title and a string.  The title is assumed to be at position 0 in the string.
-        This is used primarily for English matching.  Hebrew matching is done with _build_all_refs_from_string()
-        :param title: The title used in the text to refer to this Index node
-        :param st: The source text for this reference
-        :return: Ref
-        """
-        node = self.get_schema_node(title, lang)
-
-        re_string = '^' + regex.escape(title) + node.delimiter_re + node.regex(lang)
-        reg = regex.compile(re_string, regex.VERBOSE)
-        ref_match = reg.match(st)
-        if ref_match:
-            sections = []
-            gs = ref_match.groupdict()
-            for i in range(0, node.depth):
-                gname = u"a{}".format(i)
-                if gs.get(gname) is not None:
-                    sections.append(node._addressTypes[i].toIndex(lang, gs.get(gname)))
+    def get_refs_in_strings(self, strings, lang=None):
+        """
+        Batch form of get_refs_in_string()
+        :param strings: list of strings
+        :return: list of lists of Refs, one list for each string
+        """
+        return [[oref for oref, start, end in matches] for matches in self.get_ref_matches_in_strings(strings, lang)]
 
-            _obj = {
-                "tref": ref_match.group(),
-                "book": node.full_title("en"),
-                "index_node": node,
-                "index": node.index,
-                "type": node.index.categories[0],
-                "sections": sections,
-                "toSections": sections
-            }
-            try:
-                return [Ref(_obj=_obj)]
-            except InputError:
-                return []
-        else:
-            return []
+    def get_ref_matches_in_strings(self, strings, lang=None):
+        """
+        Batch form of get_ref_matches_in_string()
+        :param strings: list of strings
+        :param lang: "en" or "he".  If not provided, it is detected separately for each string
+        :return: list of lists of (Ref, start, end) tuples, one list for each string
+        """
+        return [self.get_ref_matches_in_string(st, lang) for st in strings]
 
     #todo: handle ranges in inline refs
-    def _build_all_refs_from_string(self, title=None, st=None, lang="he"):
+    def get_ref_matches_in_string(self, st, lang=None):
         """
-        Build all Ref objects for title found in string.  By default, only match what is found between braces (as in Hebrew).
-        This is used primarily for Hebrew matching.  English matching uses _build_ref_from_string()
-        :param title: The title used in the text to refer to this Index node
-        :param st: The source text for this reference
-        :return: list of Refs
+        Finds references in a string in a single pass over the string.
+        English references are matched anywhere.  Hebrew references are only matched between braces or parentheses.
+        :param st: The source text
+        :param lang: "en" or "he"
+        :return: list of (Ref, start, end) tuples, in order of appearance.  start and end are the offsets of the reference in st.
         """
-        node = self.get_schema_node(title, lang)
-
-        refs = []
-        re_string = ur"""(?<=							# look behind for opening brace
-                [({]										# literal '(', brace,
-                [^})]*										# anything but a closing ) or brace
-            )
-            """ + regex.escape(title) + node.delimiter_re + node.regex(lang) + ur"""
-            (?=												# look ahead for closing brace
-                [^({]*										# match of anything but an opening '(' or brace
-                [)}]										# zero-width: literal ')' or brace
-            )"""
-        #node.regex(lang)
-        reg = regex.compile(re_string, regex.VERBOSE)
-        for ref_match in reg.finditer(st):
-            sections = []
-            gs = ref_match.groupdict()
-            for i in range(0, node.depth):
-                gname = u"a{}".format(i)
-                if gs.get(gname) is not None:
-                    sections.append(node._addressTypes[i].toIndex(lang, gs.get(gname)))
+        if not st:
+            return []
+        if lang is None:
+            lang = "he" if is_hebrew(st) else "en"
+        enclosed = self._enclosure_test(st) if lang == "he" else None
 
+        results = []
+        pos = 0
+        for start, title_end in self.all_titles_automaton(lang).candidates(st):
+            if start < pos:
+                continue
+            if enclosed and not enclosed(start, title_end):
+                continue
+            title = st[start:title_end]
+            node = self.get_schema_node(title, lang)
+            if not node:  # e.g. a map
+                continue
+            ref_match = self.address_regex(node, lang).match(st, title_end)
+            if not ref_match or (enclosed and not enclosed(start, ref_match.end())):
+                continue
+            sections = self.sections_from_match(node, ref_match, lang)
             _obj = {
-                "tref": ref_match.group(),
+                "tref": st[start:ref_match.end()],
                 "book": node.full_title("en"),
                 "index_node": node,
                 "index": node.index,
@@ -3123,9 +3643,32 @@ class Library(object):
                 "toSections": sections
             }
             try:
-                refs.append(Ref(_obj=_obj))
+                results.append((Ref(_obj=_obj), start, ref_match.end()))
             except InputError:
                 continue
-        return refs
+            pos = ref_match.end()
+        return results
+
+    @staticmethod
+    def _enclosure_test(st):
+        """
+        Precomputes the positions of braces in st.
+        :return: function(start, end) that is True if st[start:end] is preceded by an opening '(' or '{' that is not yet closed,
+            and is followed by a closing ')' or '}' before any other opening brace.
+        """
+        last_open, last_close = [-1] * (len(st) + 1), [-1] * (len(st) + 1)
+        for i, ch in enumerate(st):
+            last_open[i + 1] = i if ch in u"({" else last_open[i]
+            last_close[i + 1] = i if ch in u")}" else last_close[i]
+
+        next_open, next_close = [len(st)] * (len(st) + 1), [len(st)] * (len(st) + 1)
+        for i in range(len(st) - 1, -1, -1):
+            next_open[i] = i if st[i] in u"({" else next_open[i + 1]
+            next_close[i] = i if st[i] in u")}" else next_close[i + 1]
+
+        def enclosed(start, end):
+            return last_open[start] > last_close[start] and next_close[end] < min(next_open[end], len(st))
+        return enclosed
+
 
 library = Library()
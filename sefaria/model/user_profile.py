@@ -2,17 +2,20 @@ import hashlib
 import urllib
 import re
 import bleach
+from datetime import datetime
+from multiprocessing import Pool
 
 from django.contrib.auth.models import User
-from django.core.mail import EmailMultiAlternatives
+from django.core.mail import EmailMultiAlternatives, get_connection
 from django.template.loader import render_to_string
 from django.core.validators import URLValidator, EmailValidator
 from django.core.exceptions import ValidationError
 
 from sefaria.model.following import FollowersSet, FolloweesSet
-from sefaria.model.notification import NotificationSet
-from sefaria.system.database import db
-from sefaria.utils.users import user_link, user_links
+from sefaria.model.notification import NotificationSet, unread_count_for_user, invalidate_unread_counts
+from sefaria.system.database import db, reconnect
+from sefaria.settings import EMAIL_DIGEST_PROCESSES, EMAIL_DIGEST_BATCH_SIZE
+from sefaria.utils.users import user_link, user_directory
 
 
 class UserProfile(object):
@@ -104,12 +107,7 @@ class UserProfile(object):
 			d["_id"] = self._id
 		db.profiles.save(d)
 
-		# invalidate user links cache if needed
-		if self._name_updated or self._slug_updated:
-			global user_links
-			if self.id in user_links:
-				del user_links[self.id]
-			self._slug_updated = False
+		self._slug_updated = False
 
 		# store name changes on Django User object
 		if self._name_updated:
@@ -119,6 +117,9 @@ class UserProfile(object):
 			user.save()
 			self._name_updated = False
 
+		# invalidate user directory cache, once the names it is read from are stored
+		user_directory.invalidate(self.id)
+
 		return self
 
 	def errors(self):
@@ -205,7 +206,7 @@ class UserProfile(object):
 		return json.dumps(self.to_DICT)
 
 
-def email_unread_notifications(timeframe):
+def email_unread_notifications(timeframe, resume=False, processes=EMAIL_DIGEST_PROCESSES, batch_size=EMAIL_DIGEST_BATCH_SIZE, connection=None):
 	"""
 	Looks for all unread notifcations and sends each user one email with a summary.
 	Marks any sent notifications as "read".
@@ -214,37 +215,99 @@ def email_unread_notifications(timeframe):
 	* 'daily'  - only send to users who have the daily email setting
 	* 'weekly' - only send to users who have the weekly email setting
 	* 'all'    - send all notifications
+
+	Users are handled in batches of batch_size, in order of uid.  The profiles, users and notifications of a batch
+	are loaded with one query each, its emails are rendered in a pool of 'processes' processes,
+	and all emails are sent over one SMTP connection.
+	The last uid of each batch sent is checkpointed in email_digest_checkpoints.  With resume, a run that stopped
+	continues after its checkpoint.
+	:param connection: a Django mail connection, defaults to get_connection()
+	:return int: number of emails sent
+	"""
+	uids = sorted(db.notifications.find({"read": False}).distinct("uid"))
+
+	checkpoint = db.email_digest_checkpoints.find_one({"_id": timeframe}) if resume else None
+	if checkpoint:
+		if checkpoint["last_uid"] is not None:
+			uids = [uid for uid in uids if uid > checkpoint["last_uid"]]
+		sent = checkpoint["sent"]
+	else:
+		sent = 0
+		db.email_digest_checkpoints.save({"_id": timeframe, "last_uid": None, "sent": 0, "started": datetime.now()})
+
+	connection = connection or get_connection()
+	pool = Pool(processes, _digest_worker_init) if processes > 1 else None
+	connection.open()
+	try:
+		for i in range(0, len(uids), batch_size):
+			batch    = uids[i:i + batch_size]
+			digests  = _digest_batch(batch, timeframe)
+			rendered = pool.map(_render_digest, digests) if pool else map(_render_digest, digests)
+
+			messages = []
+			for (uid, to, first_name, notifications), (subject, message_html) in zip(digests, rendered):
+				msg = EmailMultiAlternatives(subject, message_html, "The Sefaria Project <hello@sefaria.org>", [to], connection=connection)
+				msg.content_subtype = "html"  # Main content is now text/html
+				messages.append(msg)
+			if messages:
+				connection.send_messages(messages)
+
+			ids = [n["_id"] for digest in digests for n in digest[3]]
+			if ids:
+				db.notifications.update({"_id": {"$in": ids}}, {"$set": {"read": True, "read_via": "email"}}, multi=True)
+				invalidate_unread_counts([digest[0] for digest in digests])
+			sent += len(messages)
+			db.email_digest_checkpoints.update({"_id": timeframe}, {"$set": {"last_uid": batch[-1], "sent": sent}})
+	finally:
+		connection.close()
+		if pool:
+			pool.close()
+			pool.join()
+
+	db.email_digest_checkpoints.remove({"_id": timeframe})
+	return sent
+
+
+def _digest_batch(uids, timeframe):
+	"""
+	Returns (uid, email, first name, unread notification dicts) for each user in uids who is sent an email in timeframe.
 	"""
+	profiles = {p["id"]: p for p in db.profiles.find({"id": {"$in": uids}}, {"id": 1, "settings": 1})}
+	wanted   = [uid for uid in uids
+				if timeframe == "all" or profiles.get(uid, {}).get("settings", {}).get("email_notifications", "daily") == timeframe]
+	if not wanted:
+		return []
+	users = {user.id: user for user in User.objects.filter(id__in=wanted).only("id", "first_name", "email")}
 
-	users = db.notifications.find({"read": False}).distinct("uid")
+	notifications = {}
+	for n in db.notifications.find({"uid": {"$in": users.keys()}, "read": False}).sort([["date", -1]]):
+		notifications.setdefault(n["uid"], []).append(n)
+
+	return [(uid, users[uid].email, users[uid].first_name, notifications[uid]) for uid in wanted if uid in notifications]
 
-	for uid in users:
-		profile = UserProfile(id=uid)
-		if profile.settings["email_notifications"] != timeframe and timeframe != 'all':
-			continue
-		notifications = NotificationSet().unread_for_user(uid)
-		try:
-			user = User.objects.get(id=uid)
-		except User.DoesNotExist:
-			continue
 
-		message_html = render_to_string("email/notifications_email.html", { "notifications": notifications, "recipient": user.first_name })
-		#message_text = util.strip_tags(message_html)
-		subject      = "New Activity on Sefaria from %s" % notifications.actors_string()
-		from_email   = "The Sefaria Project <hello@sefaria.org>"
-		to           = user.email
+def _render_digest(digest):
+	"""
+	Returns (subject, html) of the email for a digest from _digest_batch().
+	"""
+	uid, to, first_name, records = digest
+	notifications = NotificationSet(records=records)
+	message_html  = render_to_string("email/notifications_email.html", { "notifications": notifications, "recipient": first_name })
+	#message_text = util.strip_tags(message_html)
+	subject       = "New Activity on Sefaria from %s" % notifications.actors_string()
+	return subject, message_html
 
-		msg = EmailMultiAlternatives(subject, message_html, from_email, [to])
-		msg.content_subtype = "html"  # Main content is now text/html
-		#msg.attach_alternative(message_text, "text/plain")
-		msg.send()
 
-		notifications.mark_read(via="email")
+def _digest_worker_init():
+	# Connections aren't shared with the parent process
+	from django.db import connection
+	connection.close()
+	reconnect()
 
 
 def unread_notifications_count_for_user(uid):
-	"""Returns the number of unread notifcations belonging to user uid"""
-	return db.notifications.find({"uid": uid, "read": False}).count()
+	"""Returns the number of unread notifcations belonging to user uid, from its cached count"""
+	return unread_count_for_user(uid)
 
 
 def annotate_user_list(uids):
@@ -252,11 +315,13 @@ def annotate_user_list(uids):
 	Returns a list of dictionaries giving details (names, profile links) 
 	for the user ids list in uids.
 	"""
+	users = user_directory.get_many(uids)
 	annotated_list = []
 	for uid in uids:
+		user = users.get(uid) or user_directory.get(uid)
 		annotated = {
-			"userLink": user_link(uid),
-			"imageUrl": UserProfile(id=uid).gravatar_url_small,
+			"userLink": user["link"],
+			"imageUrl": user["imageUrl"],
 		}
 		annotated_list.append(annotated)
 
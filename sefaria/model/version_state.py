@@ -2,7 +2,13 @@
 version_state.py
 Writes to MongoDB Collection:
 """
+import copy
+import time
+import uuid
+import hashlib
 import logging
+from datetime import datetime
+from multiprocessing import Pool
 
 
 logger = logging.getLogger(__name__)
@@ -13,7 +19,9 @@ from . import link
 from text import VersionSet, AbstractIndex, AbstractSchemaContent, IndexSet, library, get_index, Ref
 from sefaria.datatype.jagged_array import JaggedTextArray, JaggedIntArray
 from sefaria.system.exceptions import InputError, BookNameError
-from sefaria.system.cache import delete_template_cache
+from sefaria.system.cache import delete_template_cache, get_cache_elem, set_cache_elem
+from sefaria.system.database import db, reconnect
+from sefaria.settings import VSTATE_REFRESH_PROCESSES
 
 '''
 old count docs were:
@@ -129,8 +137,9 @@ class VersionState(abst.AbstractMongoRecord, AbstractSchemaContent):
         return c
 
     def _load_versions(self):
+        # Without content.  It's read by _node_count(), a slice of sections at a time.
         for lang in self.langs:
-            self._versions[lang] = [v for v in VersionSet({"title": self.index.title, "language": lang})]
+            self._versions[lang] = [v for v in VersionSet({"title": self.index.title, "language": lang}, proj={"chapter": 0})]
 
     def versions(self, lang):
         if not self._versions.get(lang):
@@ -145,6 +154,69 @@ class VersionState(abst.AbstractMongoRecord, AbstractSchemaContent):
         self.linksCount = link.LinkSet(Ref(self.index.title)).count()
         self.save()
 
+    def refresh_section(self, oref):
+        """
+        Refresh after a change to the text of oref.
+        Recounts only the section of oref, in each language, loading just that section of each Version.
+        The counts of the rest of the node are taken from this record, and everything derived from them is recomputed.
+        Falls back to a full refresh() if oref is not within a single section that is already counted,
+        as when a section is added, or when the text has a single level.
+        :param oref: Ref of the changed text
+        """
+        if self.is_new_state:  # refresh done on init
+            return
+        section_ref = self._counted_section(oref)
+        if not section_ref:
+            self.refresh()
+            return
+
+        snode = section_ref.index_node
+        current = self.content_node(snode)
+        indexes = [i - 1 for i in section_ref.sections]
+        ja = {}
+        for lang, lkey in self.lang_map.items():
+            counts = copy.deepcopy(current[lkey]["availableTexts"])
+            _set_sub_array(counts, indexes, self._section_count(section_ref, lang).array())
+            ja[lkey] = JaggedIntArray(counts)
+
+        self._node_state(snode, current, ja)
+        self.index.nodes.visit_structure(self._aggregate_structure_state, self)
+        self.save()
+
+    def _counted_section(self, oref):
+        """
+        :return Ref: The section of oref, if its counts are stored in this record.  Otherwise None.
+        """
+        if oref.index_node.depth < 2 or oref.is_spanning() or len(oref.sections) < oref.index_node.depth - 1:
+            return None
+        section_ref = oref.section_ref()
+        try:
+            current = self.content_node(section_ref.index_node)
+        except (KeyError, TypeError):
+            return None
+        indexes = [i - 1 for i in section_ref.sections]
+        for lkey in self.lang_keys:
+            if _get_sub_array(current.get(lkey, {}).get("availableTexts"), indexes) is None:
+                return None
+        return section_ref
+
+    def _section_count(self, section_ref, lang):
+        """
+        Count available versions of one section, segment by segment.
+        Equivalent to the section of _node_count(), but only loads that section of each Version.
+        :return counts:
+        :type return: JaggedIntArray
+        """
+        counts = JaggedIntArray()
+        for version in VersionSet({"title": section_ref.book, "language": lang}, proj=section_ref.part_projection()):
+            content = version.content_node(section_ref.index_node)
+            # The projection returns a one element slice of the top level
+            section = _get_sub_array(content, [0] + [i - 1 for i in section_ref.sections[1:]])
+            if section is None:
+                continue
+            counts = counts + JaggedTextArray(section).mask()
+        return counts
+
     def get_flag(self, flag):
         return self.flags.get(flag, None)
 
@@ -192,8 +264,6 @@ class VersionState(abst.AbstractMongoRecord, AbstractSchemaContent):
         current = contents[0]  # some information is manually set - don't wipe and re-create it.   todo: just copy flags?
         depth = snode.depth  # This also acts as an assertion that we have a SchemaContentNode
         ja = {}  # JaggedIntArrays for each language and 'all'
-        padded_ja = {}  # Padded JaggedIntArrays for each language
-
 
         # Get base counts for each language
         for lang, lkey in self.lang_map.items():
@@ -202,6 +272,19 @@ class VersionState(abst.AbstractMongoRecord, AbstractSchemaContent):
 
             ja[lkey] = self._node_count(snode, lang)
 
+        return self._node_state(snode, current, ja)
+
+    def _node_state(self, snode, current, ja):
+        """
+        Sets the state of a content node from its counts.
+        :param snode: SchemaContentNode
+        :param current: The content node of this record, to be modified in place
+        :param ja: dict of JaggedIntArray counts, for each language key.  Counts may be padded with zeros.
+        :return: current
+        """
+        depth = snode.depth
+        padded_ja = {}  # Padded JaggedIntArrays for each language
+
         # Sum all of the languages
         ja['_all'] = reduce(lambda x, y: x + y, [ja[lkey] for lkey in self.lang_keys])
         zero_mask = ja['_all'].zero_mask()
@@ -285,10 +368,10 @@ class VersionState(abst.AbstractMongoRecord, AbstractSchemaContent):
 
         versions = self.versions(lang)
         for version in versions:
-            raw_text_ja = version.content_node(snode)
-            ja = JaggedTextArray(raw_text_ja)
-            mask = ja.mask()
-            counts = counts + mask
+            mask = []
+            for start, sections in version.iter_node_content(snode):
+                mask += JaggedTextArray(sections).mask().array()
+            counts = counts + JaggedIntArray(mask)
 
         return counts
 
@@ -330,6 +413,23 @@ class VersionState(abst.AbstractMongoRecord, AbstractSchemaContent):
                 result['full'] += 1
 
 
+def _get_sub_array(ja, indexes):
+    """
+    :param ja: nested lists
+    :param indexes: 0 based indexes
+    :return: The list at indexes, or None if there is none
+    """
+    for i in indexes:
+        if not isinstance(ja, list) or len(ja) <= i:
+            return None
+        ja = ja[i]
+    return ja if isinstance(ja, list) else None
+
+
+def _set_sub_array(ja, indexes, value):
+    _get_sub_array(ja, indexes[:-1])[indexes[-1]] = value
+
+
 class VersionStateSet(abst.AbstractMongoSet):
     recordClass = VersionState
 
@@ -443,25 +543,134 @@ class StateNode(object):
         return en[unit]
 
 
-def refresh_all_states():
-    indices = IndexSet()
+def refresh_all_states(processes=VSTATE_REFRESH_PROCESSES, resume=False, slowest=20):
+    """
+    Refresh the VersionState of every text, then rebuild the summaries.
+    Titles are refreshed in a pool of processes.  Each finished title is recorded in the vstate_refresh collection,
+    so that an interrupted run can be resumed.
+    :param processes: Number of processes.  With 1, titles are refreshed in this process.
+    :param resume: If True, skip titles that were refreshed without error by the previous run
+    :param slowest: Number of slowest titles to report at the end
+    :return list: (title, seconds, error) for each title refreshed by this run
+    """
+    titles = _all_state_titles()
+    if resume:
+        done = set(db.vstate_refresh.find({"error": None}).distinct("title"))
+        titles = [t for t in titles if t not in done]
+        print "Resuming refresh of VersionStates. {} done, {} to go.".format(len(done), len(titles))
+    else:
+        db.vstate_refresh.remove({})
+        print "Refreshing {} VersionStates.".format(len(titles))
+
+    if processes > 1:
+        pool = Pool(processes, reconnect)
+        results = pool.imap_unordered(_refresh_state, titles)
+    else:
+        pool = None
+        results = (_refresh_state(title) for title in titles)
+
+    timings = []
+    try:
+        for i, (title, seconds, error) in enumerate(results):
+            db.vstate_refresh.update({"title": title}, {"title": title, "seconds": seconds, "error": error, "finished": datetime.now()}, upsert=True)
+            timings.append((title, seconds, error))
+            print u"[{}/{}] {}: {:.2f}s{}".format(i + 1, len(titles), title, seconds, u" ERROR {}".format(error) if error else u"")
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+
+    print "Slowest titles:"
+    for title, seconds, error in sorted(timings, key=lambda t: t[1], reverse=True)[:slowest]:
+        print u"{:>10.2f}s  {}".format(seconds, title)
+    errors = [t for t in timings if t[2]]
+    if errors:
+        print "{} titles failed.  Run again with resume=True to retry them.".format(len(errors))
 
-    for index in indices:
+    import sefaria.summaries as summaries
+    summaries.update_summaries()
+    return timings
+
+
+def _all_state_titles():
+    """
+    :return list: The titles of all texts that have a VersionState, including each commentary on each book
+    """
+    titles = []
+    for index in IndexSet():
         if index.is_commentary():
             c_re = "^{} on ".format(index.title)
-            texts = VersionSet({"title": {"$regex": c_re}}).distinct("title")
-            for text in texts:
-                VersionState(text).refresh()
+            titles += VersionSet({"title": {"$regex": c_re}}).distinct("title")
         else:
-            VersionState(index).refresh()
+            titles.append(index.title)
+    return titles
 
-    import sefaria.summaries as summaries
-    summaries.update_summaries()
+
+def _refresh_state(title):
+    """
+    Runs in worker processes, so it returns, rather than raises, errors.
+    :return tuple: (title, seconds, error message or None)
+    """
+    start = time.time()
+    try:
+        VersionState(title).refresh()
+        error = None
+    except Exception as e:
+        logger.exception(u"Failed to refresh VersionState of {}".format(title))
+        error = u"{}: {}".format(type(e).__name__, e)
+    return title, time.time() - start, error
+
+
+"""
+Navigation index.
+For next / prev section navigation, the addresses of the sections of each content node that have text in any language
+are kept in order, in process and in the shared cache, so that finding the next or previous section is a binary search.
+Each book's entry is stamped.  Saving a VersionState puts a new stamp for its book in the shared cache,
+and every process reloads the book on its next lookup.
+"""
+_navigation_cache = {}  # title: (stamp, {node key: [section addresses]})
+
+
+def _navigation_key(kind, title, stamp=""):
+    return "vstate_navigation.{}.{}{}".format(kind, hashlib.md5(title.encode("utf-8")).hexdigest(), stamp)
+
+
+def _new_navigation_stamp(title):
+    stamp = uuid.uuid4().hex
+    set_cache_elem(_navigation_key("stamp", title), stamp)
+    return stamp
+
+
+def available_sections(title, snode):
+    """
+    :param title: title of a book
+    :param snode: the content node of the book
+    :return list: 0 based address tuples of the sections of snode that have text in any language, in order
+    """
+    stamp = get_cache_elem(_navigation_key("stamp", title)) or _new_navigation_stamp(title)
+    cached = _navigation_cache.get(title)
+    if cached is None or cached[0] != stamp:
+        cached = (stamp, get_cache_elem(_navigation_key("sections", title, stamp)) or {})
+        _navigation_cache[title] = cached
+
+    nodes = cached[1]
+    key = u"|".join(snode.version_address())
+    if key not in nodes:
+        state_ja = VersionState(title).state_node(snode).ja("all", "availableTexts")
+        nodes[key] = [tuple(s) for s in state_ja.non_empty_sections()]
+        set_cache_elem(_navigation_key("sections", title, stamp), nodes)
+    return nodes[key]
+
+
+def process_version_state_change_in_navigation(vs, **kwargs):
+    _new_navigation_stamp(vs.title)
+    _navigation_cache.pop(vs.title, None)
 
 
 def process_index_delete_in_version_state(indx, **kwargs):
     from sefaria.system.database import db
     db.vstate.remove({"title": indx.title})
+    _new_navigation_stamp(indx.title)
 
 
 def process_index_title_change_in_version_state(indx, **kwargs):
@@ -3,7 +3,7 @@ from datetime import datetime
 from bson.objectid import ObjectId
 
 import sefaria.model as model
-from sefaria.utils.users import user_link
+from sefaria.utils.users import user_link, user_directory
 from sefaria.utils.util import *
 from sefaria.system.database import db
 
@@ -22,6 +22,7 @@ def save_review(review, uid):
 		"language": review["language"],
 		"version":  review["version"],
 	}
+	review.update(model.history.history_ref_fields(model.Ref(review["ref"])))
 
 	# Check for a review from this user since the last edit
 	existing = get_current_review(uid, review["ref"], review["language"], review["version"])
@@ -30,6 +31,9 @@ def save_review(review, uid):
 		review["_id"] = existing["_id"]
 
 	db.history.save(review)
+	model.history.record_contributors([review])
+	if not existing:
+		model.leaderboard.record_history([review])
 	
 	review["_id"] = str(review["_id"])
 	review["date"] = review["date"].isoformat()
@@ -62,6 +66,8 @@ def delete_review(review_id, uid):
 	if review["user"] != uid:
 		return {"error": "You do not have permissions to delete this review."}
 	db.history.remove(review)
+	model.leaderboard.record_history([review], sign=-1)
+	model.history.refresh_contributors(review["ref"], review["version"], review["language"])
 	return {"status": "ok"}
 
 
@@ -72,10 +78,11 @@ def get_reviews(tref, lang, version):
 	reviews = []
 	tref = model.Ref(tref).normal()
 	refRe = '^%s$|^%s:' % (tref, tref)
-	cursor = db.history.find({"ref": {"$regex": refRe}, "language": lang, "version": version, "rev_type": "review"}).sort([["date", -1]])
+	cursor = list(db.history.find({"ref": {"$regex": refRe}, "language": lang, "version": version, "rev_type": "review"}).sort([["date", -1]]))
+	users = user_directory.get_many([r["user"] for r in cursor])
 	for r in cursor:
 		r["_id"] = str(r["_id"])
-		r["userLink"] = user_link(r["user"])
+		r["userLink"] = users[r["user"]]["link"] if r["user"] in users else user_link(r["user"])
 		reviews.append(r)
 
 	return reviews
@@ -2,11 +2,12 @@
 """
 search.py - full-text search for Sefaria using ElasticSearch
 
-Writes to MongoDB Collection: index_queue
+Writes to MongoDB Collections: index_queue, index_queue_dead_letter
 """
 import os
 from pprint import pprint
 from datetime import datetime, timedelta
+from multiprocessing import Pool
 
 # To allow these files to be run directly from command line (w/o Django shell)
 os.environ['DJANGO_SETTINGS_MODULE'] = "settings"
@@ -14,10 +15,13 @@ os.environ['DJANGO_SETTINGS_MODULE'] = "settings"
 from pyelasticsearch import ElasticSearch
 
 from sefaria.model import *
+from sefaria.model.text import AddressTalmud, JaggedArrayNode
 from sefaria.utils.users import user_link
-from sefaria.system.database import db
+from sefaria.system.database import db, reconnect
 from sefaria.utils.util import strip_tags
-from settings import SEARCH_HOST, SEARCH_INDEX_NAME
+from sefaria.system.bulk_index import BulkIndexer
+from settings import SEARCH_HOST, SEARCH_INDEX_NAME, SEARCH_BULK_MAX_DOCS, SEARCH_BULK_MAX_BYTES, SEARCH_INDEX_PROCESSES, \
+    SEARCH_QUEUE_BATCH_SIZE, SEARCH_QUEUE_MAX_ATTEMPTS, SEARCH_QUEUE_RETRY_SECONDS
 import sefaria.model.queue as qu
 
 
@@ -32,23 +36,41 @@ def index_text(tref, version=None, lang=None):
     If no version and lang are given, this functon will be called for each availble version.
     Currently assumes ref is at section level. 
     """
-    #tref = texts.norm_ref(unicode(tref))
-    #todo: why the unicode()?
+    for doc_type, doc_id, doc in text_index_documents(tref, version, lang):
+        try:
+            global doc_count
+            if doc_count % 5000 == 0:
+                print "[%d] Indexing %s / %s / %s" % (doc_count, doc["ref"], doc["version"], doc["lang"])
+            es.index('sefaria', doc_type, doc, doc_id)
+            doc_count += 1
+        except Exception, e:
+            print "ERROR indexing %s / %s / %s" % (doc["ref"], doc["version"], doc["lang"])
+            pprint(e)
+
+
+def text_index_documents(tref, version=None, lang=None):
+    """
+    Generates the documents that index the text designated by ref, as (doc_type, doc_id, doc).
+    If no version and lang are given, generates the documents for each available version.
+    Segments of a section level ref are generated as documents of their own, followed by the section.
+    """
     tref = Ref(tref).normal()
 
     # Recall this function for each specific text version, if non provided
     if not (version and lang):
         for v in Ref(tref).version_list():
-            index_text(tref, version=v["versionTitle"], lang=v["language"])
+            for d in text_index_documents(tref, version=v["versionTitle"], lang=v["language"]):
+                yield d
         return
 
     # Index each segment of this document individually
     oref = Ref(tref).padded_ref()
     if len(oref.sections) < len(oref.index_node.sectionNames):
-        t = TextChunk(Ref(tref), lang="en", vtitle=version)
+        t = TextChunk(Ref(tref), lang=lang, vtitle=version)
 
         for i in range(len(t.text)):
-            index_text("%s:%d" % (tref, i+1))
+            for d in text_index_documents("%s:%d" % (tref, i+1), version=version, lang=lang):
+                yield d
 
     # Don't try to index docs with depth 3
     if len(oref.sections) < len(oref.index_node.sectionNames) - 1:
@@ -57,36 +79,49 @@ def index_text(tref, version=None, lang=None):
     # Index this document as a whole
     doc = make_text_index_document(tref, version, lang)
     if doc:
-        try:
-            global doc_count
-            if doc_count % 5000 == 0:
-                print "[%d] Indexing %s / %s / %s" % (doc_count, tref, version, lang)
-            es.index('sefaria', 'text', doc, make_text_doc_id(tref, version, lang))
-            doc_count += 1
-        except Exception, e:
-            print "ERROR indexing %s / %s / %s" % (tref, version, lang)
-            pprint(e)
+        yield "text", make_text_doc_id(tref, version, lang), doc
 
 
 def make_text_index_document(tref, version, lang):
     """
     Create a document for indexing from the text specified by ref/version/lang
     """
-    #text = texts.get_text(tref, context=0, commentary=False, version=version, lang=lang)
-    text = TextFamily(Ref(tref), context=0, commentary=False, version=version, lang=lang).contents()
+    oref = Ref(tref).padded_ref()
+    content = TextChunk(oref, lang, version).text
+    return make_text_index_document_from_content(text_index_metadata(oref), oref.sections, tref, content, version, lang)
+
+
+def text_index_metadata(oref):
+    """
+    The parts of a text index document that are the same for every ref in a book.
+    """
+    inode = oref.index_node
+    return {
+        "book": oref.book,
+        "sectionNames": inode.sectionNames,
+        "talmud": oref.is_talmud(),
+        "heTitle": inode.full_title("he"),
+        "titleVariants": inode.all_tree_titles("en"),
+        "categories": getattr(inode.index, "categories", ""),
+    }
 
-    if text["type"] == "Talmud":
-        title = text["book"] + " Daf " + text["sections"][0]
-    elif text["type"] == "Commentary" and text["commentaryCategories"][0] == "Talmud":
-        title = text["book"] + " Daf " + text["sections"][0]
+
+def make_text_index_document_from_content(meta, sections, tref, content, version, lang):
+    """
+    Create a document for indexing from text content that has already been loaded
+    :param meta: dict, from text_index_metadata()
+    :param sections: list of section numbers of the (padded) ref
+    """
+    if meta["talmud"]:
+        title = meta["book"] + " Daf " + AddressTalmud.toStr("en", sections[0])
     else:
-        title = text["book"] + " " + " ".join(["%s %d" % (p[0],p[1]) for p in zip(text["sectionNames"], text["sections"])])
+        title = meta["book"] + " " + " ".join(["%s %d" % (p[0],p[1]) for p in zip(meta["sectionNames"], sections)])
     title += " (%s)" % version
 
     if lang == "he":
-        title = text.get("heTitle", "") + " " + title
+        he_title = meta["heTitle"] + " " + AddressTalmud.toStr("he", sections[0]) if meta["talmud"] else meta["heTitle"]
+        title = he_title + " " + title
 
-    content = text["he"] if lang == 'he' else text["text"] 
     if not content:
         # Don't bother indexing if there's no content
         return False
@@ -98,12 +133,39 @@ def make_text_index_document(tref, version, lang):
         "ref": tref,
         "version": version, 
         "lang": lang,
-        "titleVariants": text["titleVariants"],
+        "titleVariants": meta["titleVariants"],
         "content": content,
-        "categories": text["categories"],
+        "categories": meta["categories"],
         }
 
 
+def version_index_documents(version):
+    """
+    Generates all of the section and segment documents for a Version, as (doc_type, doc_id, doc).
+    The Version is read in slices of sections, and the metadata of its Index is resolved once,
+    rather than loading a TextFamily for each section.
+    Produces the same documents as text_index_documents() does, section by section.
+    :param version: Version.  Its content is read section by section (see Version.iter_sections()), so it may be loaded without it.
+    """
+    root = Ref(version.title)
+    if not isinstance(root.index_node, JaggedArrayNode):
+        print "Skipping %s / %s: Only texts with a single jagged array are indexed by version." % (version.title, version.versionTitle)
+        return
+
+    meta = text_index_metadata(root)
+    vtitle, lang = version.versionTitle, version.language
+    for section_ref, section in version.iter_sections():
+        for i, segment in enumerate(section):
+            segment_ref = section_ref.subref(i + 1)
+            doc = make_text_index_document_from_content(meta, segment_ref.sections, segment_ref.normal(), segment, vtitle, lang)
+            if doc:
+                yield "text", make_text_doc_id(segment_ref.normal(), vtitle, lang), doc
+
+        doc = make_text_index_document_from_content(meta, section_ref.sections, section_ref.normal(), section, vtitle, lang)
+        if doc:
+            yield "text", make_text_doc_id(section_ref.normal(), vtitle, lang), doc
+
+
 def make_text_doc_id(ref, version, lang):
     """
     Returns a doc id string for indexing based on ref, versiona and lang.
@@ -140,14 +202,8 @@ def index_sheet(id):
     sheet = db.sheets.find_one({"id": id})
     if not sheet: return False
 
-    doc = {
-        "title": sheet["title"],
-        "content": make_sheet_text(sheet),
-        "version": "Source Sheet by " + user_link(sheet["owner"]),
-        "sheetId": id,
-    }
     try:
-        es.index('sefaria', 'sheet', doc, id)
+        es.index('sefaria', 'sheet', make_sheet_index_document(sheet), id)
         global doc_count
         doc_count += 1
     except Exception, e:
@@ -155,6 +211,18 @@ def index_sheet(id):
         print e
 
 
+def make_sheet_index_document(sheet):
+    """
+    Create a document for indexing from a source sheet
+    """
+    return {
+        "title": sheet["title"],
+        "content": make_sheet_text(sheet),
+        "version": "Source Sheet by " + user_link(sheet["owner"]),
+        "sheetId": sheet["id"],
+    }
+
+
 def make_sheet_text(sheet):
     """
     Returns a plain text representation of the content of sheet.
@@ -269,6 +337,96 @@ def index_all_sections(skip=0):
     print "Indexed %d documents." % doc_count
 
 
+def bulk_index_all_sections(skip=0, processes=SEARCH_INDEX_PROCESSES, indexer=None):
+    """
+    Index all sections of available text with the bulk API, building the documents of each section from a TextFamily.
+    bulk_index_all_versions() builds the same documents with far fewer reads.
+    :param skip: Number of refs to skip at the start of library.ref_list()
+    :param processes: Number of processes that build documents.  With 1, documents are built in this process.
+    :param indexer: BulkIndexer.  If not given, one is made for SEARCH_HOST.
+    :return BulkIndexer: with stats of the run
+    """
+    refs = library.ref_list()[skip:]
+    print "Beginning bulk index of %d refs." % len(refs)
+    return _bulk_index(refs, _text_index_documents_for_ref, processes, indexer)
+
+
+def bulk_index_all_versions(skip=0, processes=SEARCH_INDEX_PROCESSES, indexer=None):
+    """
+    Index all versions of all texts with the bulk API.
+    Each Version is loaded once, and all of its section and segment documents are built from it.
+    :param skip: Number of versions to skip
+    :param processes: Number of processes that build documents.  With 1, documents are built in this process.
+    :param indexer: BulkIndexer.  If not given, one is made for SEARCH_HOST.
+    :return BulkIndexer: with stats of the run
+    """
+    ids = [v["_id"] for v in db.texts.find({}, {"_id": 1}).sort("_id", 1)][skip:]
+    print "Beginning bulk index of %d versions." % len(ids)
+    return _bulk_index(ids, _version_index_documents_for_id, processes, indexer)
+
+
+def _bulk_index(items, build, processes, indexer):
+    """
+    Documents are built in a pool of processes, and streamed to the search server in bulk requests as they are ready.
+    :param items: list of picklable arguments to build
+    :param build: module level function that takes an item and returns (item, docs, error)
+    """
+    indexer = indexer or make_bulk_indexer()
+    if processes > 1:
+        pool = Pool(processes, reconnect)
+        results = pool.imap_unordered(build, items, chunksize=10)
+    else:
+        pool = None
+        results = (build(item) for item in items)
+
+    try:
+        for i, (item, docs, error) in enumerate(results):
+            if error:
+                indexer.add_failure(item, error)
+            for doc_type, doc_id, doc in docs:
+                indexer.add(doc_type, doc_id, doc)
+            if i % 1000 == 0:
+                print "[%d / %d] %s" % (i, len(items), indexer.report())
+        indexer.flush()
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+
+    print indexer.report()
+    return indexer
+
+
+def _text_index_documents_for_ref(tref):
+    """
+    Builds all the documents for tref.  Runs in worker processes, so it returns, rather than raises, errors.
+    :return tuple: (tref, list of (doc_type, doc_id, doc), error message or None)
+    """
+    try:
+        return tref, list(text_index_documents(tref)), None
+    except Exception, e:
+        return tref, [], u"{}: {}".format(type(e).__name__, e)
+
+
+def _version_index_documents_for_id(_id):
+    """
+    Builds all the documents for the Version with _id.  Runs in worker processes, so it returns, rather than raises, errors.
+    :return tuple: (version description, list of (doc_type, doc_id, doc), error message or None)
+    """
+    version = Version().load({"_id": _id}, {"chapter": 0})
+    if not version:
+        return str(_id), [], "Version not found"
+    name = u"{} / {} / {}".format(version.title, version.versionTitle, version.language)
+    try:
+        return name, list(version_index_documents(version)), None
+    except Exception, e:
+        return name, [], u"{}: {}".format(type(e).__name__, e)
+
+
+def make_bulk_indexer(host=SEARCH_HOST, index_name=SEARCH_INDEX_NAME):
+    return BulkIndexer(host, index_name, max_docs=SEARCH_BULK_MAX_DOCS, max_bytes=SEARCH_BULK_MAX_BYTES)
+
+
 def index_public_sheets():
     """
     Index all source sheets that are publically listed.
@@ -279,6 +437,15 @@ def index_public_sheets():
         index_sheet(id)
 
 
+def public_sheet_index_documents():
+    """
+    Generates documents for all source sheets that are publicly listed, as (doc_type, doc_id, doc).
+    """
+    from sheets import LISTED_SHEETS
+    for sheet in db.sheets.find({"status": {"$in": LISTED_SHEETS}}):
+        yield "sheet", sheet["id"], make_sheet_index_document(sheet)
+
+
 def index_public_notes():
     """
     Index all public notes.
@@ -313,22 +480,64 @@ def add_ref_to_index_queue(ref, version, lang):
     return True
 
 
-def index_from_queue():
+def index_from_queue(batch_size=SEARCH_QUEUE_BATCH_SIZE, max_attempts=SEARCH_QUEUE_MAX_ATTEMPTS, retry_seconds=SEARCH_QUEUE_RETRY_SECONDS):
     """
-    Index every ref/version/lang found in the index queue.
+    Index every ref/version/lang found in the index queue, in batches sent with the bulk API.
     Delete queue records on success.
+    On failure, a record is retried on a later run, after a delay that doubles with each attempt.
+    After max_attempts, it is moved to the index_queue_dead_letter collection.
+    :return dict: counts of "indexed", "retrying" and "dead" queue records
     """
-    queue = db.index_queue.find()
-    for item in queue:
-        try:
-            index_text(item["ref"], version=item["version"], lang=item["lang"])
-            db.index_queue.remove(item)
-        except Exception, e:
-            import sys
-            reload(sys)
-            sys.setdefaultencoding("utf-8")
-            print "Error indexing from queue (%s / %s / %s)" % (item["ref"], item["version"], item["lang"])
-            print e
+    qu.ensure_index_queue_index()
+    counts = {"indexed": 0, "retrying": 0, "dead": 0}
+    start = datetime.now()
+    while True:
+        # Records that fail in this run are scheduled after start, and records saved during this run wait for the next one,
+        # so each record is tried at most once per run
+        batch = list(db.index_queue.find({
+            "$or": [{"nextAttempt": None}, {"nextAttempt": {"$lte": start}}],
+            "lastModified": {"$not": {"$gt": start}}
+        }).sort("lastModified", 1).limit(batch_size))
+        if not batch:
+            break
+
+        indexer = make_bulk_indexer()
+        indexer.max_failures_kept = None
+        items_by_doc = {}
+        errors = {}
+        for item in batch:
+            try:
+                for doc_type, doc_id, doc in text_index_documents(item["ref"], version=item["version"], lang=item["lang"]):
+                    items_by_doc[doc_id] = item["_id"]
+                    indexer.add(doc_type, doc_id, doc)
+            except Exception, e:
+                errors[item["_id"]] = u"{}: {}".format(type(e).__name__, e)
+        indexer.flush()
+        for doc_id, error in indexer.failures:
+            errors.setdefault(items_by_doc[doc_id], error)
+
+        for item in batch:
+            if item["_id"] not in errors:
+                # If the text was saved again while indexing, the record stays for the next run
+                db.index_queue.remove({"_id": item["_id"], "lastModified": item.get("lastModified")})
+                counts["indexed"] += 1
+            elif item.get("attempts", 0) + 1 >= max_attempts:
+                print "Giving up on indexing %s / %s / %s: %s" % (item["ref"], item["version"], item["lang"], errors[item["_id"]])
+                item.update({"attempts": item.get("attempts", 0) + 1, "error": errors[item["_id"]], "failed": datetime.now()})
+                db.index_queue_dead_letter.insert(item)
+                db.index_queue.remove({"_id": item["_id"]})
+                counts["dead"] += 1
+            else:
+                attempts = item.get("attempts", 0) + 1
+                db.index_queue.update({"_id": item["_id"]}, {"$set": {
+                    "attempts": attempts,
+                    "error": errors[item["_id"]],
+                    "nextAttempt": datetime.now() + timedelta(seconds=retry_seconds * 2 ** (attempts - 1))
+                }})
+                counts["retrying"] += 1
+
+    print "Index queue: %(indexed)d indexed, %(retrying)d to retry, %(dead)d given up." % counts
+    return counts
 
 
 def add_recent_to_queue(ndays):
@@ -349,20 +558,23 @@ def add_recent_to_queue(ndays):
         add_ref_to_index_queue(ref[0], ref[1], ref[2])
 
 
-def index_all(skip=0, clear=False):
+def index_all(skip=0, clear=False, bulk=True):
     """
     Fully create the search index from scratch.
+    :param skip: Number of versions (if bulk) or refs to skip
+    :param bulk: Build documents version by version, in parallel, and send them with the bulk API.  If False, send each document on its own.
     """
     start = datetime.now()
     if clear:
         create_index()
-    index_all_sections(skip=skip)
-    index_public_sheets()
+    if bulk:
+        indexer = bulk_index_all_versions(skip=skip)
+        indexer.index_all(public_sheet_index_documents())
+        print indexer.report()
+        for doc_id, error in indexer.failures:
+            print "Failed: %s - %s" % (doc_id, error)
+    else:
+        index_all_sections(skip=skip)
+        index_public_sheets()
     end = datetime.now()
     print "Elapsed time: %s" % str(end-start)
-
-
-
-
-
-
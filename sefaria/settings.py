@@ -252,6 +252,51 @@ CACHES = {
     }
 }
 
+# Bounds on the in-process cache of Ref objects (see RefCachingType in sefaria/model/text.py)
+# Entries are counted per key - each Ref is usually cached under both its original string and its normal form.
+# Override in local_settings.py, e.g. to keep long running crawler processes small.
+REF_CACHE_MAX_SIZE = 100000
+REF_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+# Bulk indexing of the search index (see bulk_index_all_sections in sefaria/search.py)
+SEARCH_BULK_MAX_DOCS = 500  # documents per bulk request
+SEARCH_BULK_MAX_BYTES = 5 * 1024 * 1024  # approximate bytes per bulk request
+SEARCH_INDEX_PROCESSES = 4  # processes that build documents
+
+# Index queue consumer (see index_from_queue in sefaria/search.py)
+SEARCH_QUEUE_BATCH_SIZE = 100  # queue records per bulk batch
+SEARCH_QUEUE_MAX_ATTEMPTS = 5  # failed attempts before a record is moved to the dead letter collection
+SEARCH_QUEUE_RETRY_SECONDS = 60  # delay before the first retry.  Doubles with each attempt.
+
+# Processes used by refresh_all_states (see sefaria/model/version_state.py)
+VSTATE_REFRESH_PROCESSES = 4
+
+# Diffs for history records of large text saves can be computed in a pool of processes (see log_text in sefaria/model/history.py)
+HISTORY_DIFF_PROCESSES = 1  # 1 computes diffs in the saving process
+HISTORY_DIFF_POOL_MIN = 500  # changed segments in one save before the pool is used
+# A full text checkpoint of a segment is stored every HISTORY_CHECKPOINT_INTERVAL revisions of it, for text_at_revision()
+HISTORY_CHECKPOINT_INTERVAL = 50
+
+# Seconds that user names and profile links are cached for (see UserDirectory in sefaria/utils/users.py)
+USER_DIRECTORY_CACHE_SECONDS = 600
+
+# Notifications to the followers of a user are written by a worker in chunks (see fan_out in sefaria/model/notification.py)
+NOTIFICATION_FANOUT_CHUNK_SIZE = 1000  # notifications per bulk insert
+NOTIFICATION_FANOUT_STALE_SECONDS = 300  # time without progress before another worker resumes a fan-out
+
+# Notification digest emails (see email_unread_notifications in sefaria/model/user_profile.py)
+EMAIL_DIGEST_PROCESSES = 4  # processes that render emails.  1 renders in the sending process.
+EMAIL_DIGEST_BATCH_SIZE = 200  # users loaded, rendered and sent together
+
+# Seconds that a user's count of unread notifications is cached for.  Counts are invalidated as notifications change.
+UNREAD_COUNT_CACHE_SECONDS = 60 * 5
+
+# Seconds that the Version records TextChunks are built from are cached for (see TextChunkCache in sefaria/model/text.py)
+TEXT_CHUNK_CACHE_SECONDS = 60 * 60
+
+# Number of top level sections of a Version read in each query by Version.iter_sections() and iter_segments()
+VERSION_STREAM_BATCH_SIZE = 50
+
 # Grab enviornment specific settings from a file which
 # is left out of the repo. 
 from local_settings import *
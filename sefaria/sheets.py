@@ -10,11 +10,11 @@ import dateutil.parser
 
 import sefaria.model as model
 from sefaria.system.database import db
-from sefaria.model.notification import Notification, NotificationSet
+from sefaria.model.notification import Notification, NotificationSet, queue_sheet_publish_fanout, cancel_sheet_publish_fanouts
 from sefaria.model.following import FollowersSet
 from sefaria.model.user_profile import annotate_user_list
 from sefaria.utils.util import strip_tags, string_overlap
-from sefaria.utils.users import user_link
+from sefaria.utils.users import user_link, user_directory
 from history import record_sheet_publication, delete_sheet_publication
 from settings import SEARCH_INDEX_ON_SAVE
 import search
@@ -135,9 +135,10 @@ def save_sheet(sheet, user_id):
 		if sheet["status"] not in LISTED_SHEETS:
 			# UNPUBLISH
 			delete_sheet_publication(sheet["id"], user_id)
+			cancel_sheet_publish_fanouts(user_id, sheet["id"])
 			NotificationSet({"type": "sheet publish", 
-								"content.publisher_id":user_id, 
-								"content.sheet_id":shee["id"]
+								"content.publisher":user_id, 
+								"content.sheet_id":sheet["id"]
 							}).delete()
 
 	db.sheets.update({"id": sheet["id"]}, sheet, True, False)
@@ -291,8 +292,9 @@ def get_sheets_for_ref(tref, pad=True, context=1):
 	ref_re = oref.regex()
 
 	results = []
-	sheets = db.sheets.find({"included_refs": {"$regex": ref_re}, "status": {"$in": LISTED_SHEETS}},
-								{"id": 1, "title": 1, "owner": 1, "included_refs": 1})
+	sheets = list(db.sheets.find({"included_refs": {"$regex": ref_re}, "status": {"$in": LISTED_SHEETS}},
+								{"id": 1, "title": 1, "owner": 1, "included_refs": 1}))
+	owners = user_directory.get_many([sheet["owner"] for sheet in sheets])
 	for sheet in sheets:
 		# Check for multiple matching refs within this sheet
 		matched_orefs = [model.Ref(r) for r in sheet["included_refs"] if regex.match(ref_re, r)]
@@ -305,7 +307,7 @@ def get_sheets_for_ref(tref, pad=True, context=1):
 			com["anchorRef"]   = match.normal()
 			com["anchorVerse"] = match.sections[-1]
 			com["public"]      = True
-			com["commentator"] = user_link(sheet["owner"])
+			com["commentator"] = owners[sheet["owner"]]["link"] if sheet["owner"] in owners else user_link(sheet["owner"])
 			com["text"]        = "<a class='sheetLink' href='/sheets/%d'>%s</a>" % (sheet["id"], strip_tags(sheet["title"]))
 
 			results.append(com)
@@ -409,11 +411,8 @@ def likers_list_for_sheet(sheet_id):
 
 def broadcast_sheet_publication(publisher_id, sheet_id):
 	"""
-	Notify everyone who follows publisher_id about sheet_id's publication
+	Notify everyone who follows publisher_id about sheet_id's publication.
+	Notifications are written by the notification fan-out worker (see data/scripts/notification_fanout_worker.py).
 	"""
-	followers = FollowersSet(publisher_id)
-	for follower in followers.uids:
-		n = Notification({"uid": follower})
-		n.make_sheet_publish(publisher_id=publisher_id, sheet_id=sheet_id)
-		n.save()
+	queue_sheet_publish_fanout(publisher_id, sheet_id)
 
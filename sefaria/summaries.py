@@ -255,10 +255,11 @@ def make_simple_index_dict(index):
     return indx_dict
 
 
-def update_summaries_on_change(bookname, old_ref=None, recount=True):
+def update_summaries_on_change(bookname, old_ref=None, recount=True, changed_ref=None):
     """
     Update text summary docs to account for change or insertion of 'text'
     * recount - whether or not to perform a new count of available text
+    * changed_ref - Ref of the text that changed.  If given, only its section is recounted.
     """
     index = get_index(bookname)
 
@@ -266,7 +267,10 @@ def update_summaries_on_change(bookname, old_ref=None, recount=True):
 
     if recount:
         #counts.update_full_text_count(bookname)
-        VersionState(bookname).refresh()
+        if changed_ref:
+            VersionState(bookname).refresh_section(changed_ref)
+        else:
+            VersionState(bookname).refresh()
     toc = get_toc()
     resort_other = False
 
@@ -0,0 +1,220 @@
+"""
+bulk_index.py - send documents to ElasticSearch with the bulk API
+
+BulkIndexer groups documents into _bulk requests, bounded by number of documents and by size,
+and keeps count of throughput and failures.
+LocalSearchServer is a minimal stand-in for an ElasticSearch node that accepts _bulk requests, for tests and local development.
+"""
+import json
+import time
+import urllib2
+import threading
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class BulkIndexer(object):
+    """
+    Buffers documents, and sends them to the _bulk endpoint of an index when the buffer is full.
+
+    >>> indexer = BulkIndexer("http://localhost:9200", "sefaria")
+    >>> indexer.index_all(docs)  # docs is any iterable of (doc_type, doc_id, doc)
+    >>> print indexer.report()
+    """
+    def __init__(self, host, index_name, max_docs=500, max_bytes=5 * 1024 * 1024, timeout=120, max_failures_kept=100):
+        """
+        :param host: Base url of the ElasticSearch server
+        :param index_name: Name of the index that documents are sent to
+        :param max_docs: Maximum number of documents in one request
+        :param max_bytes: Approximate maximum size of one request.  A single larger document is sent on its own.
+        :param timeout: Seconds to wait for each request
+        :param max_failures_kept: Number of failures to keep details of, in self.failures.  None keeps all of them.
+        """
+        self.url = "{}/{}/_bulk".format(host.rstrip("/"), index_name)
+        self.max_docs = max_docs
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.max_failures_kept = max_failures_kept
+
+        self._lines = []
+        self._ids = []
+        self._bytes = 0
+
+        self.docs = 0        # documents sent
+        self.failed = 0      # documents that were not indexed
+        self.requests = 0
+        self.bytes = 0
+        self.failures = []   # (doc_id, error) of the first max_failures_kept failures
+        self.started = None
+
+    def add(self, doc_type, doc_id, doc):
+        """
+        Add a document to the buffer, sending the buffer first if the document would overfill it.
+        """
+        if self.started is None:
+            self.started = time.time()
+        action = json.dumps({"index": {"_type": doc_type, "_id": doc_id}})
+        source = json.dumps(doc)
+        size = len(action) + len(source) + 2
+        if self._ids and (len(self._ids) >= self.max_docs or self._bytes + size > self.max_bytes):
+            self.flush()
+        self._lines += [action, source]
+        self._ids.append(doc_id)
+        self._bytes += size
+
+    def index_all(self, docs):
+        """
+        :param docs: iterable of (doc_type, doc_id, doc).  Consumed lazily, so it may be a generator.
+        :return dict: stats()
+        """
+        for doc_type, doc_id, doc in docs:
+            self.add(doc_type, doc_id, doc)
+        self.flush()
+        return self.stats()
+
+    def flush(self):
+        """
+        Send the buffered documents in one _bulk request.
+        """
+        if not self._ids:
+            return
+        body = "\n".join(self._lines) + "\n"
+        ids = self._ids
+        self._lines, self._ids, self._bytes = [], [], 0
+
+        self.requests += 1
+        self.bytes += len(body)
+        self.docs += len(ids)
+        try:
+            response = self._post(body)
+        except (urllib2.URLError, IOError, ValueError), e:
+            logger.error(u"Bulk request of {} documents to {} failed: {}".format(len(ids), self.url, e))
+            for doc_id in ids:
+                self.add_failure(doc_id, str(e))
+            return
+
+        if not response.get("errors", True):
+            return
+        for doc_id, item in zip(ids, response.get("items", [])):
+            result = item.values()[0] if item else {}
+            if result.get("error") or result.get("status", 500) >= 300:
+                self.add_failure(doc_id, result.get("error", "status {}".format(result.get("status"))))
+
+    def _post(self, body):
+        request = urllib2.Request(self.url, body, {"Content-Type": "application/x-ndjson"})
+        return json.loads(urllib2.urlopen(request, timeout=self.timeout).read())
+
+    def add_failure(self, doc_id, error):
+        """
+        Record a document that failed.  Also used by callers for documents that could not be built, so that they are reported with the others.
+        """
+        self.failed += 1
+        if self.max_failures_kept is None or len(self.failures) < self.max_failures_kept:
+            self.failures.append((doc_id, error))
+
+    def stats(self):
+        seconds = time.time() - self.started if self.started else 0
+        return {
+            "docs": self.docs,
+            "failed": self.failed,
+            "requests": self.requests,
+            "bytes": self.bytes,
+            "seconds": seconds,
+            "docs_per_second": self.docs / seconds if seconds else 0
+        }
+
+    def report(self):
+        s = self.stats()
+        return "Indexed {docs} documents in {requests} requests, {seconds:.1f} seconds ({docs_per_second:.1f} docs/sec). {failed} failed.".format(**s)
+
+
+class LocalSearchServer(object):
+    """
+    A stand-in for an ElasticSearch server, that runs in a thread of the current process.
+    Accepts _bulk requests with index actions, and keeps the documents in self.docs, keyed by (index, type, id).
+
+    >>> with LocalSearchServer() as server:
+    ...     BulkIndexer(server.url, "test").index_all(docs)
+    ...     server.docs
+    """
+    def __init__(self, port=0, fail_ids=None):
+        """
+        :param port: 0 picks a free port
+        :param fail_ids: Document ids that the server will report as failing to index
+        """
+        self.port = port
+        self.fail_ids = set(fail_ids or [])
+        self.docs = {}
+        self.requests = 0
+        self._httpd = None
+        self._thread = None
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:{}".format(self.port)
+
+    def start(self):
+        self._httpd = HTTPServer(("127.0.0.1", self.port), _LocalSearchHandler)
+        self._httpd.stand_in = self
+        self.port = self._httpd.server_address[1]
+        self._thread = threading.Thread(target=self._httpd.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def bulk(self, index_name, body):
+        """
+        :return dict: A response in the form of the ElasticSearch _bulk response
+        """
+        self.requests += 1
+        lines = [l for l in body.split("\n") if l.strip()]
+        items = []
+        for action_line, source_line in zip(lines[0::2], lines[1::2]):
+            action = json.loads(action_line)["index"]
+            index_name = action.get("_index", index_name)
+            result = {"_index": index_name, "_type": action["_type"], "_id": action["_id"]}
+            if action["_id"] in self.fail_ids:
+                result.update({"status": 400, "error": "MapperParsingException[failed to parse]"})
+            else:
+                self.docs[(index_name, action["_type"], action["_id"])] = json.loads(source_line)
+                result["status"] = 201
+            items.append({"index": result})
+        return {"took": 1, "errors": any(i["index"]["status"] >= 300 for i in items), "items": items}
+
+
+class _LocalSearchHandler(BaseHTTPRequestHandler):
+
+    def do_POST(self):
+        parts = [p for p in self.path.split("?")[0].split("/") if p]
+        if not parts or parts[-1] != "_bulk" or len(parts) > 2:
+            return self._respond(404, {"error": "No handler for {}".format(self.path)})
+        body = self.rfile.read(int(self.headers.getheader("content-length", 0)))
+        try:
+            response = self.server.stand_in.bulk(parts[0] if len(parts) == 2 else None, body)
+        except (ValueError, KeyError), e:
+            return self._respond(400, {"error": "Failed to parse bulk request: {}".format(e)})
+        self._respond(200, response)
+
+    def _respond(self, status, content):
+        body = json.dumps(content)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
@@ -1,5 +1,7 @@
 
 import hashlib
+import sys
+from collections import OrderedDict
 
 from django.core.cache import cache
 
@@ -29,10 +31,8 @@ def reset_texts_cache():
         'toc_cache',
         'toc_json_cache',
         'texts_titles_json',
-        'all_titles_regex_en',
-        'all_titles_regex_he',
-        'all_titles_regex_en_commentary',
-        'all_titles_regex_he_commentary',
+        'all_titles_automaton_en',
+        'all_titles_automaton_he',
         'full_title_list_en',
         'full_title_list_he',
         'full_title_list_en_commentary',
@@ -79,3 +79,94 @@ def get_template_cache(fragment_name='', *args):
 def delete_template_cache(fragment_name='', *args):
     delete_cache_elem('template.cache.%s.%s' % (fragment_name, hashlib.md5(u':'.join([arg for arg in args])).hexdigest()))
 
+
+
+class LRUCache(object):
+    """
+    An in-process, least recently used cache.
+    Bounded by number of entries and, optionally, by an approximate size in bytes.
+    Keeps hit, miss and eviction counters, available through stats().
+    """
+    def __init__(self, max_size=None, max_bytes=None, sizeof=None):
+        """
+        :param max_size: Maximum number of entries.  None or 0 for no limit.
+        :param max_bytes: Maximum approximate size of all entries, in bytes.  None or 0 for no limit.
+        :param sizeof: function(key, value) returning the approximate size of an entry.  Defaults to sys.getsizeof of the key and value.
+        """
+        self.max_size = max_size
+        self.max_bytes = max_bytes
+        self._sizeof = sizeof or (lambda k, v: sys.getsizeof(k) + sys.getsizeof(v))
+        self._data = OrderedDict()
+        self._sizes = {}
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        try:
+            value = self._data.pop(key)
+        except KeyError:
+            self.misses += 1
+            return default
+        self._data[key] = value  # Reinsert as most recently used
+        self.hits += 1
+        return value
+
+    def set(self, key, value):
+        if key in self._data:
+            self._remove(key)
+        size = self._sizeof(key, value)
+        self._data[key] = value
+        self._sizes[key] = size
+        self.bytes += size
+        self._evict()
+
+    def delete(self, key):
+        if key in self._data:
+            self._remove(key)
+
+    def clear(self):
+        self._data = OrderedDict()
+        self._sizes = {}
+        self.bytes = 0
+
+    def resize(self, max_size=None, max_bytes=None):
+        self.max_size = max_size
+        self.max_bytes = max_bytes
+        self._evict()
+
+    def items(self):
+        return self._data.items()
+
+    def iteritems(self):
+        return self._data.iteritems()
+
+    def stats(self):
+        return {
+            "size": len(self._data),
+            "bytes": self.bytes,
+            "max_size": self.max_size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions
+        }
+
+    def _remove(self, key):
+        del self._data[key]
+        self.bytes -= self._sizes.pop(key)
+
+    def _evict(self):
+        while self._data and (
+                (self.max_size and len(self._data) > self.max_size)
+                or (self.max_bytes and self.bytes > self.max_bytes)):
+            key = next(iter(self._data))  # Least recently used
+            self._remove(key)
+            self.evictions += 1
@@ -4,7 +4,7 @@ Djagno Context Processors, for decorating all HTTP request with common data.
 from datetime import datetime
 
 from sefaria.settings import *
-from sefaria.model import library, NotificationSet
+from sefaria.model import library
 from sefaria.model.user_profile import unread_notifications_count_for_user
 from sefaria.summaries import get_toc, get_toc_json
 from sefaria.utils import calendars
@@ -59,9 +59,9 @@ def language_settings(request):
 def notifications(request):
     if not request.user.is_authenticated():
         return {}
-    notifications = NotificationSet().recent_for_user(request.user.id)
+    # Recent notifications are loaded through /api/notifications when the notifications menu is opened
     unread_count  = unread_notifications_count_for_user(request.user.id)
-    return {"notifications": notifications, "notifications_count": unread_count }
+    return {"notifications_count": unread_count }
 
 
 def calendar_links(request):
@@ -21,6 +21,14 @@ else:
         db.authenticate(SEFARIA_DB_USER, SEFARIA_DB_PASSWORD)
 
 
+def reconnect():
+    """
+    Drop the sockets of this connection, so that it reconnects on next use.
+    Used in processes forked from a process that has already used the connection.
+    """
+    connection.disconnect()
+
+
 def drop_test():
     global connection
     connection.drop_database(TEST_DB)
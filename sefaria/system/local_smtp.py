@@ -0,0 +1,69 @@
+"""
+local_smtp.py - a minimal SMTP server that keeps the messages it receives, for tests and local development
+
+>>> with LocalSMTPServer() as server:
+...     send_mail("Subject", "Body", "from@example.com", ["to@example.com"],
+...               connection=get_connection(host=server.host, port=server.port))
+...     server.messages
+"""
+import time
+import email
+import smtpd
+import asyncore
+import threading
+
+
+class LocalSMTPServer(object):
+    """
+    Runs an SMTP server in a thread of the current process.
+    Each message received is kept in self.messages, as {"from", "to", "message"}, where message is an email.message.Message.
+    self.connections counts the SMTP connections that were opened.
+    """
+    def __init__(self, port=0):
+        """
+        :param port: 0 picks a free port
+        """
+        self.host = "127.0.0.1"
+        self.port = port
+        self.messages = []
+        self.connections = 0
+        self._server = None
+        self._thread = None
+        self._running = False
+
+    def start(self):
+        self._server = _SMTPServer((self.host, self.port), None)
+        self._server.stand_in = self
+        self.port = self._server.socket.getsockname()[1]
+        self._running = True
+        self._thread = threading.Thread(target=self._loop)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def _loop(self):
+        while self._running:
+            asyncore.loop(timeout=0.05, count=1)
+
+    def stop(self):
+        # Give channels a moment to finish messages that were sent
+        time.sleep(0.1)
+        self._running = False
+        self._thread.join()
+        self._server.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+class _SMTPServer(smtpd.SMTPServer):
+
+    def handle_accept(self):
+        self.stand_in.connections += 1
+        smtpd.SMTPServer.handle_accept(self)
+
+    def process_message(self, peer, mailfrom, rcpttos, data):
+        self.stand_in.messages.append({"from": mailfrom, "to": rcpttos, "message": email.message_from_string(data)})
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from sefaria.system.bulk_index import BulkIndexer, LocalSearchServer
+
+
+def make_docs(n):
+    return (("text", u"Genesis 1:{} (Test [en])".format(i), {"ref": u"Genesis 1:{}".format(i), "content": u"בראשית " * i}) for i in range(1, n + 1))
+
+
+def test_bulk_index():
+    with LocalSearchServer() as server:
+        indexer = BulkIndexer(server.url, "test", max_docs=10)
+        stats = indexer.index_all(make_docs(25))
+        assert stats["docs"] == 25
+        assert stats["failed"] == 0
+        assert stats["requests"] == server.requests == 3
+        assert len(server.docs) == 25
+        assert server.docs[("test", "text", u"Genesis 1:3 (Test [en])")]["content"] == u"בראשית " * 3
+
+
+def test_max_bytes():
+    with LocalSearchServer() as server:
+        indexer = BulkIndexer(server.url, "test", max_docs=100, max_bytes=1000)
+        indexer.index_all(make_docs(20))
+        assert server.requests > 1
+        assert len(server.docs) == 20
+
+
+def test_failures():
+    with LocalSearchServer(fail_ids=[u"Genesis 1:2 (Test [en])"]) as server:
+        indexer = BulkIndexer(server.url, "test")
+        stats = indexer.index_all(make_docs(5))
+        assert stats["failed"] == 1
+        assert indexer.failures[0][0] == u"Genesis 1:2 (Test [en])"
+        assert len(server.docs) == 4
+
+
+def test_server_down():
+    server = LocalSearchServer().start()
+    url = server.url
+    server.stop()
+    indexer = BulkIndexer(url, "test", timeout=5)
+    stats = indexer.index_all(make_docs(3))
+    assert stats["failed"] == 3
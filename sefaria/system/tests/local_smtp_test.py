@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+import smtplib
+
+from sefaria.system.local_smtp import LocalSMTPServer
+
+
+def test_receive():
+    with LocalSMTPServer() as server:
+        smtp = smtplib.SMTP(server.host, server.port)
+        smtp.sendmail("from@example.com", ["a@example.com"], "Subject: One\n\nFirst")
+        smtp.sendmail("from@example.com", ["b@example.com", "c@example.com"], "Subject: Two\n\nSecond")
+        smtp.quit()
+    assert server.connections == 1
+    assert [m["to"] for m in server.messages] == [["a@example.com"], ["b@example.com", "c@example.com"]]
+    assert server.messages[1]["message"]["Subject"] == "Two"
+    assert server.messages[1]["message"].get_payload() == "Second"
+
+
+def test_separate_connections():
+    with LocalSMTPServer() as server:
+        for i in range(3):
+            smtp = smtplib.SMTP(server.host, server.port)
+            smtp.sendmail("from@example.com", ["a@example.com"], "Subject: {}\n\nBody".format(i))
+            smtp.quit()
+    assert server.connections == 3
+    assert len(server.messages) == 3
@@ -47,4 +47,38 @@ class Test_collapse_activity():
 
 	def test_no_collapse(self):
 		collapsed = history.collapse_activity([activity_a, activity_d])
-		assert len(collapsed) == 2
\ No newline at end of file
+		assert len(collapsed) == 2
+
+	def test_stored_section_ref(self):
+		# Items that store their section are collapsed without parsing their refs
+		item = {"rev_type": "edit text", "user": 1, "version": "Test Version", "language": "he", "section_ref": "Unparsable 1", "section_url": "Unparsable.1"}
+		stored = [dict(item, ref="Unparsable 1:2", url="Unparsable.1.2"), dict(item, ref="Unparsable 1:1", url="Unparsable.1.1")]
+		collapsed = history.collapse_activity(stored)
+		assert len(collapsed) == 1
+		assert collapsed[0]["updates_count"] == 2
+		assert collapsed[0]["history_url"] == "/activity/Unparsable.1/he/Test_Version"
+
+	def test_streaming(self):
+		collapsed = history._collapse_streaks(iter([dict(activity_a), dict(activity_b), dict(activity_d), dict(activity_c)]))
+		assert [a["ref"] for a in collapsed] == ["Job 2:2", "Job 3:2", "Job 2:4"]
+
+	def test_oldest(self):
+		from datetime import datetime
+		collapsed = history.collapse_activity([dict(activity_a, date=datetime(2014, 1, 2), _id=2), dict(activity_b, date=datetime(2014, 1, 1), _id=1)])
+		assert collapsed[0]["oldest"] == (datetime(2014, 1, 1), 1)
+
+
+def test_activity_cursor():
+	from datetime import datetime
+	from bson.objectid import ObjectId
+	before = (datetime(2014, 3, 5, 12, 30, 1, 5000), ObjectId("5316f1a5e3b7a1c2d4e5f607"))
+	assert history.parse_activity_cursor(history.activity_cursor(before)) == before
+	assert history.parse_activity_cursor("2014-03-05") is None
+	assert history.parse_activity_cursor("2014-03-05T12:30:01.005000_notanid") is None
+	assert history.parse_activity_cursor(None) is None
+
+
+def test_history_ref_fields():
+	from sefaria.model import Ref
+	from sefaria.model.history import history_ref_fields
+	assert history_ref_fields(Ref("Job 2:3")) == {"section_ref": "Job 2", "url": "Job.2.3", "section_url": "Job.2"}
@@ -22,4 +22,75 @@ class Test_links_from_get_text():
         t1 = TextFamily(Ref("Exodus ")).contents()
         t2 = TextFamily(Ref("Exodus 1")).contents()
 
-        assert len(t1["commentary"]) == len(t2["commentary"])
\ No newline at end of file
+        assert len(t1["commentary"]) == len(t2["commentary"])
+
+class Test_link_addresses():
+
+    def test_ref_address(self):
+        from sefaria.model.link import ref_address
+        assert ref_address(Ref("Exodus 2:3")) == {"book": "Exodus", "path": u"2", "start": 3, "end": 3}
+        assert ref_address(Ref("Exodus 2:3-5")) == {"book": "Exodus", "path": u"2", "start": 3, "end": 5}
+        assert ref_address(Ref("Exodus 2:3-4:5"))["end"] is None
+        assert ref_address(Ref("Exodus 2")) == {"book": "Exodus", "path": u"", "start": 2, "end": 2}
+        assert ref_address(Ref("Rashi on Exodus 2:3:1")) == {"book": "Rashi on Exodus", "path": u"2:3", "start": 1, "end": 1}
+
+    def test_address_in_ref(self):
+        from sefaria.model.link import ref_address, address_in_ref
+        assert address_in_ref(ref_address(Ref("Exodus 2:3")), Ref("Exodus 2"))
+        assert address_in_ref(ref_address(Ref("Exodus 2:3")), Ref("Exodus 2:1-4"))
+        assert address_in_ref(ref_address(Ref("Exodus 2:3")), Ref("Exodus"))
+        assert address_in_ref(ref_address(Ref("Exodus 2:3-4")), Ref("Exodus 2:3-5"))
+        assert not address_in_ref(ref_address(Ref("Exodus 2:3-4")), Ref("Exodus 2:3"))
+        assert not address_in_ref(ref_address(Ref("Exodus 2:3")), Ref("Exodus 3"))
+        assert not address_in_ref(ref_address(Ref("Exodus 2")), Ref("Exodus 2:3"))
+        assert address_in_ref(ref_address(Ref("Rashi on Exodus 2:3:1")), Ref("Rashi on Exodus 2"))
+
+    def test_linkset_matches_regex(self):
+        for tref in ["Exodus 2", "Exodus 2:3-4", "Shabbat 13b", "Rashi on Genesis 2"]:
+            oref = Ref(tref)
+            by_address = {l._id for l in LinkSet(oref)}
+            by_regex = {l._id for l in LinkSet({"refs": {"$regex": oref.regex()}})}
+            assert by_regex <= by_address
+
+    def test_links_without_addresses(self):
+        from sefaria.model.link import ref_address_query, link_addresses
+        query = ref_address_query(Ref("Exodus 2"))
+        assert {"refAddresses.book": None, "refs": {"$regex": Ref("Exodus 2").regex()}} in query["$or"]
+        l = Link({"refs": ["Exodus 2:3", "Rashi on Exodus 2:3:1"], "type": "commentary"})
+        assert [a["book"] for a in link_addresses(l)] == ["Exodus", "Rashi on Exodus"]
+
+    def test_batch_links(self):
+        from sefaria.client.wrapper import get_links_for_refs
+        batch = get_links_for_refs(["Exodus 2:3", "Exodus 2:4"], with_text=False)
+        assert [len(get_links("Exodus 2:3", False)), len(get_links("Exodus 2:4", False))] == [len(b) for b in batch]
+
+
+class Test_link_counts():
+
+    def test_link_counts_match_links(self):
+        from sefaria.model.link import get_link_counts
+        counts = get_link_counts("Torah", "Prophets")
+        assert len(counts)
+        for c in counts[:5]:
+            books = [c["book1"].replace("-", " "), c["book2"].replace("-", " ")]
+            assert c["count"] == LinkSet({"$and": [{"refAddresses.book": books[0]}, {"refAddresses.book": books[1]}]}).count()
+
+    def test_link_counts_follow_links(self):
+        from sefaria.model.link import get_link_counts
+        def count():
+            return {c["book2"]: c["count"] for c in get_link_counts("Torah", "Prophets") if c["book1"] == "Exodus"}.get("Joshua", 0)
+        before = count()
+        l = Link({"refs": ["Exodus 1:1", "Joshua 24:32"], "type": "test"}).save()
+        assert count() == before + 1
+        l.refs = ["Exodus 1:2", "Judges 1:1"]
+        l.save()
+        assert count() == before
+        l.delete()
+        assert count() == before
+
+    def test_books_of_bad_refs(self):
+        from sefaria.model.link import _books_of_refs
+        assert _books_of_refs(["Exodus 1:1", "Joshua 24:32"]) == ["Exodus", "Joshua"]
+        assert _books_of_refs(False) is None
+        assert _books_of_refs(["Exodus 1:1", None]) is None
+        assert _books_of_refs(["Exodus 1:1", "Not A Book 1:1"]) is None
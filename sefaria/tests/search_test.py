@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from sefaria.model import *
+import sefaria.search as search
+
+
+class Test_version_index_documents():
+
+    def test_same_as_section_documents(self):
+        for title, tref in [("Genesis", "Genesis 3"), ("Shabbat", "Shabbat 7b")]:
+            version = Version().load({"title": title, "language": "en"})
+            by_version = {doc_id: doc for doc_type, doc_id, doc in search.version_index_documents(version)
+                          if doc["ref"] == tref or doc["ref"].startswith(tref + ":")}
+            by_section = {doc_id: doc for doc_type, doc_id, doc in search.text_index_documents(tref, version.versionTitle, "en")}
+            assert len(by_section)
+            assert by_version == by_section
+
+    def test_bulk_index_version(self):
+        from sefaria.system.bulk_index import LocalSearchServer
+        with LocalSearchServer() as server:
+            version = Version().load({"title": "Ruth", "language": "he"})
+            indexer = search.make_bulk_indexer(server.url, "test")
+            indexer.index_all(search.version_index_documents(version))
+            assert indexer.failed == 0
+            assert len(server.docs) == indexer.docs > 0
@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+from sefaria.utils.users import user_directory, user_link, user_name, user_details
+
+
+def test_unknown_users():
+	uid = 987654321
+	user_directory.invalidate(uid)
+	users = user_directory.get_many([uid, str(uid), None])
+	assert users.keys() == [uid]
+	assert not users[uid]["exists"]
+	assert user_name(uid) == "User 987654321"
+	assert user_link(uid) == "<a href='#' class='userLink'>User 987654321</a>"
+	assert user_details([uid]) == {}
+
+
+def test_invalidate():
+	from django.core.cache import cache
+	uid = 987654322
+	user_directory.get(uid)
+	assert cache.get(user_directory._key(uid, user_directory._generation())) is not None
+	user_directory.invalidate(uid)
+	assert cache.get(user_directory._key(uid, user_directory._generation())) is None
@@ -2,40 +2,142 @@
 users.py - dealing with Sefaria users and user settings
 
 Writes to MongoDB Collection: profiles
+Caches user names and links in the Django cache
 """
 
+import hashlib
+import urllib
+
 from django.contrib.auth.models import User
+from django.core.cache import cache
+
 from sefaria.system.database import db
+from sefaria.settings import USER_DIRECTORY_CACHE_SECONDS
 
-def user_name(uid):
-	"""Returns a string of a user's full name"""
+class UserDirectory(object):
+	"""
+	Names and profile links of users, looked up many at a time - with one query of the user DB and one of profiles
+	for all users that aren't cached - and cached for USER_DIRECTORY_CACHE_SECONDS through the Django cache,
+	so that the cache is shared by all processes.
+	UserProfile.save() invalidates the entry of its user.
+
+	>>> user_directory.get_many([1, 2])[1]["link"]
+	"""
+	def __init__(self, timeout=USER_DIRECTORY_CACHE_SECONDS, prefix="user_directory"):
+		self.timeout = timeout
+		self.prefix  = prefix
+
+	def get(self, uid):
+		"""
+		Returns the entry of user 'uid' (see _entry), with placeholder values for unknown users.
+		"""
+		entry = self.get_many([uid]).get(_int_uid(uid))
+		return entry or _entry(uid, None, None)
+
+	def get_many(self, uids):
+		"""
+		Returns a dict of uid: entry for each uid in 'uids' that is an integer.
+		"""
+		uids = set(_int_uid(uid) for uid in uids) - set([None])
+		if not uids:
+			return {}
+		generation = self._generation()
+		keys       = {uid: self._key(uid, generation) for uid in uids}
+		cached     = cache.get_many(keys.values())
+		entries    = {uid: cached[keys[uid]] for uid in uids if keys[uid] in cached}
+
+		missing = uids - set(entries)
+		if missing:
+			loaded = self._load(missing)
+			cache.set_many({keys[uid]: entry for uid, entry in loaded.items()}, self.timeout)
+			entries.update(loaded)
+		return entries
+
+	def invalidate(self, uid):
+		cache.delete(self._key(_int_uid(uid), self._generation()))
+
+	def clear(self):
+		"""
+		Invalidates all entries, by moving to a new generation of keys.
+		"""
+		cache.set(self.prefix + ".generation", self._generation() + 1, 60 * 60 * 24 * 30)
+
+	def _generation(self):
+		return cache.get(self.prefix + ".generation") or 0
+
+	def _key(self, uid, generation):
+		return "%s.%d.%d" % (self.prefix, generation, uid)
+
+	def _load(self, uids):
+		users = {user.id: user for user in User.objects.filter(id__in=list(uids)).only("id", "first_name", "last_name", "email")}
+		slugs = {p["id"]: p.get("slug") for p in db.profiles.find({"id": {"$in": list(uids)}}, {"id": 1, "slug": 1})}
+		return {uid: _entry(uid, users.get(uid), slugs.get(uid)) for uid in uids}
+
+
+def _int_uid(uid):
 	try:
-		uid  = int(uid)
-		user = User.objects.get(id=uid)
-		name = user.first_name + " " + user.last_name
+		return int(uid)
+	except (TypeError, ValueError):
+		return None
+
+
+def _entry(uid, user, slug):
+	"""
+	Returns a dict describing a user:
+	"exists", whether the user is in the user DB, "first_name", "last_name",
+	"name", a full name for display, "url" of the profile, "link", an <a> tag linking to the profile,
+	and "imageUrl", a small gravatar.
+	"""
+	if user:
+		first_name, last_name, email = user.first_name, user.last_name, user.email
+		name = first_name + " " + last_name
 		name = "Anonymous" if name == " " else name
-	except:
+	else:
 		# Don't choke on unknown users, just leave a placeholder
 		# (so that testing on history can happen without needing the user DB)
+		first_name, last_name, email = "User", str(uid), "test@sefaria.org"
 		name = "User {}".format(uid)
-	return name
+	url = "/profile/" + slug if slug else "#"
+
+	return {
+		"exists":     user is not None,
+		"first_name": first_name,
+		"last_name":  last_name,
+		"name":       name,
+		"url":        url,
+		"link":       "<a href='" + url + "' class='userLink'>" + name + "</a>",
+		"imageUrl":   gravatar_url(email, 80),
+	}
+
+
+def gravatar_url(email, size):
+	default_image = "http://www.sefaria.org/static/img/profile-default.png"
+	gravatar_base = "http://www.gravatar.com/avatar/" + hashlib.md5(email.lower()).hexdigest() + "?"
+	return gravatar_base + urllib.urlencode({'d': default_image, 's': str(size)})
+
+
+user_directory = UserDirectory()
+
+
+def user_name(uid):
+	"""Returns a string of a user's full name"""
+	return user_directory.get(uid)["name"]
 
 
-# Simple Cache for user links
-user_links = {}
 def user_link(uid):
 	"""Returns a string with an <a> tag linking to a users profile"""
-	if uid in user_links:
-		return user_links[uid]
-	
-	name    = user_name(uid)
-	profile = db.profiles.find_one({"id": uid})
-	slug    = profile.get("slug", None) if profile else None
-	url     = "/profile/" + slug if slug else "#"
-
-	link = "<a href='" + url + "' class='userLink'>" + name + "</a>"
-	user_links[uid] = link
-	return link
+	return user_directory.get(uid)["link"]
+
+
+def user_details(uids):
+	"""
+	Returns a dict of uid: {"name", "link"} for the users in uids that exist.
+	"name" is the user's first and last name, "link" is as returned by user_link().
+	"""
+	return {
+		uid: {"name": e["first_name"] + " " + e["last_name"], "link": e["link"]}
+		for uid, e in user_directory.get_many(uids).items() if e["exists"]
+	}
 
 
 def is_user_staff(uid):
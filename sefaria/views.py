@@ -26,7 +26,7 @@ from sefaria.model.user_profile import UserProfile
 import sefaria.system.cache as scache
 
 # noinspection PyUnresolvedReferences
-from sefaria.utils.users import user_links
+from sefaria.utils.users import user_directory
 
 
 def register(request):
@@ -155,8 +155,8 @@ def subscribe(request, email):
 @staff_member_required
 def reset_cache(request):
     scache.reset_texts_cache()
-    global user_links
-    user_links = {}
+    user_directory.clear()
+    model.text_chunk_cache.clear()
     return HttpResponseRedirect("/?m=Cache-Reset")
 
 """@staff_member_required
@@ -172,7 +172,7 @@ def del_cached_elem(request, title):
 
 @staff_member_required
 def reset_counts(request):
-    model.refresh_all_states()
+    model.refresh_all_states(processes=1)
     return HttpResponseRedirect("/?m=Counts-Rebuilt")
 
 
@@ -184,7 +184,7 @@ def rebuild_toc(request):
 
 @staff_member_required
 def rebuild_counts_and_toc(request):
-    model.refresh_all_states()
+    model.refresh_all_states(processes=1)
     return HttpResponseRedirect("/?m=Counts-&-TOC-Rebuilt")
 
 
@@ -211,7 +211,8 @@ def rebuild_citation_links(request, title):
 @staff_member_required
 def cache_stats(request):
     resp = {
-        'ref_cache_size': model.Ref.cache_size()
+        'ref_cache_size': model.Ref.cache_size(),
+        'ref_cache_stats': model.Ref.cache_stats()
     }
     return jsonResponse(resp)
 
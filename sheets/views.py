@@ -13,26 +13,40 @@ from django.contrib.auth.models import User, Group
 # noinspection PyUnresolvedReferences
 from sefaria.client.util import jsonResponse, HttpResponse
 from sefaria.sheets import *
-from sefaria.utils.users import user_link
+from sefaria.utils.users import user_link, user_directory
 
 # sefaria.model.dependencies makes sure that model listeners are loaded.
 # noinspection PyUnresolvedReferences
 import sefaria.model.dependencies
 
 
-def annotate_user_links(sources):
+def annotate_user_links(sources, users=None):
 	"""
 	Search a sheet for any addedBy fields (containg a UID) and add corresponding user links.
 	"""
+	if users is None:
+		users = user_directory.get_many(_added_by(sources))
 	for source in sources:
 		if "addedBy" in source:
-			source["userLink"] = user_link(source["addedBy"])
+			user = users.get(source["addedBy"])
+			source["userLink"] = user["link"] if user else user_link(source["addedBy"])
 		if "subsources" in source:
-			source["subsources"] = annotate_user_links(source["subsources"])
+			source["subsources"] = annotate_user_links(source["subsources"], users)
 
 	return sources
 
 
+def _added_by(sources):
+	"""Returns the set of uids in the addedBy fields of sources and their subsources"""
+	uids = set()
+	for source in sources:
+		if "addedBy" in source:
+			uids.add(source["addedBy"])
+		if "subsources" in source:
+			uids |= _added_by(source["subsources"])
+	return uids
+
+
 @ensure_csrf_cookie
 def new_sheet(request):
 	"""
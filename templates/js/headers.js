@@ -445,9 +445,11 @@
 		$("#hebrew, #english, #bilingual").click(sjs.changeContentLang);
 
 
-	    // Notifications - Mark as read
+	    // Notifications - Load the first page when the menu is first opened, then mark as read
 	    $("#notificationsButton").mouseenter(function() {
-	    	if ($("#newNotificationsCount").length) {
+	    	if (sjs.notificationsPage === 0) {
+	    		sjs.loadMoreNotifications();
+	    	} else if ($("#newNotificationsCount").length) {
 				sjs.markNotificationsAsRead();
 	    	}
 	    });
@@ -470,19 +472,26 @@
 	    };
 
 	    // Notifications - Load more through scrolling
-	    sjs.notificationsPage = 1;
+	    sjs.notificationsPage = 0;
+	    sjs.notificationsLoading = false;
 	    $('#notifications').bind('scroll', function() {
         	if($(this).scrollTop() + $(this).innerHeight() >= this.scrollHeight) {
          	   sjs.loadMoreNotifications();
         	}
     	});
     	sjs.loadMoreNotifications = function() {
+    		if (sjs.notificationsLoading) { return; }
+    		sjs.notificationsLoading = true;
     		$.getJSON("/api/notifications?page=" + sjs.notificationsPage, function(data) {
     			if (data.count < data.page_size) {
     				$("#notifications").unbind("scroll");
     			} 
+    			if (data.page === 0 && !data.count) {
+    				$("#notificationsEmpty").show();
+    			}
 				$("#notifications").append(data.html);
 				sjs.notificationsPage = data.page + 1;
+				sjs.notificationsLoading = false;
     			sjs.markNotificationsAsRead();
     		})
     	};